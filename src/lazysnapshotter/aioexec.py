@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Run external commands through asyncio.
+
+Commands are coroutines, so independent commands can be awaited concurrently and are killed when the
+awaiting task is cancelled.
+
+Coroutines exist for opening LUKS devices, mounting and arming drives (mounts.Device.luksOpenAsync(),
+mountAsync() and armAsync()), for the send/receive pipeline (diff.pipeline_async()) and for deleting
+snapshots (snapshotkit2.delete_snapshots_async(), backup.purge_old_snapshots_async()). The synchronous
+functions of the same names are thin wrappers that run them in their own event loop.
+Still synchronous are closing, unmounting and disarming drives, keyctl and the probing of cryptsetup,
+btrfs-send's features, quotas and free space, btrfs-subvolume-sync, and transactions of transact.py.
+The pipeline and the mount(2) system call run in worker threads, cancelling them kills the pipeline's
+processes but cannot interrupt the system call."""
+
+import asyncio
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+DEVNULL = subprocess.DEVNULL
+PIPE = subprocess.PIPE
+STDOUT = subprocess.STDOUT
+
+
+async def run(cmd: list, stdin=None, stdout=None, stderr=None, text: bool = False) -> subprocess.CompletedProcess:
+    """Run cmd and wait for it like subprocess.run(), output redirected to PIPE is returned.
+    If the awaiting task is cancelled, the process is killed and reaped before the cancellation propagates."""
+    proc = await asyncio.create_subprocess_exec(*cmd, stdin=stdin, stdout=stdout, stderr=stderr)
+    try:
+        out, err = await proc.communicate()
+    except asyncio.CancelledError:
+        if proc.returncode is None:
+            logger.critical('Killing subprocess: %s', cmd)
+            proc.kill()
+            await proc.wait()
+        raise
+    if text:
+        out = None if out is None else out.decode(errors='replace')
+        err = None if err is None else err.decode(errors='replace')
+    return subprocess.CompletedProcess(cmd, proc.returncode, out, err)
+
+
+async def gather(*aws) -> list:
+    """Await aws concurrently and return their results in order.
+    If one of them raises an exception, the others are cancelled and awaited before it propagates."""
+    tasks = [asyncio.ensure_future(a) for a in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
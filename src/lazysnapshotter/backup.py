@@ -16,18 +16,25 @@
 # along with this program.  If not, see https://www.gnu.org/licenses.
 
 
+import asyncio
 import logging
 from dataclasses import dataclass
 from datetime import datetime
-from os import stat
+from functools import partial
+from itertools import islice
+from os import stat, statvfs
 from os.path import isdir
 from pathlib import Path
+from uuid import UUID, uuid4
 
 import btrfsutil
 
-from . import bnames, globalstuff, logkit, mounts, sessionkit, snapshotkit2, verify
+from . import bnames, globalstuff, logkit, retention, sessionkit, snapshotkit2, usage, verify
+from .catalog import Catalog
+from .drivesession import DriveSession
 from .transact import Transact
 from .diff import snapshot_diff
+from .progress import MIB, Progress
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +51,24 @@ class Entry:
     # relative path to the backup drive's snapshot directory starting at the drive's root directory
     backup_dir_relative: Path = None
     backup_volume = None  # block device or UUID of the backup partition
+    progress_file: Path = None  # optional file that receives progress reports as JSON
+    # true if the transfer should be skipped if the source did not change since the last backup
+    skip_unchanged: bool = False
+    clone_sources: int = None  # maximum amount of clone sources for btrfs-send, None for no limit
+    send_protocol: int = None  # send stream version, None for btrfs-send's default
+    compressed_data: bool = False  # true if compressed extents should be sent as they are
+    timed_names: bool = False  # true if snapshot names should contain the time of the snapshot
+    # amount of hourly, daily, weekly, monthly and yearly snapshots to keep in addition to the newest ones
+    keep_hourly: int = 0
+    keep_daily: int = 0
+    keep_weekly: int = 0
+    keep_monthly: int = 0
+    keep_yearly: int = 0
+    size_budget: int = None  # maximum size of all snapshots in the backup directory in bytes, None for no limit
+    mount_options: str = None  # comma separated options for mounting the backup drive
+    crypt_flags: tuple = None  # dm-crypt flags for opening the backup drive, see mounts.CRYPT_OPTIONS
+    space_check: bool = True  # true if free space on the backup drive should be checked before sending
+    wait_cleaner: bool = False  # true if the deleted snapshots' space should be reclaimed before the drive is released
 
     def verify(self):
         verify.requireRightAmountOfSnapshots(self.snapshots)
@@ -56,21 +81,48 @@ class Entry:
         if self.keyfile is not None:
             verify.requireAbsolutePath(self.keyfile)
             verify.requireExistingPath(self.keyfile)
+        if self.progress_file is not None:
+            verify.requireAbsolutePath(self.progress_file)
         if not verify.uuid(self.backup_volume):
             verify.requireAbsolutePath(self.backup_volume)
             verify.requireExistingPath(self.backup_volume)
 
+    def policy(self) -> retention.Policy:
+        """Return the retention policy of this entry"""
+        return retention.Policy(last=self.snapshots, hourly=self.keep_hourly, daily=self.keep_daily,
+                                weekly=self.keep_weekly, monthly=self.keep_monthly, yearly=self.keep_yearly)
+
 
 class NoAccess(Exception):
     pass
 
 
-def send_and_receive(source: Path, snapshot_dir: Path, backup_dir: Path):
-    """Backup subvolume source to a new snapshot inside backup_dir.
-    The directory snapshot_dir must be on the source's drive, the directory
-    backup_dir must be on the backup_drive. All specified paths must be accessible.
-    If snapshot_dir and backup_dir have a common snapshot,
-    the new snapshot in backup_dir will be a differential backup."""
+class PurgeError(Exception):
+    pass
+
+
+class NoSpace(Exception):
+    pass
+
+
+def _clone_sources(src_catalog: Catalog, dst_catalog: Catalog, parent: tuple, limit: int = None) -> list:
+    """Return at most limit source snapshots besides parent whose copies on the backup side are proven by their received UUIDs.
+    Snapshots that only match by name may hold other data and are never used as clone sources."""
+    if parent is None or limit == 0:
+        return []
+    commons = snapshotkit2.common_snapshots(src_catalog.dict(), dst_catalog.dict(),
+                                            src_catalog.info, dst_catalog.info, by_name=False)
+    return [c[0] for c in islice((c for c in commons if c[0] != parent[0]), limit)]
+
+
+def send_and_receive(entry: Entry, src_catalog: Catalog, dst_catalog: Catalog, job_id: UUID = None) -> bool:
+    """Backup subvolume entry.source to a new snapshot inside the directory of dst_catalog.
+    The directory of src_catalog must be on the source's drive, the directory
+    of dst_catalog must be on the backup_drive. All specified paths must be accessible.
+    If both directories have a common snapshot, the new snapshot will be a differential backup.
+    job_id names the preliminary snapshots, it defaults to the session ID.
+    Both catalogs are updated with the new snapshot.
+    Returns True if a new snapshot was transferred, False if the transfer has been skipped."""
 
     def check_access(p: Path, mask):
         """Check if the path exists and if the accessing user has the specified rights"""
@@ -80,96 +132,299 @@ def send_and_receive(source: Path, snapshot_dir: Path, backup_dir: Path):
         if mask != s.st_mode & mask:
             raise NoAccess('Insufficient access to directory "{}"')
 
+    source = entry.source
+    snapshot_dir = src_catalog.directory
+    backup_dir = dst_catalog.directory
     check_access(source, 0o500)
     check_access(snapshot_dir, 0o700)
     check_access(backup_dir, 0o700)
 
-    src = snapshotkit2.snapshot_dict(snapshotkit2.scan_dir(
-        snapshot_dir, bnames.filter), bnames.parse_path)
-    dst = snapshotkit2.snapshot_dict(snapshotkit2.scan_dir(
-        backup_dir, bnames.filter), bnames.parse_path)
-    common = snapshotkit2.biggest_common_snapshot(src, dst)
+    src = src_catalog.dict()
+    dst = dst_catalog.dict()
+    common = next(snapshotkit2.common_snapshots(
+        src, dst, src_catalog.info, dst_catalog.info), None)
+    if entry.skip_unchanged and common is not None and bnames.parse_path(common[0]) == src_catalog.newest():
+        if snapshotkit2.unchanged_since(source, common[0]):
+            logger.info('Source "%s" has not changed since snapshot "%s", skipping transfer',
+                        source, common[0])
+            return False
+        logger.debug('Source "%s" has changed since snapshot "%s"',
+                     source, common[0])
+    if job_id is None:
+        job_id = sessionkit.session.session_id
     try:
-        trans = Transact(id=sessionkit.session.session_id, source=source,
+        trans = Transact(id=job_id, source=source,
                          snapshot_dir=snapshot_dir, backup_dir=backup_dir)
         trans.prepare(False)
         trans.create_prelim_snapshot()
-        if common is None:
-            trans.send(None, snapshot_diff)
-        else:
-            trans.send(common[0], snapshot_diff)
-        trans.rename(_create_name(snapshot_dir, backup_dir))
+        parent = None
+        if common is not None:
+            parent = common[0]
+        expected = usage.estimate_stream_size(source, parent)
+        if expected is not None:
+            logger.info('Estimated stream size: %.1f MiB', expected / MIB)
+        progress = Progress(entry.name, expected, globalstuff.progress_interval,
+                            entry.progress_file)
+        clones = _clone_sources(src_catalog, dst_catalog, common, entry.clone_sources)
+        if len(clones) > 0:
+            logger.info('Clone sources: %s', ', '.join(str(c) for c in clones))
+        transferred = trans.send(parent, partial(snapshot_diff, progress=progress, clone_sources=clones,
+                                                 protocol=entry.send_protocol, compressed=entry.compressed_data))
+        name = _create_name(src_catalog, dst_catalog, entry.timed_names)
+        trans.rename(name)
     except Exception as e:
         trans.rollback()
         raise e
+    src_catalog.add(snapshot_dir.joinpath(name))
+    dst_catalog.add(backup_dir.joinpath(name))
+    if transferred is None:
+        transferred = expected
+    record_stream(dst_catalog, bnames.parse(name), transferred, parent is not None)
+    return True
+
+
+def record_stream(catalog: Catalog, key: bnames.BName, size: int, incremental: bool):
+    """Record the size of the send stream that created snapshot key of catalog,
+    check_free_space() estimates the next incremental stream by the last incremental one."""
+    if size is None:
+        return
+    catalog.sizes[key] = size
+    if incremental:
+        catalog.incremental.add(key)
+
+
+async def _delete(catalog: Catalog, expired: list) -> list:
+    """Delete the snapshots of catalog named in expired, return the subvolume IDs of the deleted snapshots.
+    Up to globalstuff.delete_workers snapshots are deleted concurrently."""
+    deleted = list()
+    if len(expired) == 0:
+        return deleted
+    ids = dict()
+    for k in expired:
+        v = catalog.snapshots[k]
+        logger.debug(f'Deleting subvolume "{str(v)}"')
+        ids[k] = btrfsutil.subvolume_id(v)
+    failed = set(await snapshotkit2.delete_snapshots_async(
+        [catalog.snapshots[k] for k in expired], globalstuff.delete_workers))
+    for k in expired:
+        if catalog.snapshots[k] not in failed:
+            catalog.remove(k)
+            deleted.append(ids[k])
+    if len(failed) > 0:
+        catalog.modified()
+        raise PurgeError('Could not delete {}'.format(
+            ', '.join('"{}"'.format(str(p)) for p in failed)))
+    return deleted
+
+
+def purge_old_snapshots(catalog: Catalog, policy: retention.Policy, protect=()) -> list:
+    """Synchronous version of purge_old_snapshots_async()"""
+    return asyncio.run(purge_old_snapshots_async(catalog, policy, protect))
+
+
+async def purge_old_snapshots_async(catalog: Catalog, policy: retention.Policy, protect=()) -> list:
+    """Delete all snapshots of catalog that are neither kept by policy nor named in protect,
+    return the subvolume IDs of the deleted snapshots."""
+    if policy.last < 1:
+        raise globalstuff.Bug('Policy must keep at least 1 snapshot')
+    if len(catalog.snapshots) <= policy.last:
+        return list()
+    kept = retention.select(catalog.snapshots, policy, protect)
+    for k in kept:
+        if k in catalog.snapshots:
+            logger.debug(f'Keeping subvolume "{str(catalog.snapshots[k])}"')
+    return await _delete(catalog, [k for k in catalog.snapshots if k not in kept])
+
 
+def snapshot_sizes(catalog: Catalog) -> dict:
+    """Return a dictionary that maps the snapshots of catalog to their sizes in bytes.
+    The sizes are the exclusive bytes from the quota groups if quotas are enabled,
+    otherwise the sizes of the send streams recorded by the catalog are used, snapshots without a record count as 0 bytes.
+    Stream sizes only survive between runs in persistent catalogs, None is returned if neither source is available."""
+    qgroups = usage.qgroup_usage(catalog.directory)
+    if qgroups is None:
+        if not catalog.persistent:
+            logger.warning('Size budget of "%s" is not enforced, it requires quotas or persistent snapshot catalogs',
+                           catalog.directory)
+            return None
+        return {k: catalog.sizes.get(k, 0) for k in catalog.snapshots}
+    sizes = dict()
+    for k, v in catalog.snapshots.items():
+        sizes[k] = qgroups.get(btrfsutil.subvolume_id(v), (0, 0))[1]
+    return sizes
 
-def purge_old_snapshots(directory: Path, keep: int):
-    if keep < 1:
-        raise globalstuff.Bug('Argument "keep" must be an integer >= 1')
-    snapshots = snapshotkit2.snapshot_dict(
-        snapshotkit2.scan_dir(directory, bnames.filter), bnames.parse_path)
-    keys = list(snapshots)
-    if len(keys) > keep:
-        keys.sort(reverse=True)
-        for r in range(keep):
-            logger.debug(f'Keeping subvolume "{str(snapshots[keys[r]])}"')
-            del snapshots[keys[r]]
-        for v in snapshots.values():
-            logger.debug(f'Deleting subvolume "{str(v)}"')
-            btrfsutil.delete_subvolume(v)
-
-
-def _create_name(snapshot_dir: Path, backup_dir: Path) -> str:
-    """Returns the next file name available to store a backup by analyzing the existing backup file names"""
-    snapshot = None
-    src = snapshotkit2.snapshot_dict(snapshotkit2.scan_dir(
-        snapshot_dir, bnames.filter_date(datetime.today())), bnames.parse_path)
-    dst = snapshotkit2.snapshot_dict(snapshotkit2.scan_dir(
-        backup_dir, bnames.filter_date(datetime.today())), bnames.parse_path)
-    if src is not None and dst is not None:
-        snapshot = bnames.newest(list(src) + list(dst))
-    elif src is not None and dst is None:
-        snapshot = bnames.newest(list(src))
-    elif src is None and dst is not None:
-        snapshot = bnames.newest(list(dst))
-    if snapshot is not None:
-        snapshot.index += 1
-        return str(snapshot)
-    ts = datetime.today()
-    return str(bnames.BName(year=ts.year, month=ts.month, day=ts.day, index=1))
-
-
-def run(entry: Entry):
+
+def purge_over_budget(catalog: Catalog, budget: int, protect=()) -> list:
+    """Synchronous version of purge_over_budget_async()"""
+    return asyncio.run(purge_over_budget_async(catalog, budget, protect))
+
+
+async def purge_over_budget_async(catalog: Catalog, budget: int, protect=()) -> list:
+    """Delete the oldest snapshots of catalog until their summed size fits into budget bytes, see snapshot_sizes().
+    Snapshots named in protect are never deleted. Returns the subvolume IDs of the deleted snapshots."""
+    sizes = snapshot_sizes(catalog)
+    if sizes is None:
+        return list()
+    expired = retention.over_budget(sizes, budget, protect)
+    remaining = sum(sizes.values()) - sum(sizes[k] for k in expired)
+    if remaining > budget:
+        logger.warning('Snapshots in "%s" need %.1f MiB, exceeding the budget of %.1f MiB',
+                       catalog.directory, remaining / MIB, budget / MIB)
+    return await _delete(catalog, expired)
+
+
+async def _purge_both(entry: Entry, src_catalog: Catalog, dst_catalog: Catalog) -> list:
+    """Purge the snapshots of both catalogs by entry's retention rules and the backup side by entry's size budget.
+    Both sides are purged at the same time in one event loop, a failure on one side does not stop or hide the other.
+    Returns the subvolume IDs of the snapshots deleted on the backup side."""
+    # the newest common snapshot is the parent of the next run
+    src_protect, dst_protect, common = _newest_common(src_catalog, dst_catalog)
+    policy = entry.policy()
+
+    async def purge_dst() -> list:
+        deleted = await purge_old_snapshots_async(dst_catalog, policy, dst_protect)
+        if entry.size_budget is not None:
+            deleted += await purge_over_budget_async(dst_catalog, entry.size_budget, dst_protect)
+        return deleted
+
+    results = await asyncio.gather(purge_old_snapshots_async(src_catalog, policy, src_protect), purge_dst(),
+                                   return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    for e in errors:
+        if not isinstance(e, PurgeError):
+            raise e
+    if len(errors) > 0:
+        raise PurgeError('; '.join(str(e) for e in errors))
+    return results[1]
+
+
+def _newest_common(src_catalog: Catalog, dst_catalog: Catalog) -> tuple:
+    """Return the keys of the newest common snapshot in both catalogs as tuples for purge_old_snapshots()'s protect argument
+    and the common snapshot itself, see snapshotkit2.common_snapshots(). The newest common snapshot is the next parent."""
+    common = next(snapshotkit2.common_snapshots(src_catalog.dict(), dst_catalog.dict(),
+                                                src_catalog.info, dst_catalog.info), None)
+    if common is None:
+        return (), (), None
+    return (bnames.parse_path(common[0]),), (bnames.parse_path(common[1]),), common
+
+
+def free_space(path: Path) -> int:
+    """Return the bytes available to unprivileged users on the file system containing path"""
+    s = statvfs(path)
+    return s.f_bavail * s.f_frsize
+
+
+def check_free_space(entry: Entry, src_catalog: Catalog, dst_catalog: Catalog) -> list:
+    """Make sure the backup drive has enough free space for the next transfer before it starts.
+    The stream size is estimated from the source's quota groups or, if quotas are disabled and the transfer is incremental,
+    by the size of the last incremental stream. The check is skipped if the size cannot be estimated.
+    If space is short, the backup directory is purged by entry's retention rules first, sparing the next parent,
+    and the cleaner is waited for. Raises NoSpace if the space is still short afterwards.
+    Returns the subvolume IDs of the deleted snapshots."""
+    src_protect, dst_protect, common = _newest_common(src_catalog, dst_catalog)
+    parent = None
+    if common is not None:
+        parent = common[0]
+    expected = usage.estimate_stream_size(entry.source, parent)
+    if expected is None and parent is not None:
+        # a full stream says nothing about the size of the next incremental one
+        newest = dst_catalog.newest()
+        if newest in dst_catalog.incremental:
+            expected = dst_catalog.sizes.get(newest)
+    if expected is None:
+        logger.debug('Cannot estimate the stream size, skipping free space check')
+        return list()
+    backup_dir = dst_catalog.directory
+    free = free_space(backup_dir)
+    if free >= expected:
+        return list()
+    logger.warning('Only %.1f MiB of about %.1f MiB needed are free on the backup drive, removing old snapshots first',
+                   free / MIB, expected / MIB)
+    deleted = purge_old_snapshots(dst_catalog, entry.policy(), dst_protect)
+    if entry.size_budget is not None:
+        deleted += purge_over_budget(dst_catalog, entry.size_budget, dst_protect)
+    if len(deleted) > 0:
+        logger.info('Waiting for the cleaner to remove %d snapshots', len(deleted))
+        snapshotkit2.wait_for_cleaner(backup_dir, deleted)
+        free = free_space(backup_dir)
+    if free < expected:
+        raise NoSpace('Not enough free space in "{}": {:.1f} MiB free, about {:.1f} MiB needed'.format(
+            backup_dir, free / MIB, expected / MIB))
+    return deleted
+
+
+def _create_name(src_catalog: Catalog, dst_catalog: Catalog, timed: bool = False) -> str:
+    """Returns the next file name available to store a backup.
+    Usually the newest snapshots of both catalogs suffice to find it, all snapshots are only
+    searched if the newest snapshot is newer than the current time.
+    If a snapshot of today already has a time, the new name gets one as well, so it sorts after that snapshot."""
+    now = datetime.today()
+    candidate = bnames.first(now, timed)
+    newest = [n for n in (src_catalog.newest(), dst_catalog.newest()) if n is not None]
+    if not timed and len(newest) > 0 and max(newest).seconds is not None and \
+            (max(newest).year, max(newest).month, max(newest).day) == (now.year, now.month, now.day):
+        candidate = bnames.first(now, True)
+    if len(newest) == 0 or max(newest) < candidate:
+        return str(candidate)
+    if max(newest).slot == candidate.slot:
+        candidate.index = max(newest).index + 1
+        return str(candidate)
+    same = [k for k in list(src_catalog.snapshots) + list(dst_catalog.snapshots)
+            if k.slot == candidate.slot]
+    if len(same) > 0:
+        candidate.index = bnames.newest(same).index + 1
+    return str(candidate)
+
+
+def run(entry: Entry, drive: DriveSession = None):
+    """Run the backup job described by entry. Every call gets its own job ID,
+    so multiple entries can be run by parallel threads of the same session.
+    If drive is given, the backup drive will be borrowed from that drive session,
+    otherwise the drive will be armed and disarmed for this backup alone."""
     entry.verify()
-    sessionkit.session.registerBackup(entry.name, globalstuff.config_backups)
+    if drive is None:
+        drive = DriveSession(entry.backup_volume)
+    job_id = uuid4()
+    sessionkit.session.registerBackup(
+        entry.name, globalstuff.config_backups, job_id)
     try:
         logkit.log.fmtAppend('backup_name', 'jobname: {}'.format(entry.name))
-        logkit.log.fmtAppend('backup_id', 'jobid: {}'.format(
-            str(sessionkit.session.session_id)))
-        dev = mounts.device_by_state(entry.backup_volume)
+        logkit.log.fmtAppend('backup_id', 'jobid: {}'.format(str(job_id)))
+        dev = drive.acquire(keyfile=entry.keyfile, unmount=entry.flag_unmount,
+                            mount_options=entry.mount_options, crypt_flags=entry.crypt_flags)
         try:
-            logger.info('Arming backup drive')
-            dev.arm(sessionkit.session.getMountDir(create_parent=True, mkdir=True),
-                    luks_name=str(sessionkit.session.session_id), keyfile=entry.keyfile)
             backup_dir = None
             if entry.backup_dir_relative is not None:
                 backup_dir = dev.mountPoint().joinpath(entry.backup_dir_relative)
             else:
                 backup_dir = dev.mountPoint()
+            src_catalog = Catalog.load(
+                entry.snapshot_dir, globalstuff.persistent_catalogs)
+            dst_catalog = Catalog.load(
+                backup_dir, globalstuff.persistent_catalogs)
+            if entry.space_check:
+                try:
+                    if len(check_free_space(entry, src_catalog, dst_catalog)) > 0:
+                        drive.touch()
+                except NoSpace:
+                    drive.touch()
+                    dst_catalog.save()
+                    raise
             logger.info('Starting backup')
-            send_and_receive(entry.source, entry.snapshot_dir, backup_dir)
+            if send_and_receive(entry, src_catalog, dst_catalog, job_id):
+                drive.touch()
             logger.info('Removing old snapshots')
-            purge_old_snapshots(entry.snapshot_dir, entry.snapshots)
-            purge_old_snapshots(backup_dir, entry.snapshots)
-            logger.info('Syncing backup drive')
-            trans_id = btrfsutil.start_sync(dev.mountPoint())
-            btrfsutil.wait_sync(dev.mountPoint(), trans_id)
+            deleted = asyncio.run(_purge_both(entry, src_catalog, dst_catalog))
+            if len(deleted) > 0:
+                drive.touch()
+                if entry.wait_cleaner:
+                    logger.info('Waiting for the cleaner to remove %d snapshots', len(deleted))
+                    snapshotkit2.wait_for_cleaner(backup_dir, deleted)
+            src_catalog.save()
+            dst_catalog.save()
         finally:
-            if entry.flag_unmount:
-                logger.info('Disarming backup drive')
-                dev.disarm()
-            else:
-                logger.info('Backup drive stays online through user request')
+            drive.release()
     finally:
-        sessionkit.session.releaseBackup()
+        sessionkit.session.releaseBackup(job_id)
+        logkit.log.fmtRemove('backup_id')
+        logkit.log.fmtRemove('backup_name')
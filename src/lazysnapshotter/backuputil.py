@@ -17,12 +17,12 @@
 
 from pathlib import Path
 
-from . import backup, cmdline, configfile, globalstuff, verify
+from . import backup, cmdline, configfile, globalstuff, usage, verify
 
 
-def create_backup_entry(config, args):
-    """Return a new backup entry compiled from config file data and command line arguments."""
-    e = backup.Entry(name=args[cmdline.ARG_NAME])
+def create_backup_entry(config, args, name: str):
+    """Return a new backup entry named name compiled from config file data and command line arguments."""
+    e = backup.Entry(name=name)
     config_entry = config.getConfigEntry(e.name)
     config.verifyConfigEntry(e.name)
     e.flag_unmount = not args[cmdline.ARG_NOUMOUNT]
@@ -30,6 +30,40 @@ def create_backup_entry(config, args):
         e.keyfile = args[cmdline.ARG_KEYFILE]
     elif configfile.ENTRY_KEYFILE in config_entry:
         e.keyfile = Path(config_entry[configfile.ENTRY_KEYFILE])
+    if configfile.ENTRY_SKIPUNCHANGED in config_entry:
+        e.skip_unchanged = config_entry.getboolean(
+            configfile.ENTRY_SKIPUNCHANGED)
+    if configfile.ENTRY_CLONESOURCES in config_entry:
+        e.clone_sources = int(config_entry[configfile.ENTRY_CLONESOURCES])
+    if configfile.ENTRY_SENDPROTOCOL in config_entry:
+        e.send_protocol = int(config_entry[configfile.ENTRY_SENDPROTOCOL])
+    if configfile.ENTRY_COMPRESSEDDATA in config_entry:
+        e.compressed_data = config_entry.getboolean(
+            configfile.ENTRY_COMPRESSEDDATA)
+    if configfile.ENTRY_NAMEFORMAT in config_entry:
+        e.timed_names = config_entry[configfile.ENTRY_NAMEFORMAT].lower() == 'time'
+    if configfile.ENTRY_KEEPHOURLY in config_entry:
+        e.keep_hourly = int(config_entry[configfile.ENTRY_KEEPHOURLY])
+    if configfile.ENTRY_KEEPDAILY in config_entry:
+        e.keep_daily = int(config_entry[configfile.ENTRY_KEEPDAILY])
+    if configfile.ENTRY_KEEPWEEKLY in config_entry:
+        e.keep_weekly = int(config_entry[configfile.ENTRY_KEEPWEEKLY])
+    if configfile.ENTRY_KEEPMONTHLY in config_entry:
+        e.keep_monthly = int(config_entry[configfile.ENTRY_KEEPMONTHLY])
+    if configfile.ENTRY_KEEPYEARLY in config_entry:
+        e.keep_yearly = int(config_entry[configfile.ENTRY_KEEPYEARLY])
+    if configfile.ENTRY_CRYPTFLAGS in config_entry:
+        e.crypt_flags = tuple(config_entry[configfile.ENTRY_CRYPTFLAGS].split(','))
+    if configfile.ENTRY_MOUNTOPTIONS in config_entry:
+        e.mount_options = config_entry[configfile.ENTRY_MOUNTOPTIONS]
+    if configfile.ENTRY_SIZEBUDGET in config_entry:
+        e.size_budget = usage.parse_size(config_entry[configfile.ENTRY_SIZEBUDGET])
+    if configfile.ENTRY_SPACECHECK in config_entry:
+        e.space_check = config_entry.getboolean(configfile.ENTRY_SPACECHECK)
+    if configfile.ENTRY_WAITCLEANER in config_entry:
+        e.wait_cleaner = config_entry.getboolean(configfile.ENTRY_WAITCLEANER)
+    if configfile.ENTRY_PROGRESSFILE in config_entry:
+        e.progress_file = Path(config_entry[configfile.ENTRY_PROGRESSFILE])
     if configfile.ENTRY_SNAPSHOTS in config_entry:
         e.snapshots = int(config_entry[configfile.ENTRY_SNAPSHOTS])
     else:
@@ -15,78 +15,190 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see https://www.gnu.org/licenses.
 
-from dataclasses import dataclass
+import heapq
+import logging
+import re
+from operator import attrgetter
 from pathlib import Path
 from os.path import basename
 from datetime import datetime
-from . import verify
+
+# matches a complete snapshot name, groups are year, month, day, hour, minute, second and index.
+# The time groups are empty for names without a time.
+_PATTERN = '(000[1-9]|00[1-9][0-9]|0[1-9][0-9]{2}|[1-9][0-9]{3})-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])' \
+    '(?:T([01][0-9]|2[0-3])([0-5][0-9])([0-5][0-9]))?\\.([1-9][0-9]*)'
+_pattern = re.compile(_PATTERN)
+# matches every snapshot name inside a NUL separated list of names
+_bulk_pattern = re.compile('(?<![^\\0])(' + _PATTERN + ')(?![^\\0])')
+_ordinal = attrgetter('ordinal')
+
+logger = logging.getLogger(__name__)
+
+
+# An ordinal holds the date as YYYYMMDD in its upper bits, followed by TIME_BITS bits for the time
+# and INDEX_BITS bits for the index. The time is 0 for names without a time and 1 + the seconds since midnight otherwise,
+# so names without a time sort before all names with a time on the same day.
+# Names with an index beyond INDEX_BITS are not accepted as snapshot names.
+INDEX_BITS = 64
+TIME_BITS = 17
+_INDEX_MASK = (1 << INDEX_BITS) - 1
+_TIME_MASK = (1 << TIME_BITS) - 1
+
+
+def _compose(date: int, time: int, index: int) -> int:
+    return (date << TIME_BITS | time) << INDEX_BITS | index
 
 
-@dataclass
 class BName:
-    """Representation of a snapshot's name"""
-    year: int
-    month: int
-    day: int
-    index: int
+    """Representation of a snapshot's name.
+    A name either consists of a date and an index (YYYY-MM-DD.I) or of a date, a time and an index (YYYY-MM-DDTHHMMSS.I).
+    The name is stored as a single integer ordinal, so comparing and hashing BNames are integer operations."""
+    __slots__ = ('ordinal',)
+
+    def __init__(self, year: int, month: int, day: int, index: int, seconds: int = None):
+        """seconds is the time of the name in seconds since midnight, None for names without a time"""
+        if not (0 <= year and 0 <= month < 100 and 0 <= day < 100 and 0 <= index <= _INDEX_MASK):
+            raise ValueError('Date or index out of range')
+        time = 0
+        if seconds is not None:
+            if not 0 <= seconds < 86400:
+                raise ValueError('Time out of range')
+            time = seconds + 1
+        self.ordinal = _compose(year * 10000 + month * 100 + day, time, index)
+
+    @classmethod
+    def from_ordinal(cls, ordinal: int):
+        b = object.__new__(cls)
+        b.ordinal = ordinal
+        return b
+
+    @property
+    def year(self) -> int:
+        return (self.ordinal >> INDEX_BITS + TIME_BITS) // 10000
+
+    @property
+    def month(self) -> int:
+        return (self.ordinal >> INDEX_BITS + TIME_BITS) // 100 % 100
+
+    @property
+    def day(self) -> int:
+        return (self.ordinal >> INDEX_BITS + TIME_BITS) % 100
+
+    @property
+    def seconds(self) -> int:
+        """Seconds since midnight or None if the name has no time"""
+        time = self.ordinal >> INDEX_BITS & _TIME_MASK
+        if time == 0:
+            return None
+        return time - 1
+
+    @property
+    def slot(self) -> int:
+        """Date and time of the name as an integer, names only differing by their index share the same slot"""
+        return self.ordinal >> INDEX_BITS
+
+    @property
+    def index(self) -> int:
+        return self.ordinal & _INDEX_MASK
+
+    @index.setter
+    def index(self, index: int):
+        if not 0 <= index <= _INDEX_MASK:
+            raise ValueError('Index out of range')
+        self.ordinal = self.ordinal & ~_INDEX_MASK | index
+
+    def __repr__(self):
+        return 'BName(year={}, month={}, day={}, index={}, seconds={})'.format(
+            self.year, self.month, self.day, self.index, self.seconds)
 
     def __str__(self):
         if not (0 < self.year < 10000 and 0 < self.month < 13 and 0 < self.day < 32 and 0 < self.index):
             raise ValueError('Date or index out of range')
-        return '{:04d}-{:02d}-{:02d}.{:d}'.format(self.year, self.month, self.day, self.index)
+        seconds = self.seconds
+        if seconds is None:
+            return '{:04d}-{:02d}-{:02d}.{:d}'.format(self.year, self.month, self.day, self.index)
+        return '{:04d}-{:02d}-{:02d}T{:02d}{:02d}{:02d}.{:d}'.format(
+            self.year, self.month, self.day, seconds // 3600, seconds // 60 % 60, seconds % 60, self.index)
 
     def __eq__(self, other):
         if not isinstance(other, BName):
             raise TypeError('Cannot compare type "{}" to type "{}"'.format(
                 type(self), type(other)))
-        if self.year == other.year and self.month == other.month\
-                and self.day == other.day and self.index == other.index:
-            return True
-        return False
+        return self.ordinal == other.ordinal
 
     def __lt__(self, other):
         if not isinstance(other, BName):
             raise TypeError('Cannot compare type "{}" to type "{}"'.format(
                 type(self), type(other)))
-        if self.year < other.year:
-            return True
-        elif self.year == other.year:
-            if self.month < other.month:
-                return True
-            elif self.month == other.month:
-                if self.day < other.day:
-                    return True
-                elif self.day == other.day:
-                    if self.index < other.index:
-                        return True
-        return False
+        return self.ordinal < other.ordinal
 
     def __gt__(self, other):
         return other < self
 
     def __hash__(self):
-        return hash((self.year, self.month, self.day, self.index))
+        return hash(self.ordinal)
+
+
+def first(ts: datetime, timed: bool = False) -> BName:
+    """Returns the first name for a snapshot taken at ts. If timed is False, the name only contains ts's date."""
+    seconds = None
+    if timed:
+        seconds = ts.hour * 3600 + ts.minute * 60 + ts.second
+    return BName(ts.year, ts.month, ts.day, 1, seconds)
+
+
+def _from_groups(year: str, month: str, day: str, hour: str, minute: str, second: str, index: str) -> int:
+    """Returns the ordinal of a matched name or None if its index is out of range"""
+    i = int(index)
+    if i > _INDEX_MASK:
+        return None
+    time = 0
+    if hour:
+        time = int(hour) * 3600 + int(minute) * 60 + int(second) + 1
+    return _compose(int(year + month + day), time, i)
 
 
 def parse(name: str) -> BName:
     """Constructor for BName objects"""
-    if len(name) < 12:
-        raise ParseError('Input string too short')
-    date = name[:10]
-    if not verify.isodate(date):
-        raise ParseError('Malformed date string')
-    if name[10:11] != '.':
-        raise ParseError('Expected "." at pos 10')
-    index = name[11:]
-    if not verify.snapshot_revision(index):
-        raise ParseError('Malformed Index')
-    return BName(int(name[:4]), int(name[5:7]), int(name[8:10]), int(name[11:]))
+    m = _pattern.fullmatch(name)
+    if m is None:
+        raise ParseError('Malformed snapshot name')
+    ordinal = _from_groups(*m.groups())
+    if ordinal is None:
+        raise ParseError('Index out of range')
+    return BName.from_ordinal(ordinal)
 
 
 def parse_path(p) -> BName:
     return parse(basename(p))
 
 
+def match(name: str) -> BName:
+    """Returns the BName of name or None if name is not a snapshot name, name is parsed by a single regex match"""
+    m = _pattern.fullmatch(name)
+    if m is None:
+        return None
+    ordinal = _from_groups(*m.groups())
+    if ordinal is None:
+        logger.warning('Ignoring "%s", its index is out of range', name)
+        return None
+    return BName.from_ordinal(ordinal)
+
+
+def match_all(names) -> dict:
+    """Parses a whole directory listing at once, returns a dictionary that maps every snapshot name in names to its BName.
+    All names are joined into a single string and scanned by one regex, names that are not snapshot names are left out."""
+    d = dict()
+    new = BName.from_ordinal
+    for groups in _bulk_pattern.findall('\0'.join(names)):
+        ordinal = _from_groups(*groups[1:])
+        if ordinal is not None:
+            d[groups[0]] = new(ordinal)
+        else:
+            logger.warning('Ignoring "%s", its index is out of range', groups[0])
+    return d
+
+
 def filter(p: Path) -> bool:
     """Filter for snapshotkit's scan_dir function"""
     try:
@@ -111,10 +223,14 @@ def filter_date(ts: datetime):
 
 def newest(names: list) -> BName:
     if len(names) > 0:
-        names.sort(reverse=True)
-        return names[0]
+        return max(names, key=_ordinal)
     return None
 
 
+def top(names, k: int) -> list:
+    """Returns the k newest BNames of names, newest first"""
+    return heapq.nlargest(k, names, key=_ordinal)
+
+
 class ParseError(Exception):
     pass
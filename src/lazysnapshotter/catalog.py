@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Keep track of the snapshots inside a snapshot directory"""
+
+import copy
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from pathlib import Path
+from uuid import UUID
+
+import btrfsutil
+
+from . import bnames, snapshotkit2
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = '.lazysnapshotter-catalog'
+CATALOG_VERSION = 1
+_memory = None  # maps directories to catalogs that are kept in memory between runs, None if disabled
+_memory_lock = threading.Lock()
+
+# the parts of btrfsutil.SubvolumeInfo that never change for a read-only snapshot
+SnapshotInfo = namedtuple(
+    'SnapshotInfo', ('uuid', 'parent_uuid', 'received_uuid', 'generation'))
+
+
+def keep_in_memory():
+    """Keep loaded catalogs in memory, so that a long running process does not scan or read
+    a directory again as long as its mtime has not changed. Every load gets its own copy of a kept catalog,
+    so threads never share one."""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = dict()
+
+
+def _remember(cat):
+    with _memory_lock:
+        if _memory is None:
+            return
+        for d in [d for d in _memory if not d.exists()]:
+            del _memory[d]
+        _memory[cat.directory] = cat.copy()
+
+
+def _recall(directory: Path, persistent: bool):
+    with _memory_lock:
+        if _memory is None:
+            return None
+        cat = _memory.get(directory)
+    try:
+        if cat is None or cat.persistent != persistent or cat._mtime != os.stat(directory).st_mtime_ns:
+            return None
+    except FileNotFoundError:
+        return None
+    logger.debug('Reusing %s from memory', cat)
+    return cat.copy()
+
+
+class Catalog:
+    """Snapshots of a single directory, keyed by their BName.
+    A catalog is built once per run and updated by every snapshot operation of the run,
+    so the directory never has to be scanned again. If persistent is True, the catalog is stored
+    inside the directory and reused by the next run as long as the directory's mtime has not changed."""
+
+    def __init__(self, directory: Path, persistent: bool = False):
+        self.directory = directory
+        self.persistent = persistent
+        self.snapshots = dict()  # maps BNames to paths
+        self._infos = dict()  # maps paths to SnapshotInfos
+        self._mtime = None  # mtime of the directory after its last known modification
+        self._newest = None  # cached result of newest()
+        self.sizes = dict()  # maps BNames to the size of the send stream that created the snapshot
+        self.incremental = set()  # BNames of the snapshots whose send stream had a parent
+
+    def __repr__(self):
+        return f'Catalog("{self.directory}",{len(self.snapshots)})'
+
+    @classmethod
+    def load(cls, directory: Path, persistent: bool = False):
+        """Return the catalog of directory, read it from the catalog file if possible or scan the directory otherwise."""
+        cat = _recall(directory, persistent)
+        if cat is not None:
+            return cat
+        cat = cls(directory, persistent)
+        if not persistent or not cat._read():
+            cat.scan()
+        _remember(cat)
+        return cat
+
+    def copy(self):
+        """Return a copy of the catalog that can be modified without affecting this one"""
+        cat = copy.copy(self)
+        cat.snapshots = dict(self.snapshots)
+        cat._infos = dict(self._infos)
+        cat.sizes = dict(self.sizes)
+        cat.incremental = set(self.incremental)
+        return cat
+
+    def _file(self) -> Path:
+        return self.directory.joinpath(CATALOG_FILE)
+
+    def _read(self) -> bool:
+        try:
+            with open(self._file(), 'r') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+                data = json.load(f)
+            if data['version'] != CATALOG_VERSION:
+                return False
+            if data['mtime'] != os.stat(self.directory).st_mtime_ns:
+                logger.debug('Catalog of "%s" is outdated', self.directory)
+                return False
+            self._newest = None
+            keys = bnames.match_all(data['snapshots'])
+            if len(keys) != len(data['snapshots']):
+                raise ValueError('Invalid snapshot name')
+            for name, info in data['snapshots'].items():
+                path = self.directory.joinpath(name)
+                self.snapshots[keys[name]] = path
+                if info is not None:
+                    self._infos[path] = SnapshotInfo(UUID(info[0]).bytes, UUID(info[1]).bytes,
+                                                     UUID(info[2]).bytes, info[3])
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+            logger.warning('Ignoring invalid catalog "%s": %s', self._file(), e)
+            self.snapshots = dict()
+            self._infos = dict()
+            self.sizes = dict()
+            self.incremental = set()
+            return False
+        for name, size in data.get('sizes', dict()).items():
+            key = bnames.match(name)
+            if key in self.snapshots and isinstance(size, int):
+                self.sizes[key] = size
+        for name in data.get('incremental', list()):
+            key = bnames.match(name)
+            if key in self.sizes:
+                self.incremental.add(key)
+        self._mtime = data['mtime']
+        logger.debug('Loaded %s from file', self)
+        return True
+
+    def scan(self):
+        """Rebuild the catalog from the directory's content"""
+        self.snapshots = snapshotkit2.scan_snapshots(
+            self.directory, bnames.match) or dict()
+        self._infos = dict()
+        self._newest = None
+        self.sizes = dict()
+        self.incremental = set()
+        self._touch()
+        logger.debug('Scanned %s', self)
+
+    def _touch(self):
+        """Remember the directory's mtime after a modification made by this catalog's owner"""
+        self._mtime = os.stat(self.directory).st_mtime_ns
+
+    def save(self):
+        """Write the catalog to the catalog file if the catalog is persistent.
+        The file is rewritten in place, so saving does not change the directory's mtime.
+        If the directory has been modified by somebody else, the catalog file is invalidated instead.
+        A catalog kept in memory is replaced by a copy of this one."""
+        if self.persistent:
+            self._write()
+        _remember(self)
+
+    def _write(self):
+        path = self._file()
+        if not path.exists():
+            before = os.stat(self.directory).st_mtime_ns
+            with open(path, 'a'):
+                pass
+            if before == self._mtime:
+                self._touch()
+        with open(path, 'r+') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            mtime = os.stat(self.directory).st_mtime_ns
+            if mtime != self._mtime:
+                logger.debug('"%s" was modified by another process, invalidating its catalog',
+                             self.directory)
+                f.truncate()
+                return
+            snapshots = dict()
+            for k, v in self.snapshots.items():
+                info = self._infos.get(v)
+                if info is not None:
+                    info = [str(UUID(bytes=info.uuid)), str(UUID(bytes=info.parent_uuid)),
+                            str(UUID(bytes=info.received_uuid)), info.generation]
+                snapshots[str(k)] = info
+            sizes = {str(k): v for k, v in self.sizes.items()}
+            incremental = [str(k) for k in self.incremental]
+            f.write(json.dumps({'version': CATALOG_VERSION, 'mtime': mtime, 'snapshots': snapshots,
+                                'sizes': sizes, 'incremental': incremental}))
+            f.truncate()
+        logger.debug('Saved %s', self)
+
+    def dict(self) -> dict:
+        """Return the snapshots as a dictionary like snapshotkit2.snapshot_dict()"""
+        if len(self.snapshots) == 0:
+            return None
+        return self.snapshots
+
+    def info(self, path: Path) -> SnapshotInfo:
+        """Return the metadata of snapshot path, it is read only once from the file system"""
+        info = self._infos.get(path)
+        if info is None:
+            i = btrfsutil.subvolume_info(path)
+            info = SnapshotInfo(i.uuid, i.parent_uuid,
+                                i.received_uuid, i.generation)
+            self._infos[path] = info
+        return info
+
+    def newest(self) -> bnames.BName:
+        """Return the newest snapshot's BName, it is only searched for again after the newest snapshot was removed"""
+        if self._newest is None:
+            self._newest = bnames.newest(self.snapshots)
+        return self._newest
+
+    def add(self, path: Path):
+        """Record the new snapshot path"""
+        key = bnames.parse_path(path)
+        self.snapshots[key] = path
+        if self._newest is not None and key > self._newest:
+            self._newest = key
+        self._touch()
+
+    def remove(self, key: bnames.BName):
+        """Forget the snapshot named key after it has been deleted"""
+        path = self.snapshots.pop(key)
+        self._infos.pop(path, None)
+        self.sizes.pop(key, None)
+        self.incremental.discard(key)
+        if self._newest is not None and key == self._newest:
+            self._newest = None
+        self._touch()
+
+    def modified(self):
+        """Tell the catalog that its owner modified the directory without changing its snapshots"""
+        self._touch()
@@ -32,6 +32,8 @@ ACTION_REMOVE = 'remove'
 ACTION_LIST = 'list'
 ACTION_RUN = 'run'
 ACTION_GLOBAL = 'global'
+ACTION_DAEMON = 'daemon'
+ACTION_WATCH = 'watch'
 ARG_PRE_CONFIGFILE = '--configfile'
 ARG_PRE_DEBUGMODE = '--debug'
 ARG_PRE_LOGFILE = '--logfile'
@@ -48,6 +50,34 @@ ARG_LOGLEVEL = '--loglevel'
 ARG_MNT = '--mountdir'
 ARG_KEYFILE = '--keyfile'
 ARG_VERBOSE = '--verbose'
+ARG_ALL = '--all'
+ARG_JOBS = '--jobs'
+ARG_RELAY = '--relay'
+ARG_PIPESIZE = '--pipe-size'
+ARG_PROGRESSINTERVAL = '--progress-interval'
+ARG_SNAPSHOTCATALOG = '--snapshot-catalog'
+ARG_DELETEWORKERS = '--delete-workers'
+ARG_VOLUMEKEYTTL = '--volume-key-ttl'
+ARG_KEEPWARM = '--keep-warm'
+ARG_PROGRESSFILE = '--progress-file'
+ARG_SKIPUNCHANGED = '--skip-unchanged'
+ARG_CLONESOURCES = '--clone-sources'
+ARG_SENDPROTOCOL = '--send-protocol'
+ARG_COMPRESSEDDATA = '--compressed-data'
+ARG_NAMEFORMAT = '--name-format'
+ARG_KEEPHOURLY = '--keep-hourly'
+ARG_KEEPDAILY = '--keep-daily'
+ARG_KEEPWEEKLY = '--keep-weekly'
+ARG_KEEPMONTHLY = '--keep-monthly'
+ARG_KEEPYEARLY = '--keep-yearly'
+ARG_WAITCLEANER = '--wait-cleaner'
+ARG_SIZEBUDGET = '--size-budget'
+ARG_SPACECHECK = '--space-check'
+ARG_MOUNTOPTIONS = '--mount-options'
+ARG_CRYPTFLAGS = '--crypt-flags'
+ARG_SCHEDULE = '--schedule'
+ARG_DAEMON = '--daemon'
+ARGS_KEEP = (ARG_KEEPHOURLY, ARG_KEEPDAILY, ARG_KEEPWEEKLY, ARG_KEEPMONTHLY, ARG_KEEPYEARLY)
 KEY_BACKUPID = 'backupid'
 REQUIRED_ENTRY_OPTIONS = (ARG_NAME, ARG_SOURCE, ARG_TARGET, ARG_SNAPSHOTDIR)
 ERR_BACKUP_ID = '"{}" is not a valid backup identifier!'
@@ -76,8 +106,8 @@ class ListData():
 
 def validCommands() -> str:
     """Return a description string of the available commands"""
-    return 'Valid commands:\n\t{}\n\t{}\n\t{}\n\t{}\n\t{}\n\t{}'.format(
-        ACTION_GLOBAL, ACTION_ADD, ACTION_MODIFY, ACTION_REMOVE, ACTION_LIST, ACTION_RUN)
+    return 'Valid commands:\n\t{}\n\t{}\n\t{}\n\t{}\n\t{}\n\t{}\n\t{}\n\t{}'.format(
+        ACTION_GLOBAL, ACTION_ADD, ACTION_MODIFY, ACTION_REMOVE, ACTION_LIST, ACTION_RUN, ACTION_DAEMON, ACTION_WATCH)
 
 
 def exampleBackupEntry() -> str:
@@ -120,6 +150,10 @@ def action():
             return _do_run(res)
         elif res.action == ACTION_GLOBAL:
             return _do_global(res)
+        elif res.action == ACTION_DAEMON:
+            return _do_daemon(res)
+        elif res.action == ACTION_WATCH:
+            return _do_watch(res)
         else:
             raise CommandLineError('{}\n\n{}'.format(
                 ERR_INVALID_COMMAND.format(res.action), validCommands()))
@@ -172,6 +206,186 @@ def _parse_snapshots(arg, data):
             globalstuff.max_snapshots))
 
 
+def _parse_jobs(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        jobs = int(args[0])
+    except ValueError:
+        raise CommandLineError(
+            '"{}" is not a valid amount of parallel jobs!'.format(args[0]))
+    if verify.job_count(jobs):
+        data[arg] = jobs
+        args.popleft()
+    else:
+        raise CommandLineError('Only between 1 and {} parallel jobs are supported!'.format(
+            globalstuff.max_jobs))
+
+
+def _parse_yes_no(arg, data):
+    _arg_helper(data, arg, 1)
+    if not verify.yes_no(args[0]):
+        raise CommandLineError(
+            'Argument "{}" must be either "yes" or "no"!'.format(arg))
+    data[arg] = args[0].lower()
+    args.popleft()
+
+
+def _parse_name_format(arg, data):
+    _arg_helper(data, arg, 1)
+    if not verify.name_format(args[0]):
+        raise CommandLineError('Argument "{}" must be one of {}!'.format(
+            arg, ', '.join(verify.NAME_FORMATS)))
+    data[arg] = args[0].lower()
+    args.popleft()
+
+
+def _parse_pipe_size(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        size = int(args[0])
+    except ValueError:
+        raise CommandLineError(
+            '"{}" is not a valid pipe size!'.format(args[0]))
+    if not verify.pipe_size(size):
+        raise CommandLineError(
+            'The pipe size must be between 4096 and {} bytes!'.format(2**31 - 1))
+    data[arg] = size
+    args.popleft()
+
+
+def _parse_progress_interval(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        seconds = int(args[0])
+    except ValueError:
+        raise CommandLineError(
+            '"{}" is not a valid progress interval!'.format(args[0]))
+    if not verify.progress_interval(seconds):
+        raise CommandLineError(
+            'The progress interval must be between 0 and 86400 seconds!')
+    data[arg] = seconds
+    args.popleft()
+
+
+def _parse_delete_workers(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        workers = int(args[0])
+    except ValueError:
+        raise CommandLineError(
+            '"{}" is not a valid amount of delete workers!'.format(args[0]))
+    if not verify.job_count(workers):
+        raise CommandLineError('Only between 1 and {} snapshot deletions may run in parallel!'.format(
+            globalstuff.max_jobs))
+    data[arg] = workers
+    args.popleft()
+
+
+def _parse_keep_warm(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        seconds = int(args[0])
+    except ValueError:
+        raise CommandLineError(
+            '"{}" is not a valid idle period!'.format(args[0]))
+    if not verify.keep_warm(seconds):
+        raise CommandLineError(
+            'The idle period must be between 0 and 86400 seconds!')
+    data[arg] = seconds
+    args.popleft()
+
+
+def _parse_volume_key_ttl(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        seconds = int(args[0])
+    except ValueError:
+        raise CommandLineError(
+            '"{}" is not a valid volume key lifetime!'.format(args[0]))
+    if not verify.volume_key_ttl(seconds):
+        raise CommandLineError(
+            'The volume key lifetime must be between 0 and 86400 seconds!')
+    data[arg] = seconds
+    args.popleft()
+
+
+def _parse_clone_sources(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        c = int(args[0])
+    except ValueError:
+        raise CommandLineError(
+            '"{}" is not a valid amount of clone sources!'.format(args[0]))
+    if not verify.clone_source_count(c):
+        raise CommandLineError(
+            'The amount of clone sources must not be negative!')
+    data[arg] = c
+    args.popleft()
+
+
+def _parse_crypt_flags(arg, data):
+    _arg_helper(data, arg, 1)
+    if not verify.crypt_flags(args[0]):
+        raise CommandLineError(
+            '"{}" is not a valid list of dm-crypt flags!'.format(args[0]))
+    data[arg] = args[0]
+    args.popleft()
+
+
+def _parse_schedule(arg, data):
+    _arg_helper(data, arg, 1)
+    if not verify.schedule(args[0]):
+        raise CommandLineError(
+            '"{}" is not a valid schedule!'.format(args[0]))
+    data[arg] = args[0]
+    args.popleft()
+
+
+def _parse_mount_options(arg, data):
+    _arg_helper(data, arg, 1)
+    if not verify.mount_options(args[0]):
+        raise CommandLineError(
+            '"{}" is not a valid list of mount options!'.format(args[0]))
+    data[arg] = args[0]
+    args.popleft()
+
+
+def _parse_size(arg, data):
+    _arg_helper(data, arg, 1)
+    if not verify.size(args[0]):
+        raise CommandLineError(
+            '"{}" is not a valid size!'.format(args[0]))
+    data[arg] = args[0].upper()
+    args.popleft()
+
+
+def _parse_keep_count(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        c = int(args[0])
+    except ValueError:
+        raise CommandLineError(
+            '"{}" is not a valid amount of snapshots!'.format(args[0]))
+    if not verify.keep_count(c):
+        raise CommandLineError(
+            'Argument "{}" must not be negative!'.format(arg))
+    data[arg] = c
+    args.popleft()
+
+
+def _parse_send_protocol(arg, data):
+    _arg_helper(data, arg, 1)
+    try:
+        version = int(args[0])
+    except ValueError:
+        version = None
+    if version is None or not verify.send_protocol(version):
+        raise CommandLineError('Supported send protocol versions are {}!'.format(
+            ', '.join(str(v) for v in verify.SEND_PROTOCOLS)))
+    data[arg] = version
+    args.popleft()
+
+
 def _pre_path_helper(arg, data, path):
     if not path.is_absolute():
         path = path.resolve()
@@ -241,21 +455,63 @@ def _do_run(res):
                 raise CommandLineError('Keyfile does not exist: {}'.format(p))
             res.data[arg] = p
             args.popleft()
+        elif arg == ARG_ALL:
+            _arg_helper(res.data, arg, 0)
+            res.data[arg] = True
+        elif arg == ARG_JOBS:
+            _parse_jobs(arg, res.data)
+        elif arg == ARG_DAEMON:
+            _arg_helper(res.data, arg, 0)
+            res.data[arg] = True
         elif verify.backup_id(arg):
-            if ARG_NAME in res.data:
-                raise CommandLineError(
-                    'The "{}" command supports only one backup name!'.format(ACTION_RUN))
-            res.data[ARG_NAME] = arg
+            names = res.data.setdefault(ARG_NAME, list())
+            if arg in names:
+                raise CommandLineError(ERR_DUPLICATE_ARGUMENT.format(arg))
+            names.append(arg)
         else:
             raise CommandLineError(
                 '"{}" is not a valid option for {}'.format(arg, ACTION_RUN))
-    if res.data[ARG_NAME] is None:
+    if ARG_ALL in res.data and ARG_NAME in res.data:
+        raise CommandLineError(
+            'The "{}" command accepts either backup names or "{}"!'.format(ACTION_RUN, ARG_ALL))
+    if not ARG_ALL in res.data and not ARG_NAME in res.data:
         raise CommandLineError(
             'The "{}" command needs a backup name!'.format(ACTION_RUN))
+    if not ARG_NAME in res.data:
+        res.data[ARG_NAME] = list()
+    if not ARG_ALL in res.data:
+        res.data[ARG_ALL] = False
+    if not ARG_JOBS in res.data:
+        res.data[ARG_JOBS] = None
     if not ARG_NOUMOUNT in res.data:
         res.data[ARG_NOUMOUNT] = False
     if not ARG_KEYFILE in res.data:
         res.data[ARG_KEYFILE] = None
+    if not ARG_DAEMON in res.data:
+        res.data[ARG_DAEMON] = False
+    return res
+
+
+def _do_watch(res):
+    res.data = dict()
+    while len(args) > 0:
+        arg = args[0]
+        args.popleft()
+        if arg == ARG_JOBS:
+            _parse_jobs(arg, res.data)
+        else:
+            raise CommandLineError(
+                '"{}" is not a valid option for {}'.format(arg, ACTION_WATCH))
+    if not ARG_JOBS in res.data:
+        res.data[ARG_JOBS] = None
+    return res
+
+
+def _do_daemon(res):
+    res.data = dict()
+    if len(args) > 0:
+        raise CommandLineError(
+            '"{}" is not a valid option for {}'.format(args[0], ACTION_DAEMON))
     return res
 
 
@@ -306,6 +562,66 @@ def _do_add_modify(res):
                 args.popleft()
         elif arg == ARG_SOURCE or arg == ARG_SNAPSHOTDIR or arg == ARG_KEYFILE:
             _parse_arg_with_absolute_path(arg, res.data)
+        elif arg == ARG_PROGRESSFILE:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_arg_with_absolute_path(arg, res.data)
+        elif arg == ARG_SKIPUNCHANGED:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_yes_no(arg, res.data)
+        elif arg == ARG_CLONESOURCES:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_clone_sources(arg, res.data)
+        elif arg == ARG_SENDPROTOCOL:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_send_protocol(arg, res.data)
+        elif arg == ARG_COMPRESSEDDATA:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_yes_no(arg, res.data)
+        elif arg == ARG_NAMEFORMAT:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_name_format(arg, res.data)
+        elif arg == ARG_CRYPTFLAGS:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_crypt_flags(arg, res.data)
+        elif arg == ARG_SCHEDULE:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_schedule(arg, res.data)
+        elif arg == ARG_MOUNTOPTIONS:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_mount_options(arg, res.data)
+        elif arg == ARG_SIZEBUDGET:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_size(arg, res.data)
+        elif arg == ARG_WAITCLEANER or arg == ARG_SPACECHECK:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_yes_no(arg, res.data)
+        elif arg in ARGS_KEEP:
+            if _arg_optionless(res.data, arg):
+                pass
+            else:
+                _parse_keep_count(arg, res.data)
         else:
             raise CommandLineError(ERR_INVALID_ARGUMENT.format(arg))
     return res
@@ -353,6 +669,46 @@ def _do_global(res):
                 continue
             else:
                 _parse_snapshots(arg, res.data)
+        elif arg == ARG_JOBS:
+            if _arg_optionless(res.data, arg):
+                continue
+            else:
+                _parse_jobs(arg, res.data)
+        elif arg == ARG_RELAY:
+            if _arg_optionless(res.data, arg):
+                continue
+            else:
+                _parse_yes_no(arg, res.data)
+        elif arg == ARG_PIPESIZE:
+            if _arg_optionless(res.data, arg):
+                continue
+            else:
+                _parse_pipe_size(arg, res.data)
+        elif arg == ARG_PROGRESSINTERVAL:
+            if _arg_optionless(res.data, arg):
+                continue
+            else:
+                _parse_progress_interval(arg, res.data)
+        elif arg == ARG_SNAPSHOTCATALOG:
+            if _arg_optionless(res.data, arg):
+                continue
+            else:
+                _parse_yes_no(arg, res.data)
+        elif arg == ARG_DELETEWORKERS:
+            if _arg_optionless(res.data, arg):
+                continue
+            else:
+                _parse_delete_workers(arg, res.data)
+        elif arg == ARG_KEEPWARM:
+            if _arg_optionless(res.data, arg):
+                continue
+            else:
+                _parse_keep_warm(arg, res.data)
+        elif arg == ARG_VOLUMEKEYTTL:
+            if _arg_optionless(res.data, arg):
+                continue
+            else:
+                _parse_volume_key_ttl(arg, res.data)
         else:
             raise CommandLineError(ERR_INVALID_ARGUMENT.format(arg))
     return res
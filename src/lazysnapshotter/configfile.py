@@ -29,12 +29,37 @@ GLOBAL_LOGFILE = 'logfile'
 GLOBAL_MOUNTDIR = 'mountdir'
 GLOBAL_LOGLEVEL = 'loglevel'
 GLOBAL_SNAPSHOTS = 'snapshots'
+GLOBAL_JOBS = 'jobs'
+GLOBAL_RELAY = 'relay'
+GLOBAL_PIPESIZE = 'pipe-size'
+GLOBAL_PROGRESSINTERVAL = 'progress-interval'
+GLOBAL_SNAPSHOTCATALOG = 'snapshot-catalog'
+GLOBAL_DELETEWORKERS = 'delete-workers'
+GLOBAL_VOLUMEKEYTTL = 'volume-key-ttl'
+GLOBAL_KEEPWARM = 'keep-warm'
 ENTRY_SNAPSHOTS = 'snapshots'
 ENTRY_SOURCE = 'source'
 ENTRY_SNAPSHOTDIR = 'snapshot-dir'
 ENTRY_TARGET = 'backup-device'
 ENTRY_TARGETDIR = 'backup-dir'
 ENTRY_KEYFILE = 'keyfile'
+ENTRY_PROGRESSFILE = 'progress-file'
+ENTRY_SKIPUNCHANGED = 'skip-unchanged'
+ENTRY_CLONESOURCES = 'clone-sources'
+ENTRY_SENDPROTOCOL = 'send-protocol'
+ENTRY_COMPRESSEDDATA = 'compressed-data'
+ENTRY_NAMEFORMAT = 'name-format'
+ENTRY_KEEPHOURLY = 'keep-hourly'
+ENTRY_KEEPDAILY = 'keep-daily'
+ENTRY_KEEPWEEKLY = 'keep-weekly'
+ENTRY_KEEPMONTHLY = 'keep-monthly'
+ENTRY_KEEPYEARLY = 'keep-yearly'
+ENTRY_WAITCLEANER = 'wait-cleaner'
+ENTRY_SIZEBUDGET = 'size-budget'
+ENTRY_SPACECHECK = 'space-check'
+ENTRY_MOUNTOPTIONS = 'mount-options'
+ENTRY_CRYPTFLAGS = 'crypt-flags'
+ENTRY_SCHEDULE = 'schedule'
 MANDATORY_ENTRY_KEYS = (ENTRY_SOURCE, ENTRY_SNAPSHOTDIR, ENTRY_TARGET)
 # error strings
 ERR_UNKNOWN_KEY = 'The key "{}" is not defined!'
@@ -46,7 +71,15 @@ logger = logging.getLogger(__name__)
 option_mapping_defaults = {cmdline.ARG_LOGFILE: [GLOBAL_LOGFILE, True],
                            cmdline.ARG_LOGLEVEL: [GLOBAL_LOGLEVEL, True],
                            cmdline.ARG_MNT: [GLOBAL_MOUNTDIR, True],
-                           cmdline.ARG_SNAPSHOTS: [GLOBAL_SNAPSHOTS, True]}
+                           cmdline.ARG_SNAPSHOTS: [GLOBAL_SNAPSHOTS, True],
+                           cmdline.ARG_JOBS: [GLOBAL_JOBS, True],
+                           cmdline.ARG_RELAY: [GLOBAL_RELAY, True],
+                           cmdline.ARG_PIPESIZE: [GLOBAL_PIPESIZE, True],
+                           cmdline.ARG_PROGRESSINTERVAL: [GLOBAL_PROGRESSINTERVAL, True],
+                           cmdline.ARG_SNAPSHOTCATALOG: [GLOBAL_SNAPSHOTCATALOG, True],
+                           cmdline.ARG_DELETEWORKERS: [GLOBAL_DELETEWORKERS, True],
+                           cmdline.ARG_VOLUMEKEYTTL: [GLOBAL_VOLUMEKEYTTL, True],
+                           cmdline.ARG_KEEPWARM: [GLOBAL_KEEPWARM, True]}
 
 option_mapping_entry = {cmdline.ARG_NAME: None, cmdline.KEY_BACKUPID: None,
                         cmdline.ARG_SOURCE: [ENTRY_SOURCE, False],
@@ -54,7 +87,24 @@ option_mapping_entry = {cmdline.ARG_NAME: None, cmdline.KEY_BACKUPID: None,
                         cmdline.ARG_TARGETDIR: [ENTRY_TARGETDIR, True],
                         cmdline.ARG_SNAPSHOTDIR: [ENTRY_SNAPSHOTDIR, False],
                         cmdline.ARG_SNAPSHOTS: [ENTRY_SNAPSHOTS, True],
-                        cmdline.ARG_KEYFILE: [ENTRY_KEYFILE, True]}
+                        cmdline.ARG_KEYFILE: [ENTRY_KEYFILE, True],
+                        cmdline.ARG_PROGRESSFILE: [ENTRY_PROGRESSFILE, True],
+                        cmdline.ARG_SKIPUNCHANGED: [ENTRY_SKIPUNCHANGED, True],
+                        cmdline.ARG_CLONESOURCES: [ENTRY_CLONESOURCES, True],
+                        cmdline.ARG_SENDPROTOCOL: [ENTRY_SENDPROTOCOL, True],
+                        cmdline.ARG_COMPRESSEDDATA: [ENTRY_COMPRESSEDDATA, True],
+                        cmdline.ARG_NAMEFORMAT: [ENTRY_NAMEFORMAT, True],
+                        cmdline.ARG_KEEPHOURLY: [ENTRY_KEEPHOURLY, True],
+                        cmdline.ARG_KEEPDAILY: [ENTRY_KEEPDAILY, True],
+                        cmdline.ARG_KEEPWEEKLY: [ENTRY_KEEPWEEKLY, True],
+                        cmdline.ARG_KEEPMONTHLY: [ENTRY_KEEPMONTHLY, True],
+                        cmdline.ARG_KEEPYEARLY: [ENTRY_KEEPYEARLY, True],
+                        cmdline.ARG_WAITCLEANER: [ENTRY_WAITCLEANER, True],
+                        cmdline.ARG_SIZEBUDGET: [ENTRY_SIZEBUDGET, True],
+                        cmdline.ARG_SPACECHECK: [ENTRY_SPACECHECK, True],
+                        cmdline.ARG_MOUNTOPTIONS: [ENTRY_MOUNTOPTIONS, True],
+                        cmdline.ARG_CRYPTFLAGS: [ENTRY_CRYPTFLAGS, True],
+                        cmdline.ARG_SCHEDULE: [ENTRY_SCHEDULE, True]}
 
 
 class Configfile:
@@ -190,6 +240,8 @@ Configuration file location: \"{}\"""".format(globalstuff.config_backups))
             check_abspath.append(ENTRY_TARGET)
         if ENTRY_KEYFILE in e:
             check_abspath.append(ENTRY_KEYFILE)
+        if ENTRY_PROGRESSFILE in e:
+            check_abspath.append(ENTRY_PROGRESSFILE)
         for k in check_abspath:
             try:
                 verify.requireAbsolutePath(Path(e[k]))
@@ -202,6 +254,51 @@ Configuration file location: \"{}\"""".format(globalstuff.config_backups))
             except verify.VerificationError:
                 raise ConfigfileError(
                     'Backup entry "{}": Key "{}" has an invalid value!'.format(name, ENTRY_SNAPSHOTS))
+        for k in (ENTRY_SKIPUNCHANGED, ENTRY_COMPRESSEDDATA, ENTRY_WAITCLEANER, ENTRY_SPACECHECK):
+            if k in e and not verify.yes_no(e[k]):
+                raise ConfigfileError(
+                    'Backup entry "{}": Key "{}" must be either "yes" or "no"!'.format(name, k))
+        for k in (ENTRY_KEEPHOURLY, ENTRY_KEEPDAILY, ENTRY_KEEPWEEKLY, ENTRY_KEEPMONTHLY, ENTRY_KEEPYEARLY):
+            if k in e:
+                try:
+                    valid = verify.keep_count(int(e[k]))
+                except ValueError:
+                    valid = False
+                if not valid:
+                    raise ConfigfileError(
+                        'Backup entry "{}": Key "{}" has an invalid value!'.format(name, k))
+        if ENTRY_SCHEDULE in e and not verify.schedule(e[ENTRY_SCHEDULE]):
+            raise ConfigfileError(
+                'Backup entry "{}": Key "{}" has an invalid value!'.format(name, ENTRY_SCHEDULE))
+        if ENTRY_CRYPTFLAGS in e and not verify.crypt_flags(e[ENTRY_CRYPTFLAGS]):
+            raise ConfigfileError(
+                'Backup entry "{}": Key "{}" has an invalid value!'.format(name, ENTRY_CRYPTFLAGS))
+        if ENTRY_MOUNTOPTIONS in e and not verify.mount_options(e[ENTRY_MOUNTOPTIONS]):
+            raise ConfigfileError(
+                'Backup entry "{}": Key "{}" has an invalid value!'.format(name, ENTRY_MOUNTOPTIONS))
+        if ENTRY_SIZEBUDGET in e and not verify.size(e[ENTRY_SIZEBUDGET]):
+            raise ConfigfileError(
+                'Backup entry "{}": Key "{}" has an invalid value!'.format(name, ENTRY_SIZEBUDGET))
+        if ENTRY_NAMEFORMAT in e and not verify.name_format(e[ENTRY_NAMEFORMAT]):
+            raise ConfigfileError(
+                'Backup entry "{}": Key "{}" must be one of {}!'.format(
+                    name, ENTRY_NAMEFORMAT, ', '.join(verify.NAME_FORMATS)))
+        if ENTRY_SENDPROTOCOL in e:
+            try:
+                valid = verify.send_protocol(int(e[ENTRY_SENDPROTOCOL]))
+            except ValueError:
+                valid = False
+            if not valid:
+                raise ConfigfileError(
+                    'Backup entry "{}": Key "{}" has an invalid value!'.format(name, ENTRY_SENDPROTOCOL))
+        if ENTRY_CLONESOURCES in e:
+            try:
+                valid = verify.clone_source_count(int(e[ENTRY_CLONESOURCES]))
+            except ValueError:
+                valid = False
+            if not valid:
+                raise ConfigfileError(
+                    'Backup entry "{}": Key "{}" has an invalid value!'.format(name, ENTRY_CLONESOURCES))
         if ENTRY_TARGETDIR in e:
             try:
                 verify.requireRelativePath(Path(e[ENTRY_TARGETDIR]))
@@ -233,6 +330,82 @@ Configuration file location: \"{}\"""".format(globalstuff.config_backups))
                 else:
                     raise ConfigfileError(
                         ERR_INVALID_VALUE.format(sectionName, k, v))
+            elif k == GLOBAL_JOBS:
+                try:
+                    jobs = int(v)
+                except ValueError:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+                if verify.job_count(jobs):
+                    globalstuff.parallel_jobs = jobs
+                else:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+            elif k == GLOBAL_RELAY:
+                if not verify.yes_no(v):
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+                globalstuff.use_relay = v.lower() == 'yes'
+            elif k == GLOBAL_PIPESIZE:
+                try:
+                    size = int(v)
+                except ValueError:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+                if verify.pipe_size(size):
+                    globalstuff.pipe_size = size
+                else:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+            elif k == GLOBAL_PROGRESSINTERVAL:
+                try:
+                    seconds = int(v)
+                except ValueError:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+                if verify.progress_interval(seconds):
+                    globalstuff.progress_interval = seconds
+                else:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+            elif k == GLOBAL_SNAPSHOTCATALOG:
+                if not verify.yes_no(v):
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+                globalstuff.persistent_catalogs = v.lower() == 'yes'
+            elif k == GLOBAL_DELETEWORKERS:
+                try:
+                    workers = int(v)
+                except ValueError:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+                if verify.job_count(workers):
+                    globalstuff.delete_workers = workers
+                else:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+            elif k == GLOBAL_KEEPWARM:
+                try:
+                    seconds = int(v)
+                except ValueError:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+                if verify.keep_warm(seconds):
+                    globalstuff.keep_warm = seconds
+                else:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+            elif k == GLOBAL_VOLUMEKEYTTL:
+                try:
+                    seconds = int(v)
+                except ValueError:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
+                if verify.volume_key_ttl(seconds):
+                    globalstuff.volume_key_ttl = seconds
+                else:
+                    raise ConfigfileError(
+                        ERR_INVALID_VALUE.format(sectionName, k, v))
             else:
                 raise ConfigfileError(ERR_UNKNOWN_KEY.format(k))
 
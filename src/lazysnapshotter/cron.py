@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Cron-like schedules for backup entries"""
+
+from datetime import datetime, timedelta
+
+# name, lowest and highest value of the five fields of a schedule, see crontab(5)
+FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day of month', 1, 31), ('month', 1, 12), ('day of week', 0, 7))
+ALIASES = {'@hourly': '0 * * * *', '@daily': '0 0 * * *', '@midnight': '0 0 * * *', '@weekly': '0 0 * * 0',
+           '@monthly': '0 0 1 * *', '@yearly': '0 0 1 1 *', '@annually': '0 0 1 1 *'}
+MAX_YEARS = 8  # a schedule that does not match within this many years never matches, e.g. February 30th
+
+
+class ScheduleError(Exception):
+    pass
+
+
+def _parse_field(text: str, name: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in text.split(','):
+        rng, sep, step = part.partition('/')
+        try:
+            step = int(step) if sep else 1
+            if rng == '*':
+                first, last = low, high
+            elif '-' in rng:
+                first, last = (int(x) for x in rng.split('-', 1))
+            else:
+                first = int(rng)
+                last = high if sep else first
+        except ValueError:
+            raise ScheduleError(f'Invalid {name} "{part}"')
+        if step < 1 or not low <= first <= last <= high:
+            raise ScheduleError(f'Invalid {name} "{part}"')
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
+
+
+class Schedule:
+    """A schedule in the five field format of crontab(5) or one of its @ aliases.
+    Fields are lists of values, ranges and steps, names of months and weekdays are not supported."""
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        fields = ALIASES.get(expr.strip().lower(), expr).split()
+        if len(fields) != len(FIELDS):
+            raise ScheduleError(f'"{expr}" does not have {len(FIELDS)} fields')
+        parsed = [_parse_field(t, *f) for t, f in zip(fields, FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = frozenset(d % 7 for d in weekdays)  # 0 and 7 are Sunday
+        # if both days of month and days of week are restricted, a day matching either of them matches
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def __repr__(self):
+        return f'Schedule("{self.expr}")'
+
+    def _day_matches(self, dt: datetime) -> bool:
+        mday = dt.day in self.days
+        wday = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return mday and wday
+        return mday or wday
+
+    def matches(self, dt: datetime) -> bool:
+        return dt.minute in self.minutes and dt.hour in self.hours and dt.month in self.months \
+            and self._day_matches(dt)
+
+    def next(self, after: datetime) -> datetime:
+        """Return the first point in time after after that matches the schedule"""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t.year + MAX_YEARS
+        while t.year <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ScheduleError(f'"{self.expr}" never matches')
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Resident scheduler that runs backup entries on their schedules and on request of clients.
+
+Clients talk to the daemon through a Unix socket. A request and its response are JSON objects
+that are sent as a single line each. Valid requests are:
+    {"action": "run", "names": [...], "all": false, "jobs": null, "nounmount": false, "keyfile": null}
+    {"action": "status"}
+    {"action": "reload"}"""
+
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from . import backuputil, catalog, cmdline, configfile, cron, globalstuff, pool, probe
+
+logger = logging.getLogger(__name__)
+
+MAX_SLEEP = 60  # seconds between two checks of the configuration file
+MAX_REQUEST = 1 << 20
+
+
+class DaemonError(Exception):
+    pass
+
+
+class Daemon:
+
+    def __init__(self, config_path: Path, socket_path: Path):
+        self.config_path = config_path
+        self.socket_path = socket_path
+        self._config = None
+        self._mtime = None
+        self._schedules = dict()  # maps entry names to their schedules
+        self._next = dict()  # maps entry names to the next time they are due
+        self._pending = set()  # entries that are queued or running
+        self._lock = threading.Lock()
+        # batches run one after another, so that no drive is armed by two batches at the same time
+        self._runner = ThreadPoolExecutor(max_workers=1)
+        self._stop = threading.Event()
+
+    def reload(self, force=False) -> bool:
+        """Read the configuration file again if it changed, return True if it was read"""
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if not force and self._config is not None and mtime == self._mtime:
+            return False
+        cf = configfile.Configfile(self.config_path)
+        cf.read()
+        cf.loadGlobals()
+        schedules = dict()
+        now = datetime.now()
+        for name, e in cf.getConfigEntries().items():
+            if configfile.ENTRY_SCHEDULE in e:
+                # a bad schedule only disables its own entry
+                try:
+                    s = cron.Schedule(e[configfile.ENTRY_SCHEDULE])
+                    s.next(now)
+                except cron.ScheduleError as err:
+                    logger.error('Backup "%s" is not scheduled: %s', name, err)
+                    continue
+                schedules[name] = s
+        with self._lock:
+            self._config = cf
+            self._mtime = mtime
+            for name in list(self._next):
+                if name not in schedules:
+                    del self._next[name]
+            for name, s in schedules.items():
+                old = self._schedules.get(name)
+                if old is None or old.expr != s.expr:
+                    self._next[name] = s.next(now)
+            self._schedules = schedules
+        logger.info('Loaded configuration file "%s", %d backups are scheduled', self.config_path, len(schedules))
+        return True
+
+    def _reload_safe(self):
+        try:
+            self.reload()
+        except Exception as e:
+            logger.error('Could not reload configuration file "%s", keeping the old one: %s',
+                         self.config_path, e, exc_info=globalstuff.debug_mode)
+            self._mtime = None
+
+    def submit(self, names, data: dict, jobs=None):
+        """Queue a batch of backup entries, return a future of a dict that maps failed entries to error strings.
+        Entries that are already queued or running are skipped."""
+        with self._lock:
+            skipped = [n for n in names if n in self._pending]
+            names = [n for n in names if n not in self._pending]
+            self._pending.update(names)
+            cf = self._config
+        for n in skipped:
+            logger.warning('Backup "%s" is already queued, skipping it', n)
+        return self._runner.submit(self._run_batch, cf, names, data, jobs)
+
+    def _run_batch(self, cf, names, data, jobs) -> dict:
+        failed = dict()
+        try:
+            # devices may have been opened, mounted or unplugged since the last batch
+            probe.invalidate()
+            entries = list()
+            for n in names:
+                try:
+                    entries.append(backuputil.create_backup_entry(cf, data, n))
+                except Exception as e:
+                    logger.critical('Backup "%s" failed: %s', n, e, exc_info=globalstuff.debug_mode)
+                    failed[n] = str(e)
+            if len(entries) > 0:
+                if jobs is None:
+                    jobs = globalstuff.parallel_jobs
+                for n, e in pool.run_entries(entries, jobs).items():
+                    failed[n] = str(e)
+        finally:
+            with self._lock:
+                self._pending.difference_update(names)
+        return failed
+
+    def _due(self, now: datetime) -> list:
+        """Return the entries that are due and schedule their next run"""
+        due = list()
+        with self._lock:
+            for name, t in self._next.items():
+                if t <= now:
+                    due.append(name)
+                    self._next[name] = self._schedules[name].next(now)
+        return due
+
+    def _timeout(self, now: datetime) -> float:
+        with self._lock:
+            if len(self._next) == 0:
+                return MAX_SLEEP
+            return min(MAX_SLEEP, max(0, (min(self._next.values()) - now).total_seconds()))
+
+    def status(self) -> dict:
+        with self._lock:
+            return {'pending': sorted(self._pending),
+                    'scheduled': {n: t.isoformat() for n, t in sorted(self._next.items())}}
+
+    def _handle(self, conn: socket.socket):
+        try:
+            with conn, conn.makefile('rw') as f:
+                try:
+                    request = json.loads(f.readline(MAX_REQUEST))
+                    response = self._dispatch(request)
+                except Exception as e:
+                    logger.error('Invalid request: %s', e, exc_info=globalstuff.debug_mode)
+                    response = {'error': str(e)}
+                f.write(json.dumps(response) + '\n')
+        except OSError as e:
+            logger.warning('Lost connection to client: %s', e)
+
+    def _dispatch(self, request: dict) -> dict:
+        action = request.get('action')
+        if action == 'status':
+            return self.status()
+        if action == 'reload':
+            self.reload(force=True)
+            return self.status()
+        if action == 'run':
+            with self._lock:
+                cf = self._config
+            names = request.get('names', list())
+            if request.get('all', False):
+                names = list(cf.getConfigEntries())
+            data = {cmdline.ARG_NOUMOUNT: bool(request.get('nounmount', False)),
+                    cmdline.ARG_KEYFILE: None if request.get('keyfile') is None else Path(request['keyfile'])}
+            return {'failed': self.submit(names, data, request.get('jobs')).result()}
+        raise DaemonError(f'Unknown action "{action}"')
+
+    def _listen(self) -> socket.socket:
+        if self.socket_path.exists():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                    s.connect(str(self.socket_path))
+                raise DaemonError(f'A daemon is already listening on "{self.socket_path}"')
+            except ConnectionRefusedError:
+                self.socket_path.unlink()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old = os.umask(0o077)
+        try:
+            sock.bind(str(self.socket_path))
+        finally:
+            os.umask(old)
+        sock.listen()
+        sock.setblocking(False)
+        return sock
+
+    def stop(self):
+        self._stop.set()
+
+    def serve(self):
+        """Run scheduled entries and serve clients until SIGTERM or SIGINT is received"""
+        self.reload()
+        catalog.keep_in_memory()
+        sock = self._listen()
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_w.setblocking(False)
+        old_fd = signal.set_wakeup_fd(wakeup_w.fileno())
+        handlers = {s: signal.signal(s, lambda *args: self.stop()) for s in (signal.SIGTERM, signal.SIGINT)}
+        sel = selectors.DefaultSelector()
+        sel.register(sock, selectors.EVENT_READ)
+        sel.register(wakeup_r, selectors.EVENT_READ)
+        logger.info('Listening on "%s"', self.socket_path)
+        try:
+            while not self._stop.is_set():
+                self._reload_safe()
+                now = datetime.now()
+                due = self._due(now)
+                if len(due) > 0:
+                    logger.info('Running scheduled backups: %s', ', '.join(due))
+                    self.submit(due, {cmdline.ARG_NOUMOUNT: False, cmdline.ARG_KEYFILE: None})
+                for key, events in sel.select(self._timeout(datetime.now())):
+                    if key.fileobj is sock:
+                        try:
+                            conn, addr = sock.accept()
+                        except BlockingIOError:
+                            continue
+                        conn.setblocking(True)
+                        threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+                    else:
+                        wakeup_r.recv(4096)
+        finally:
+            logger.info('Shutting down, waiting for running backups')
+            sel.close()
+            for s, h in handlers.items():
+                signal.signal(s, h)
+            signal.set_wakeup_fd(old_fd)
+            wakeup_r.close()
+            wakeup_w.close()
+            sock.close()
+            self.socket_path.unlink(missing_ok=True)
+            self._runner.shutdown(wait=True)
+
+
+def request(socket_path: Path, message: dict) -> dict:
+    """Send message to the daemon listening on socket_path and return its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError):
+            raise DaemonError(f'No daemon is listening on "{socket_path}"')
+        with s.makefile('rw') as f:
+            f.write(json.dumps(message) + '\n')
+            f.flush()
+            response = json.loads(f.readline())
+    if 'error' in response:
+        raise DaemonError(response['error'])
+    return response
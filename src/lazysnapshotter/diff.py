@@ -15,20 +15,83 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see https://www.gnu.org/licenses.
 
+import asyncio
 import logging
 import os
 import shutil
 import subprocess
+from functools import lru_cache
 from pathlib import Path
 
+from . import globalstuff, relay
+from .progress import Progress, proc_io_counter
+
 logger = logging.getLogger(__name__)
 
+FLAG_PROTO = '--proto'
+FLAG_COMPRESSED = '--compressed-data'
+
+
+@lru_cache(maxsize=None)
+def send_features() -> tuple:
+    """Returns a tuple (flags, stream version): flags is the set of the optional btrfs-send flags
+    "--proto" and "--compressed-data" that are supported by the installed btrfs-progs,
+    stream version is the highest send stream version the kernel supports."""
+    res = subprocess.run([shutil.which('btrfs'), 'send', '--help'],
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    text = bytes.decode(res.stdout, errors='replace')
+    flags = frozenset(f for f in (FLAG_PROTO, FLAG_COMPRESSED) if f in text)
+    version = 1
+    try:
+        with open('/sys/fs/btrfs/features/send_stream_version', 'r') as f:
+            version = int(f.read().strip())
+    except (OSError, ValueError):
+        pass
+    logger.debug('btrfs-send supports the flags %s, the kernel supports send stream version %d',
+                 sorted(flags), version)
+    return (flags, version)
+
+
+def _protocol_options(protocol: int, compressed: bool) -> list:
+    """Returns the btrfs-send arguments for the requested protocol version and compression mode,
+    falls back to the default protocol if btrfs-progs or the kernel lack support."""
+    if protocol is None and not compressed:
+        return []
+    flags, version = send_features()
+    if compressed:
+        if FLAG_COMPRESSED not in flags or version < 2:
+            logger.warning(
+                'Sending compressed data is not supported, sending uncompressed data')
+            compressed = False
+        elif protocol is None or protocol < 2:
+            protocol = 2
+    if protocol is None:
+        return []
+    if FLAG_PROTO not in flags:
+        logger.warning(
+            'btrfs-send does not support "%s", using its default protocol', FLAG_PROTO)
+        return []
+    if protocol > version:
+        logger.warning('The kernel does not support send protocol version %d, using version %d',
+                       protocol, version)
+        protocol = version
+    cmd = [FLAG_PROTO, str(protocol)]
+    if compressed:
+        cmd.append(FLAG_COMPRESSED)
+    return cmd
+
 
-def _send_command(src: Path, parent: Path):
+def _send_command(src: Path, parent: Path, clone_sources: list = None, protocol: int = None,
+                  compressed: bool = False):
     cmd = [shutil.which('btrfs'), 'send']
+    cmd.extend(_protocol_options(protocol, compressed))
     if parent is not None:
         cmd.append('-p')
         cmd.append(str(parent))
+    if clone_sources is not None:
+        for c in clone_sources:
+            cmd.append('-c')
+            cmd.append(str(c))
     cmd.append(str(src))
     return cmd
 
@@ -37,39 +100,131 @@ def _receive_command(dst: Path):
     return [shutil.which('btrfs'), 'receive', '-e', str(dst)]
 
 
-def snapshot_diff(src: Path, dst: Path, parent: Path):
-    """Handles btrfs-send and btrfs-receive, designed to be used as a higher-order function in transact.send()"""
+def pipeline(producer: list, consumer: list, use_relay: bool = False, pipe_size: int = None,
+             progress: Progress = None, procs: list = None) -> int:
+    """Run the commands producer and consumer, connected by a pipe from producer's stdout to consumer's stdin.
+    If use_relay is True, two pipes are used and the data is spliced from one to the other by a relay thread.
+    pipe_size sets the buffer size of the pipes in bytes, None keeps the system's default.
+    The transfer is counted by the relay or, without relay, by the bytes the consumer has read according to /proc.
+    If progress is given, it will be fed with that count.
+    procs receives the Popen objects as soon as they are started, so that another thread may kill them.
+    Returns the amount of transferred bytes."""
+    if procs is None:
+        procs = list()
+    fds = list()
+    relay_thread = None
+    counter = None
+    success = False
     try:
-        procs = None
-        # setup pipe
-        pipe = os.pipe()
-        pread = pipe[0]
-        pwrite = pipe[1]
-        os.set_inheritable(pread, True)
-        os.set_inheritable(pwrite, True)
+        # setup pipes
+        if use_relay:
+            src_read, src_write = relay.make_pipe(pipe_size)
+            fds.extend((src_read, src_write))
+            dst_read, dst_write = relay.make_pipe(pipe_size)
+            fds.extend((dst_read, dst_write))
+        else:
+            dst_read, src_write = relay.make_pipe(pipe_size)
+            fds.extend((dst_read, src_write))
 
         # initialize subprocesses
-        procs = [subprocess.Popen(_send_command(src, parent), stdout=pwrite, close_fds=False),
-                 subprocess.Popen(_receive_command(dst), stdin=pread, close_fds=False)]
+        procs.append(subprocess.Popen(producer, stdout=src_write))
+        procs.append(subprocess.Popen(consumer, stdin=dst_read))
+        os.close(src_write)
+        fds.remove(src_write)
+        os.close(dst_read)
+        fds.remove(dst_read)
+        if use_relay:
+            relay_thread = relay.Relay(src_read, dst_write, pipe_size or relay.DEFAULT_CHUNK)
+            fds.remove(src_read)
+            fds.remove(dst_write)
+            relay_thread.start()
+        if relay_thread is not None:
+            counter = lambda: relay_thread.transferred
+        else:
+            counter = proc_io_counter(procs[1].pid)
+        if progress is not None:
+            progress.attach(counter)
 
         # wait for subprocesses to finish
-        for p in procs:
-            p.wait()
+        procs[0].wait()
+        if relay_thread is None:
+            # read the final count while the consumer is a zombie that has not been reaped yet
+            os.waitid(os.P_PID, procs[1].pid, os.WEXITED | os.WNOWAIT)
+            transferred = counter()
+        procs[1].wait()
+        if relay_thread is not None:
+            relay_thread.join()
 
         # evaluate return values
         for p in procs:
             if p.returncode != 0:
                 raise SubprocessError(
                     'Subprocess returned code {}: {}'.format(p.returncode, str(p)))
+        if relay_thread is not None:
+            relay_thread.check()
+        success = True
+        if relay_thread is not None:
+            return relay_thread.transferred
+        return transferred
 
-    except Exception as e:
+    except BaseException as e:
         for p in procs:
-            logger.critical('Killing subprocess: {}'.format(str(p)))
-            p.kill()
+            if p.poll() is None:
+                logger.critical('Killing subprocess: {}'.format(str(p)))
+                p.kill()
+                p.wait()
+        if relay_thread is not None and relay_thread.is_alive():
+            relay_thread.join()
         raise e
     finally:
-        os.close(pipe[0])
-        os.close(pipe[1])
+        for fd in fds:
+            os.close(fd)
+        if progress is not None:
+            progress.finish(success)
+
+
+async def pipeline_async(producer: list, consumer: list, use_relay: bool = False, pipe_size: int = None,
+                         progress: Progress = None) -> int:
+    """Coroutine version of pipeline(). The pipeline runs in a worker thread, because its final byte count is read
+    from the consumer before it is reaped, which asyncio's child watcher does not allow.
+    If the awaiting task is cancelled, both processes are killed and the worker thread is waited for."""
+    procs = list()
+    task = asyncio.ensure_future(asyncio.to_thread(
+        pipeline, producer, consumer, use_relay, pipe_size, progress, procs))
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        for p in list(procs):
+            if p.poll() is None:
+                logger.critical('Killing subprocess: {}'.format(str(p)))
+                p.kill()
+        await asyncio.gather(task, return_exceptions=True)
+        raise
+
+
+def snapshot_diff(src: Path, dst: Path, parent: Path, use_relay: bool = None, pipe_size: int = None,
+                  progress: Progress = None, clone_sources: list = None, protocol: int = None,
+                  compressed: bool = False):
+    """Handles btrfs-send and btrfs-receive, designed to be used as a higher-order function in transact.send().
+    use_relay and pipe_size default to their global settings, see pipeline().
+    progress optionally reports the transfer while it is running.
+    clone_sources are additional snapshots that exist on both sides and may share data with src.
+    protocol selects the send stream version, None uses btrfs-send's default. If compressed is True,
+    compressed extents are sent without decompressing them, this requires protocol version 2.
+    Returns the size of the send stream in bytes."""
+    if use_relay is None:
+        use_relay = globalstuff.use_relay
+    if pipe_size is None:
+        pipe_size = globalstuff.pipe_size
+    if use_relay and not relay.available():
+        logger.warning('splice() is not available, sending without relay')
+        use_relay = False
+    transferred = pipeline(_send_command(src, parent, clone_sources, protocol, compressed),
+                           _receive_command(dst),
+                           use_relay, pipe_size, progress)
+    if transferred is not None and progress is None:
+        logger.info('Transferred %d bytes', transferred)
+    return transferred
 
 
 class SubprocessError(Exception):
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Share an armed backup drive between all backup entries that target it"""
+
+import logging
+import os
+import threading
+from uuid import uuid4
+
+import btrfsutil
+
+from . import globalstuff, keepwarm, mounts, sessionkit
+
+logger = logging.getLogger(__name__)
+
+
+class DriveSession:
+    """Reference counted access to a backup drive.
+    The drive is armed by the first call to acquire(), it is synced and disarmed
+    as soon as the last reference has been released. Using the session as a context
+    manager holds a reference without arming the drive, so that the drive stays armed
+    between backups that are run one after another.
+    If globalstuff.keep_warm is set, the drive is armed at a mount point that is shared between
+    program runs and is disarmed by a watchdog process after it has been idle for keep_warm seconds."""
+
+    def __init__(self, volume):
+        self.volume = volume  # block device or UUID of the backup partition
+        self.session_id = uuid4()  # names the mount point and the LUKS mapping
+        self._dev = None
+        self._refs = 0
+        self._keep_online = False
+        self._dirty = False  # true if the drive has to be synced before it is disarmed
+        self._lease = None  # keep-warm lease of the drive, None if keep-warm is disabled
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'DriveSession("{self.volume}",{self._refs},{self._dev})'
+
+    def __enter__(self):
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.release()
+
+    def acquire(self, keyfile=None, unmount=True, mount_options: str = None, crypt_flags=None) -> mounts.Device:
+        """Add a reference and return the armed device, arm the device if necessary.
+        If unmount is False for any reference, the drive will not be disarmed.
+        mount_options and crypt_flags are only applied by the reference that arms the drive."""
+        with self._lock:
+            if not unmount:
+                self._keep_online = True
+            if self._dev is None and globalstuff.keep_warm > 0:
+                self._dev = self._acquireWarm(keyfile, mount_options, crypt_flags)
+            elif self._dev is None:
+                dev = mounts.device_by_state(self.volume)
+                mount_point = sessionkit.session.getMountDir(create_parent=True, mkdir=True, name=str(self.session_id))
+                try:
+                    logger.info('Arming backup drive')
+                    dev.arm(mount_point, luks_name=str(self.session_id), keyfile=keyfile, options=mount_options,
+                            crypt_flags=crypt_flags)
+                except Exception as e:
+                    self._disarm(dev)
+                    # the next reference retries arming with a fresh mount point
+                    try:
+                        os.rmdir(mount_point)
+                    except OSError as err:
+                        logger.warning('Could not remove mount point "%s": %s', mount_point, err)
+                    raise e
+                self._dev = dev
+            else:
+                logger.info('Backup drive is already armed by this session')
+            self._refs += 1
+            logger.debug('Acquired %s', self)
+            return self._dev
+
+    def _acquireWarm(self, keyfile, mount_options, crypt_flags) -> mounts.Device:
+        """Attach to the warm drive or arm it at the shared mount point and take a shared lock on its lease"""
+        lease = keepwarm.Lease(sessionkit.session.rpm.getDirectory('warm', create=True),
+                               keepwarm.lease_name(self.volume))
+        lease.lock()
+        try:
+            state = lease.read()
+            armed = state is not None and state['armed']
+            dev = mounts.device_by_state(self.volume)
+            if dev.isMounted():
+                logger.info('Attaching to backup drive mounted at "%s"', dev.mountPoint())
+            else:
+                mount_point = sessionkit.session.getMountDir(create_parent=True, name=lease.name)
+                if not mount_point.exists():
+                    mount_point.mkdir(mode=0o755)
+                try:
+                    logger.info('Arming backup drive')
+                    dev.arm(mount_point, luks_name=lease.name, keyfile=keyfile, options=mount_options,
+                            crypt_flags=crypt_flags)
+                except Exception as e:
+                    dev.disarm()
+                    raise e
+                armed = True
+            lease.extend(self.volume, dev.mountPoint(), armed, globalstuff.keep_warm)
+            lease.lock(shared=True)
+        except Exception as e:
+            lease.unlock()
+            raise e
+        self._lease = lease
+        return dev
+
+    def _releaseWarm(self, dev):
+        """Restart the idle period of the warm drive and leave disarming it to the watchdog"""
+        lease = self._lease
+        self._lease = None
+        try:
+            # the deadline is extended before the shared lock is dropped, a watchdog that gets the lock
+            # in between must not find the deadline of the acquisition, which a long run has long passed
+            state = lease.read()
+            armed = state is not None and state['armed'] and not self._keep_online
+            lease.extend(self.volume, dev.mountPoint(), armed, globalstuff.keep_warm)
+        finally:
+            lease.unlock()
+        if armed:
+            logger.info('Backup drive stays armed for %d seconds', globalstuff.keep_warm)
+            lease.start_watchdog()
+        elif self._keep_online:
+            logger.info('Backup drive stays online through user request')
+
+    def touch(self):
+        """Mark the drive as modified, so it will be synced before it is disarmed."""
+        self._dirty = True
+
+    def release(self):
+        """Drop a reference, sync and disarm the drive if it was the last one."""
+        with self._lock:
+            if self._refs < 1:
+                raise globalstuff.Bug(
+                    'Released a drive session without references')
+            self._refs -= 1
+            logger.debug('Released %s', self)
+            if self._refs > 0 or self._dev is None:
+                return
+            dev = self._dev
+            self._dev = None
+            try:
+                if self._dirty:
+                    logger.info('Syncing backup drive')
+                    trans_id = btrfsutil.start_sync(dev.mountPoint())
+                    btrfsutil.wait_sync(dev.mountPoint(), trans_id)
+                    self._dirty = False
+                else:
+                    logger.debug('Backup drive was not modified, skipping sync')
+            finally:
+                if self._lease is not None:
+                    self._releaseWarm(dev)
+                else:
+                    self._disarm(dev)
+
+    def _disarm(self, dev):
+        if self._keep_online:
+            logger.info('Backup drive stays online through user request')
+        else:
+            logger.info('Disarming backup drive')
+            dev.disarm()
@@ -24,6 +24,15 @@ config_backups = Path('/etc/lazysnapshotter/backups.conf')
 debug_mode = False
 default_snapshots = 2
 max_snapshots = sys.maxsize - 1
+parallel_jobs = 4  # amount of backup jobs that may run at the same time
+max_jobs = 256
+use_relay = False  # splice the send stream through a relay thread
+pipe_size = None  # buffer size of the send/receive pipes in bytes, None for the system's default
+progress_interval = 60  # seconds between two progress reports, 0 disables them
+delete_workers = 4  # amount of subvolume deletions that may run at the same time
+persistent_catalogs = False  # store snapshot catalogs inside the snapshot directories
+keep_warm = 0  # seconds that a backup drive stays armed after its last use, 0 disarms it immediately
+volume_key_ttl = 0  # seconds that unlocked LUKS volume keys stay in the kernel keyring, 0 disables caching
 
 
 class Bug(Exception):
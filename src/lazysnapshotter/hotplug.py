@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Run the backups of a backup drive as soon as it is plugged in"""
+
+import logging
+import os
+import selectors
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import backuputil, cmdline, configfile, globalstuff, inotify, pool, probe, verify
+
+logger = logging.getLogger(__name__)
+
+BY_UUID = Path('/dev/disk/by-uuid')
+APPEAR = inotify.IN_CREATE | inotify.IN_MOVED_TO
+DISAPPEAR = inotify.IN_DELETE | inotify.IN_MOVED_FROM
+
+
+def entries_by_uuid(cf) -> dict:
+    """Map the lower case UUIDs of all backup devices that are given as UUID to the names of their entries"""
+    res = dict()
+    for name, e in cf.getConfigEntries().items():
+        dev = e.get(configfile.ENTRY_TARGET)
+        if dev is not None and verify.uuid(dev.lower()):
+            res.setdefault(dev.lower(), list()).append(name)
+    return res
+
+
+class Watcher:
+    """Watch /dev/disk/by-uuid and run all entries of a backup drive when its UUID appears.
+    udev replaces existing links on change events, so a UUID only counts as new if it
+    was absent before. The configuration file is read again on every appearance.
+    The backups of the appeared drives run one drive after another, drives may share snapshot directories."""
+
+    def __init__(self, config_path: Path, jobs: int = None, directory: Path = BY_UUID):
+        self.config_path = config_path
+        self.jobs = jobs
+        self.directory = directory
+        self._present = set()
+        self._running = set()  # UUIDs whose backups are queued or running
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # a single runner, so that no two jobs use the same snapshot directory at the same time
+        self._runner = ThreadPoolExecutor(max_workers=1)
+
+    def _load(self):
+        cf = configfile.Configfile(self.config_path)
+        cf.read()
+        cf.loadGlobals()
+        return cf
+
+    def appeared(self, uuid: str):
+        """Run every entry that targets the drive with UUID uuid"""
+        try:
+            # the drive's mappings and mounts may have changed since the last backups
+            probe.invalidate()
+            cf = self._load()
+            names = entries_by_uuid(cf).get(uuid, list())
+            if len(names) == 0:
+                return
+            logger.info('Backup drive "%s" appeared, running %s', uuid, ', '.join(names))
+            data = {cmdline.ARG_NOUMOUNT: False, cmdline.ARG_KEYFILE: None}
+            entries = [backuputil.create_backup_entry(cf, data, n) for n in names]
+            jobs = self.jobs if self.jobs is not None else globalstuff.parallel_jobs
+            # all entries share the drive, so pool runs them in a single drive session
+            failed = pool.run_entries(entries, jobs)
+            if len(failed) > 0:
+                logger.error('%d of %d backups failed: %s', len(failed), len(entries), ', '.join(failed))
+        except Exception as e:
+            logger.critical('Backups of drive "%s" failed: %s', uuid, e, exc_info=globalstuff.debug_mode)
+        finally:
+            with self._lock:
+                self._running.discard(uuid)
+
+    def handle(self, events) -> list:
+        """Update the set of present UUIDs from inotify events, return the UUIDs that appeared"""
+        appeared = list()
+        for wd, mask, name in events:
+            if mask & inotify.IN_Q_OVERFLOW:
+                logger.warning('Missed device events, rereading "%s"', self.directory)
+                present = self._scan()
+                appeared.extend(sorted(present - self._present))
+                self._present = present
+                continue
+            uuid = name.lower()
+            if mask & DISAPPEAR:
+                self._present.discard(uuid)
+            elif mask & APPEAR and uuid not in self._present:
+                self._present.add(uuid)
+                appeared.append(uuid)
+        return appeared
+
+    def submit(self, uuid: str) -> bool:
+        """Queue the backups of the drive with UUID uuid, return False if they are already queued or running"""
+        with self._lock:
+            if uuid in self._running:
+                return False
+            self._running.add(uuid)
+        self._runner.submit(self.appeared, uuid)
+        return True
+
+    def _scan(self) -> set:
+        return set(n.lower() for n in os.listdir(self.directory))
+
+    def stop(self):
+        self._stop.set()
+
+    def serve(self):
+        """Wait for backup drives until SIGTERM or SIGINT is received"""
+        self._load()
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_w.setblocking(False)
+        old_fd = signal.set_wakeup_fd(wakeup_w.fileno())
+        handlers = {s: signal.signal(s, lambda *args: self.stop()) for s in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            with inotify.Inotify() as ino, selectors.DefaultSelector() as sel:
+                ino.add_watch(self.directory, APPEAR | DISAPPEAR | inotify.IN_ONLYDIR)
+                self._present = self._scan()
+                sel.register(ino, selectors.EVENT_READ)
+                sel.register(wakeup_r, selectors.EVENT_READ)
+                logger.info('Waiting for backup drives in "%s"', self.directory)
+                while not self._stop.is_set():
+                    for key, events in sel.select():
+                        if key.fileobj is not ino:
+                            wakeup_r.recv(4096)
+                            continue
+                        for uuid in self.handle(ino.read()):
+                            self.submit(uuid)
+        finally:
+            logger.info('Shutting down, waiting for running backups')
+            for s, h in handlers.items():
+                signal.signal(s, h)
+            signal.set_wakeup_fd(old_fd)
+            wakeup_r.close()
+            wakeup_w.close()
+            self._runner.shutdown(wait=True)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Python bindings for inotify(7)"""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_EVENT = struct.Struct('iIII')  # struct inotify_event without its name
+_libc = None
+
+
+class InotifyError(Exception):
+    pass
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = (ctypes.c_int,)
+        libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        _libc = libc
+    return _libc
+
+
+def parse_events(buf: bytes) -> list:
+    """Split the data read from an inotify file descriptor into tuples (wd, mask, name)"""
+    events = list()
+    offset = 0
+    while offset + _EVENT.size <= len(buf):
+        wd, mask, cookie, length = _EVENT.unpack_from(buf, offset)
+        offset += _EVENT.size
+        name = buf[offset:offset + length].split(b'\0', 1)[0]
+        offset += length
+        events.append((wd, mask, os.fsdecode(name)))
+    return events
+
+
+class Inotify:
+    """An inotify instance, usable with select() through fileno()"""
+
+    def __init__(self):
+        self._fd = _get_libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise InotifyError(f'inotify_init1 failed: {os.strerror(err)}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def add_watch(self, path, mask: int) -> int:
+        """Watch path for the events in mask, return the watch descriptor"""
+        wd = _get_libc().inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise InotifyError(f'Cannot watch "{path}": {os.strerror(err)}')
+        return wd
+
+    def read(self) -> list:
+        """Return all pending events as tuples (wd, mask, name), an empty list if there are none"""
+        try:
+            return parse_events(os.read(self._fd, 65536))
+        except BlockingIOError:
+            return list()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Keep a backup drive armed between program runs and disarm it after an idle period.
+
+A warm drive is described by a lease that consists of a state file and a lock file inside the
+runtime directory. Runs that use the drive hold a shared lock on the lock file, the watchdog
+process needs an exclusive lock to disarm the drive, so it never disarms a drive that is in use."""
+
+import fcntl
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import logkit, mounts, verify
+
+logger = logging.getLogger(__name__)
+
+
+def lease_name(volume) -> str:
+    """Return the name of the lease of backup volume volume (UUID or Path).
+    It also names the shared mount point and the LUKS mapping of the warm drive."""
+    if verify.uuid(volume):
+        return 'warm-' + str(volume).lower()
+    digest = hashlib.sha256(str(Path(volume).resolve()).encode()).hexdigest()
+    return 'warm-' + digest[:32]
+
+
+class Lease:
+
+    def __init__(self, directory: Path, name: str):
+        self.name = name
+        self.statefile = directory / Path(name + '.json')
+        self.lockfile = directory / Path(name + '.lock')
+        self.watchdogfile = directory / Path(name + '.watchdog')
+        self._fd = None
+
+    def lock(self, shared=False):
+        """Lock the lease, converts an already held lock"""
+        if self._fd is None:
+            self._fd = os.open(self.lockfile, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+    def unlock(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @contextmanager
+    def exclusive(self):
+        self.lock()
+        try:
+            yield self
+        finally:
+            self.unlock()
+
+    def read(self) -> dict:
+        """Return the state of the lease or None if there is no warm drive"""
+        try:
+            with open(self.statefile, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write(self, state: dict):
+        # runs that share the lease may write at the same time, each through its own temporary file
+        tmp = self.statefile.with_name('{}.{}.tmp'.format(self.statefile.name, os.getpid()))
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.statefile)
+
+    def remove(self):
+        try:
+            self.statefile.unlink()
+        except FileNotFoundError:
+            pass
+
+    def extend(self, volume, mount_point: Path, armed: bool, idle: int):
+        """Record that the drive stays warm for idle seconds from now on"""
+        self.write({'volume': str(volume), 'mount_point': str(mount_point), 'armed': armed,
+                    'deadline': time.time() + idle})
+
+    def _watchdog_running(self) -> bool:
+        fd = os.open(self.watchdogfile, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+    def start_watchdog(self):
+        """Start a watchdog process for the lease unless one is already running"""
+        if self._watchdog_running():
+            return
+        # the watchdog has no terminal, it logs to the same files as this process or to syslog
+        level = logging.getLogger().getEffectiveLevel()
+        logfiles = list()
+        if logkit.log is not None:
+            logfiles = [h.baseFilename for h in logkit.log.handlers if isinstance(h, logging.FileHandler)]
+        subprocess.Popen([sys.executable, '-m', __name__, str(self.statefile.parent), self.name,
+                          logging.getLevelName(level)] + logfiles,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True, close_fds=True)
+        logger.debug('Started watchdog for warm drive "%s"', self.name)
+
+
+def watchdog(lease: Lease):
+    """Wait until the lease expired, then disarm the drive and remove the lease"""
+    while True:
+        fd = os.open(lease.watchdogfile, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another watchdog is responsible for the lease
+            logger.debug('Watching warm drive "%s"', lease.name)
+            while not _expire(lease):
+                pass
+        except Exception as e:
+            logger.critical('Could not disarm warm drive "%s": %s', lease.name, e, exc_info=True)
+            return
+        finally:
+            os.close(fd)
+        # a run that renewed the lease before the lock was released found this watchdog still running
+        # and did not start another one, so the renewed lease is watched again
+        if lease.read() is None:
+            return
+        logger.debug('Warm drive "%s" was armed again', lease.name)
+
+
+def _expire(lease: Lease) -> bool:
+    """Wait for the deadline of the lease, disarm the drive if it is still idle.
+    Return True if the lease is gone, False if it was extended in the meantime."""
+    state = lease.read()
+    if state is None:
+        return True
+    delay = state['deadline'] - time.time()
+    if delay > 0:
+        time.sleep(delay)
+        return False
+    with lease.exclusive():
+        state = lease.read()
+        if state is None:
+            return True
+        if state['deadline'] > time.time():
+            return False
+        if state['armed']:
+            logger.info('Disarming backup drive "%s" after its idle period', state['volume'])
+            mounts.device_by_state(state['volume']).disarm()
+            try:
+                os.rmdir(state['mount_point'])
+            except OSError:
+                pass
+        lease.remove()
+        return True
+
+
+def _setup_logging(level: str, logfiles: list):
+    logkit.log = logkit.LogKit(logkit.str_to_loglevel(level))
+    for f in logfiles:
+        logkit.log.addLogFile(Path(f))
+    if len(logfiles) == 0 and os.path.exists('/dev/log'):
+        handler = logging.handlers.SysLogHandler('/dev/log')
+        handler.setFormatter(logging.Formatter('lazysnapshotter[%(process)d]: %(levelname)s - %(message)s'))
+        logkit.log.rootlogger.addHandler(handler)
+        logkit.log.handlers.append(handler)
+
+
+if __name__ == '__main__':
+    _setup_logging(sys.argv[3], sys.argv[4:])
+    watchdog(Lease(Path(sys.argv[1]), sys.argv[2]))
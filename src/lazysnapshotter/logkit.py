@@ -17,6 +17,7 @@
 
 import logging
 import sys
+import threading
 from pathlib import Path
 
 from . import verify
@@ -24,39 +25,54 @@ from . import verify
 log = None
 
 
+class _ContextFilter(logging.Filter):
+    """Adds the format strings of the emitting thread to every log record"""
+
+    def __init__(self, kit):
+        super().__init__()
+        self.kit = kit
+
+    def filter(self, record):
+        ctx = ''
+        for v in self.kit.fmtstrs.values():
+            ctx = '{}, {}'.format(ctx, v)
+        record.lazycontext = ctx
+        return True
+
+
 class LogKit:
 
     datestr = '%Y-%m-%d %H:%M:%S'
-    prestr = '%(asctime)s: %(levelname)s'
+    prestr = '%(asctime)s: %(levelname)s%(lazycontext)s'
     poststr = '%(message)s'
 
     def __init__(self, loglevel):
-        self.fmtstrs = dict()
+        self._local = threading.local()
         self.handlers = list()
         self.loglevel_priority = 0
+        self.filter = _ContextFilter(self)
         self.formatter = logging.Formatter(fmt='{} - {}'.format(LogKit.prestr, LogKit.poststr),
                                            datefmt=LogKit.datestr, style='%')
         messagehandler = logging.StreamHandler(sys.stderr)
         messagehandler.setFormatter(self.formatter)
+        messagehandler.addFilter(self.filter)
         self.handlers.append(messagehandler)
         self.rootlogger = logging.getLogger()
         self.rootlogger.setLevel(loglevel)
         self.rootlogger.addHandler(messagehandler)
 
-    def _updateFormatter(self):
-        fstr = LogKit.prestr
-        for v in self.fmtstrs.values():
-            fstr = "{}, {}".format(fstr, v)
-        fstr = "{} - {}".format(fstr, LogKit.poststr)
-        self.formatter = logging.Formatter(
-            fmt=fstr, datefmt=LogKit.datestr, style='%')
-        for h in self.handlers:
-            h.setFormatter(self.formatter)
+    @property
+    def fmtstrs(self) -> dict:
+        """Format strings are kept per thread, so parallel backup jobs can be told apart in the log"""
+        if not hasattr(self._local, 'fmtstrs'):
+            self._local.fmtstrs = dict()
+        return self._local.fmtstrs
 
     def addLogFile(self, path: Path):
         verify.requireAbsolutePath(path)
         fh = logging.FileHandler(path)
         fh.setFormatter(self.formatter)
+        fh.addFilter(self.filter)
         self.rootlogger.addHandler(fh)
         self.handlers.append(fh)
 
@@ -67,7 +83,24 @@ class LogKit:
 
     def fmtAppend(self, key: str, value: str):
         self.fmtstrs[key] = value
-        self._updateFormatter()
+
+    def fmtRemove(self, key: str):
+        self.fmtstrs.pop(key, None)
+
+    def bind(self, func):
+        """Return a function that runs func with the calling thread's format strings,
+        so work handed to another thread is logged in the same context"""
+        fmtstrs = dict(self.fmtstrs)
+
+        def bound(*args, **kwargs):
+            for k, v in fmtstrs.items():
+                self.fmtAppend(k, v)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                for k in fmtstrs:
+                    self.fmtRemove(k)
+        return bound
 
 
 def str_to_loglevel(loglevel: str):
@@ -20,7 +20,7 @@ import sys
 import traceback
 from pathlib import Path
 
-from . import backup, backuputil, cmdline, configfile, globalstuff, logkit, sessionkit
+from . import backuputil, cmdline, configfile, daemon, globalstuff, hotplug, logkit, pool, sessionkit
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +56,40 @@ class NoActionDefinedException(Exception):
     pass
 
 
+def _runBackupsByDaemon(data) -> bool:
+    """Let the daemon run the backups requested on the command line, return False if at least one of them failed."""
+    keyfile = data[cmdline.ARG_KEYFILE]
+    res = daemon.request(sessionkit.session.rpm.getFile('socket'),
+                         {'action': 'run', 'names': data[cmdline.ARG_NAME], 'all': data[cmdline.ARG_ALL],
+                          'jobs': data[cmdline.ARG_JOBS], 'nounmount': data[cmdline.ARG_NOUMOUNT],
+                          'keyfile': None if keyfile is None else str(keyfile)})
+    failed = res['failed']
+    if len(failed) > 0:
+        for name, err in failed.items():
+            logger.error('Backup "%s" failed: %s', name, err)
+        return False
+    return True
+
+
+def _runBackups(cf, data) -> bool:
+    """Run all backup entries requested on the command line, return False if at least one of them failed."""
+    names = data[cmdline.ARG_NAME]
+    if data[cmdline.ARG_ALL]:
+        names = list(cf.getConfigEntries())
+    entries = [backuputil.create_backup_entry(cf, data, n) for n in names]
+    jobs = data[cmdline.ARG_JOBS]
+    if jobs is None:
+        jobs = globalstuff.parallel_jobs
+    failed = pool.run_entries(entries, jobs)
+    if len(failed) > 0:
+        logger.error('%d of %d backups failed: %s', len(failed),
+                     len(entries), ', '.join(failed))
+        return False
+    return True
+
+
 def main():
+    success = True
     try:
         # initialize global variables
         sessionkit.session = sessionkit.Session(Path('/run/lazysnapshotter'))
@@ -88,10 +121,25 @@ def main():
                     cf.printConfigEntry(e)
             else:
                 cf.printConfigEntries()
+        elif pcmd.action == cmdline.ACTION_RUN and pcmd.data[cmdline.ARG_DAEMON]:
+            success = _runBackupsByDaemon(pcmd.data)
+        elif pcmd.action == cmdline.ACTION_DAEMON:
+            try:
+                sessionkit.session.setup()
+                daemon.Daemon(globalstuff.config_backups,
+                              sessionkit.session.rpm.getFile('socket', create_dir=True)).serve()
+            finally:
+                sessionkit.session.cleanup()
+        elif pcmd.action == cmdline.ACTION_WATCH:
+            try:
+                sessionkit.session.setup()
+                hotplug.Watcher(globalstuff.config_backups, pcmd.data[cmdline.ARG_JOBS]).serve()
+            finally:
+                sessionkit.session.cleanup()
         elif pcmd.action == cmdline.ACTION_RUN:
             try:
                 sessionkit.session.setup()
-                backup.run(backuputil.create_backup_entry(cf, pcmd.data))
+                success = _runBackups(cf, pcmd.data)
             finally:
                 sessionkit.session.cleanup()
     except NoActionDefinedException:
@@ -103,3 +151,5 @@ def main():
         traceback.print_exc(file=sys.stderr)
     finally:
         logging.shutdown()
+    if not success:
+        sys.exit(1)
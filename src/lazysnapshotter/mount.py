@@ -17,9 +17,46 @@
 
 """Python bindings for mount() and umount()"""
 
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import subprocess
+import threading
 from pathlib import Path
 
-import subprocess
+from . import aioexec
+
+logger = logging.getLogger(__name__)
+
+# mount flags from <sys/mount.h>
+MS_RDONLY = 1
+MS_NOSUID = 2
+MS_NODEV = 4
+MS_NOEXEC = 8
+MS_SYNCHRONOUS = 16
+MS_DIRSYNC = 128
+MS_NOATIME = 1024
+MS_NODIRATIME = 2048
+MS_RELATIME = 1 << 21
+MS_STRICTATIME = 1 << 24
+MS_LAZYTIME = 1 << 25
+
+# maps generic mount options to tuples (flags to set, flags to clear), see mount(8)
+FLAG_OPTIONS = {'defaults': (0, 0), 'ro': (MS_RDONLY, 0), 'rw': (0, MS_RDONLY),
+                'nosuid': (MS_NOSUID, 0), 'suid': (0, MS_NOSUID), 'nodev': (MS_NODEV, 0), 'dev': (0, MS_NODEV),
+                'noexec': (MS_NOEXEC, 0), 'exec': (0, MS_NOEXEC), 'sync': (MS_SYNCHRONOUS, 0),
+                'async': (0, MS_SYNCHRONOUS), 'dirsync': (MS_DIRSYNC, 0),
+                'noatime': (MS_NOATIME, MS_RELATIME | MS_STRICTATIME),
+                'nodiratime': (MS_NODIRATIME, 0), 'diratime': (0, MS_NODIRATIME),
+                'relatime': (MS_RELATIME, MS_NOATIME | MS_STRICTATIME), 'norelatime': (0, MS_RELATIME),
+                'strictatime': (MS_STRICTATIME, MS_NOATIME | MS_RELATIME),
+                'atime': (0, MS_NOATIME), 'lazytime': (MS_LAZYTIME, 0), 'nolazytime': (0, MS_LAZYTIME)}
+
+_libc = None
+_libc_lock = threading.Lock()
 
 
 class MountError(Exception):
@@ -27,20 +64,90 @@ class MountError(Exception):
     pass
 
 
-def mount(source: Path, target: Path):
-    '''Mount source to target'''
-    cmd = ['mount']
-    cmd.append(str(source))
-    cmd.append(str(target))
+def _get_libc():
+    """Return the C library with mount() and umount2() or None if it cannot be loaded"""
+    global _libc
+    with _libc_lock:
+        if _libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                libc.mount.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p,
+                                       ctypes.c_ulong, ctypes.c_char_p)
+                libc.umount2.argtypes = (ctypes.c_char_p, ctypes.c_int)
+                _libc = libc
+            except (OSError, AttributeError) as e:
+                logger.debug('mount() is not available through ctypes: %s', e)
+                _libc = False
+        return _libc or None
+
+
+def parse_options(options: str) -> tuple:
+    """Split a comma separated list of mount options into mount flags and the file system specific
+    data string that are passed to mount(2). Returns a tuple (flags, data)."""
+    flags = 0
+    data = list()
+    if options is None:
+        return flags, None
+    for o in options.split(','):
+        if o == '':
+            continue
+        f = FLAG_OPTIONS.get(o)
+        if f is None:
+            data.append(o)
+        else:
+            flags = flags & ~f[1] | f[0]
+    if len(data) == 0:
+        return flags, None
+    return flags, ','.join(data)
+
+
+def _run(cmd: list, name: str):
     ret = subprocess.run(cmd)
     if ret.returncode != 0:
-        raise MountError(f'mount failed with status {ret.returncode}')
+        raise MountError(f'{name} failed with status {ret.returncode}')
+
+
+def _mount(libc, source: Path, target: Path, fstype: str, options: str):
+    flags, data = parse_options(options)
+    if data is not None:
+        data = os.fsencode(data)
+    if libc.mount(os.fsencode(source), os.fsencode(target), os.fsencode(fstype), flags, data) != 0:
+        err = ctypes.get_errno()
+        raise MountError(f'mount failed: {os.strerror(err)} ({errno.errorcode.get(err, err)})')
+
+
+async def mount_async(source: Path, target: Path, fstype: str = None, options: str = None):
+    '''Mount source to target with the comma separated mount options.
+    The mount(2) system call is used if the file system type fstype is known, mount(8) otherwise.
+    mount(8) is killed if the awaiting task is cancelled, the system call runs in a worker thread
+    and cannot be interrupted.'''
+    libc = None
+    if fstype is not None:
+        libc = _get_libc()
+    if libc is None:
+        cmd = ['mount']
+        if options is not None:
+            cmd += ['-o', options]
+        cmd.append(str(source))
+        cmd.append(str(target))
+        ret = await aioexec.run(cmd)
+        if ret.returncode != 0:
+            raise MountError(f'mount failed with status {ret.returncode}')
+        return
+    await asyncio.to_thread(_mount, libc, source, target, fstype, options)
+
+
+def mount(source: Path, target: Path, fstype: str = None, options: str = None):
+    '''Synchronous version of mount_async()'''
+    asyncio.run(mount_async(source, target, fstype, options))
 
 
 def umount(target: Path):
     '''Unmount target'''
-    cmd = ['umount']
-    cmd.append(str(target))
-    ret = subprocess.run(cmd)
-    if ret.returncode != 0:
-        raise MountError(f'umount failed with status {ret.returncode}')
+    libc = _get_libc()
+    if libc is None:
+        _run(['umount', str(target)], 'umount')
+        return
+    if libc.umount2(os.fsencode(target), 0) != 0:
+        err = ctypes.get_errno()
+        raise MountError(f'umount failed: {os.strerror(err)} ({errno.errorcode.get(err, err)})')
@@ -15,67 +15,125 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see https://www.gnu.org/licenses.
 
+import asyncio
+import atexit
 import logging
-import os
+import re
 import subprocess
 import shutil
-import json
+import threading
 from enum import Enum
 from uuid import UUID
 from pathlib import Path
 
-from . import globalstuff, mount, verify
+from . import aioexec, globalstuff, mount, probe, verify
 
 logger = logging.getLogger(__name__)
+_prompt_lock = threading.Lock()  # parallel jobs must not ask for passphrases at the same time
+# maps dm-crypt flags to the options of cryptsetup open
+CRYPT_OPTIONS = {'allow_discards': '--allow-discards',
+                 'no_read_workqueue': '--perf-no_read_workqueue',
+                 'no_write_workqueue': '--perf-no_write_workqueue',
+                 'submit_from_crypt_cpus': '--perf-submit_from_crypt_cpus'}
+VK_KEYRING = '@u'  # cached volume keys are linked into root's user keyring
+VK_PREFIX = 'lazysnapshotter:'  # prefix of the descriptions of cached volume keys
+VK_MIN_CRYPTSETUP = (2, 7)  # first version of cryptsetup that can link volume keys to a keyring
+_vk_keys = set()  # descriptions of the volume keys that were cached or used by this process
+_vk_lock = threading.Lock()
+_cryptsetup_version = None
 
 
 def getBlockDeviceFromUUID(block_uuid: UUID) -> Path:
     """Return the path to a device by its UUID. Return None if no device was found"""
-    base = Path('/dev/disk/by-uuid/')
-    symlink = base.joinpath(str(block_uuid))
-    if not symlink.exists():
-        return None
-    return base.joinpath(Path(os.readlink(symlink))).resolve()
+    return probe.device_by_uuid(block_uuid)
 
 
 def isLuks(path):
-    command = [shutil.which('cryptsetup'), 'isLuks', str(path)]
-    res = subprocess.run(command)
-    if res.returncode == 0:
-        return True
-    elif res.returncode == 1:
-        return False
-    else:
-        res.check_returncode()
+    return probe.is_luks(path)
 
 
 def getLuksMapping(luks_dev) -> Path:
-    command = [shutil.which('lsblk'), '-J', '-p', str(luks_dev)]
-    res = subprocess.run(command, stdout=subprocess.PIPE)
-    res.check_returncode()
-    data = json.loads(bytes.decode(res.stdout))
-    for e in data['blockdevices']:
-        if e['name'] == str(luks_dev):
-            if 'children' in e:
-                for c in e['children']:
-                    if c['type'] == 'crypt':
-                        return Path(c['name'])
-    return None
+    return probe.crypt_mapping(luks_dev)
+
+
+def parseCryptStatus(text: str) -> frozenset:
+    """Return the flags of a dm-crypt mapping from the output of 'cryptsetup status'.
+    The flags are named like the keys of CRYPT_OPTIONS."""
+    for line in text.splitlines():
+        k, sep, v = line.partition(':')
+        if sep and k.strip() == 'flags':
+            return frozenset('allow_discards' if f == 'discards' else f for f in v.split())
+    return frozenset()
+
+
+def _cryptsetup() -> str:
+    """Return the path of the cryptsetup binary"""
+    path = shutil.which('cryptsetup')
+    if path is None:
+        raise CryptsetupNotFound('cryptsetup is required for LUKS devices but was not found')
+    return path
+
+
+def getCryptFlags(mapping) -> frozenset:
+    """Return the active flags of a dm-crypt mapping or None if they cannot be determined.
+    This runs 'cryptsetup status', so it is only called when flags were requested for an open mapping."""
+    res = subprocess.run([_cryptsetup(), 'status', str(mapping)],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if res.returncode != 0:
+        return None
+    return parseCryptStatus(res.stdout)
+
+
+def _getCryptsetupVersion() -> tuple:
+    global _cryptsetup_version
+    if _cryptsetup_version is None:
+        _cryptsetup_version = ()
+        try:
+            res = subprocess.run([shutil.which('cryptsetup') or 'cryptsetup', '--version'],
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            m = re.search(r'(\d+)\.(\d+)', res.stdout)
+            if m is not None:
+                _cryptsetup_version = (int(m.group(1)), int(m.group(2)))
+        except OSError:
+            pass
+    return _cryptsetup_version
+
+
+def _keyctl(*args) -> bool:
+    """Run keyctl with args, return True on success"""
+    try:
+        return subprocess.run([shutil.which('keyctl') or 'keyctl'] + list(args),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    except OSError:
+        return False
+
+
+def expireVolumeKey(description: str) -> bool:
+    """(Re)start the countdown of a cached volume key, return False if the key does not exist"""
+    return _keyctl('timeout', description, str(globalstuff.volume_key_ttl))
+
+
+def dropVolumeKey(description: str):
+    """Remove a cached volume key from the keyring"""
+    with _vk_lock:
+        _vk_keys.discard(description)
+    _keyctl('unlink', description, VK_KEYRING)
+
+
+@atexit.register
+def _expireVolumeKeys():
+    """Restart the countdown of the volume keys of drives that are left open, so that they expire
+    globalstuff.volume_key_ttl seconds after the process ended."""
+    with _vk_lock:
+        keys = list(_vk_keys)
+        _vk_keys.clear()
+    for desc in keys:
+        expireVolumeKey(desc)
 
 
 def getMountpoint(dev) -> Path:
     """Returns the mount point for a given block device or None if no such device or mount point exists"""
-    command = [shutil.which('lsblk'), '-J', '-p', str(dev)]
-    res = subprocess.run(command, stdout=subprocess.PIPE)
-    res.check_returncode()
-    data = json.loads(bytes.decode(res.stdout))
-    for e in data['blockdevices']:
-        if e['name'] == str(dev):
-            if 'mountpoints' in e:
-                if len(e['mountpoints']) > 0:
-                    if e['mountpoints'][0] is not None:
-                        return Path(e['mountpoints'][0])
-    return None
+    return probe.mount_point(dev)
 
 
 class DeviceState(Enum):
@@ -94,12 +152,18 @@ class DeviceNotFound(Exception):
     pass
 
 
+class CryptsetupNotFound(Exception):
+    pass
+
+
 class Device:
     dev = None  # UUID or Path
     is_luks: bool = False
     _dev_point: Path = None  # block device of partition
     _crypt_point: Path = None  # device-mapper block device
     _mount_point: Path = None  # mount point
+    crypt_flags: frozenset = None  # active flags of the dm-crypt mapping, None if unknown or not queried yet
+    _vk_desc: str = None  # description of the cached volume key, None if it is not cached
     _state: DeviceState = DeviceState.UNKNOWN
 
     def __init__(self, dev):
@@ -129,34 +193,100 @@ class Device:
         if self._state != state:
             raise StateMismatch(state, self._state)
 
+    def isMounted(self) -> bool:
+        return self._state == DeviceState.MOUNTED
+
     def mountPoint(self):
         self._must_state(DeviceState.MOUNTED)
         return self._mount_point
 
-    def luksOpen(self, name: str, keyfile=None):
+    def _volumeKeyDescription(self) -> str:
+        """Return the keyring description of the device's volume key or None if it cannot be cached"""
+        if globalstuff.volume_key_ttl == 0:
+            return None
+        if _getCryptsetupVersion() < VK_MIN_CRYPTSETUP:
+            logger.warning('Volume key caching requires cryptsetup %s or newer',
+                           '.'.join(str(v) for v in VK_MIN_CRYPTSETUP))
+            return None
+        uuid = probe.luks_uuid(self._dev_point)
+        if uuid is None:
+            return None
+        return f'%logon:{VK_PREFIX}{uuid}'
+
+    def luksOpen(self, name: str, keyfile=None, flags=None):
+        """Synchronous version of luksOpenAsync()"""
+        asyncio.run(self.luksOpenAsync(name, keyfile, flags))
+
+    async def luksOpenAsync(self, name: str, keyfile=None, flags=None):
+        """Open the LUKS device as name, flags is an iterable of dm-crypt flags, see CRYPT_OPTIONS.
+        If globalstuff.volume_key_ttl is set, the volume key is cached in the kernel keyring and
+        a cached key is used instead of deriving it from the passphrase again.
+        cryptsetup is killed if the awaiting task is cancelled, the short keyctl calls are not awaited."""
         self._must_state(DeviceState.INITIALIZED)
-        command = [shutil.which('cryptsetup'), 'open',
+        command = [_cryptsetup(), 'open',
                    str(self._dev_point), name]
-        if keyfile is not None:
-            command.append('--key-file')
-            command.append(str(keyfile))
-        res = subprocess.run(command)
+        flags = frozenset() if flags is None else frozenset(flags)
+        for f in sorted(flags):
+            command.append(CRYPT_OPTIONS[f])
+        desc = self._volumeKeyDescription()
+        res = None
+        if desc is not None and expireVolumeKey(desc):
+            res = await aioexec.run(command + ['--volume-key-keyring', desc], stdin=aioexec.DEVNULL)
+            if res.returncode == 0:
+                logger.debug('Opened LUKS device "%s" with its cached volume key', self._dev_point)
+            else:
+                logger.warning('Cached volume key of LUKS device "%s" was rejected', self._dev_point)
+                dropVolumeKey(desc)
+                res = None
+        if res is None:
+            if desc is not None:
+                command += ['--link-vk-to-keyring', f'{VK_KEYRING}::{desc}']
+            if keyfile is not None:
+                command.append('--key-file')
+                command.append(str(keyfile))
+                res = await aioexec.run(command)
+            else:
+                # the lock is taken by a worker thread, so other coroutines of this loop keep running meanwhile
+                await asyncio.to_thread(_prompt_lock.acquire)
+                try:
+                    res = await aioexec.run(command)
+                finally:
+                    _prompt_lock.release()
+        probe.invalidate()
         res.check_returncode()
+        if desc is not None:
+            with _vk_lock:
+                _vk_keys.add(desc)
+            expireVolumeKey(desc)
+            self._vk_desc = desc
         self._crypt_point = Path('/dev/mapper/').joinpath(name)
-        logger.debug('Mapped LUKS device "%s" to "%s"',
-                     self._dev_point, self._crypt_point)
+        self.crypt_flags = flags
+        logger.debug('Mapped LUKS device "%s" to "%s" with flags %s',
+                     self._dev_point, self._crypt_point, ', '.join(sorted(flags)) or 'none')
         self._state = DeviceState.DECRYPTED
 
     def luksClose(self):
         self._must_state(DeviceState.DECRYPTED)
-        command = [shutil.which('cryptsetup'), 'close', str(self._crypt_point)]
+        command = [_cryptsetup(), 'close', str(self._crypt_point)]
         res = subprocess.run(command)
+        probe.invalidate()
         res.check_returncode()
         logger.debug('Removed LUKS mapping "%s"', self._crypt_point)
         self._crypt_point = None
+        self.crypt_flags = None
+        if self._vk_desc is not None:
+            # the countdown starts when the drive was used for the last time
+            expireVolumeKey(self._vk_desc)
+            with _vk_lock:
+                _vk_keys.discard(self._vk_desc)
+            self._vk_desc = None
         self._state = DeviceState.INITIALIZED
 
-    def mount(self, mount_point: Path):
+    def mount(self, mount_point: Path, options: str = None):
+        """Synchronous version of mountAsync()"""
+        asyncio.run(self.mountAsync(mount_point, options))
+
+    async def mountAsync(self, mount_point: Path, options: str = None):
         verify.requireExistingPath(mount_point)
         if not mount_point.is_absolute():
             mount_point = mount_point.resolve()
@@ -167,14 +297,26 @@ class Device:
         else:
             self._must_state(DeviceState.INITIALIZED)
             block_dev = self._dev_point
-        mount.mount(block_dev, mount_point)
+        fstype = None
+        try:
+            if probe.is_btrfs(block_dev):
+                fstype = 'btrfs'
+        except OSError as e:
+            logger.debug('Could not probe the file system of "%s": %s', block_dev, e)
+        try:
+            await mount.mount_async(block_dev, mount_point, fstype, options)
+        finally:
+            probe.invalidate()
         self._mount_point = mount_point
-        logger.debug('Mounted device "%s" to "%s"', block_dev, mount_point)
+        logger.debug('Mounted device "%s" to "%s" with options "%s"', block_dev, mount_point, options)
         self._state = DeviceState.MOUNTED
 
     def unmount(self):
         self._must_state(DeviceState.MOUNTED)
-        mount.umount(self._mount_point)
+        try:
+            mount.umount(self._mount_point)
+        finally:
+            probe.invalidate()
         logger.debug('Unmounted "%s"', self._mount_point)
         self._mount_point = None
         if self.is_luks:
@@ -182,16 +324,30 @@ class Device:
         else:
             self._state = DeviceState.INITIALIZED
 
-    def arm(self, mount_point: Path, luks_name: str = None, keyfile: Path = None):
-        """Evaluate the status of the device, execute the required steps to mount the device, mount the device."""
+    def arm(self, mount_point: Path, luks_name: str = None, keyfile: Path = None, options: str = None,
+            crypt_flags=None):
+        """Synchronous version of armAsync()"""
+        asyncio.run(self.armAsync(mount_point, luks_name, keyfile, options, crypt_flags))
+
+    async def armAsync(self, mount_point: Path, luks_name: str = None, keyfile: Path = None, options: str = None,
+                       crypt_flags=None):
+        """Evaluate the status of the device, execute the required steps to mount the device, mount the device.
+        options are the mount options, they are ignored if the device is already mounted.
+        crypt_flags are the dm-crypt flags, they are ignored if the LUKS device is already opened."""
         if self._state == DeviceState.UNKNOWN:
             raise StateMismatch(DeviceState.INITIALIZED, DeviceState.UNKNOWN)
         elif self._state == DeviceState.INITIALIZED:
             if self.is_luks:
-                self.luksOpen(luks_name, keyfile)
-            self.mount(mount_point)
-        elif self._state == DeviceState.DECRYPTED:
-            self.mount(mount_point)
+                await self.luksOpenAsync(luks_name, keyfile, crypt_flags)
+            await self.mountAsync(mount_point, options)
+            return
+        if crypt_flags and self.crypt_flags is None and self._crypt_point is not None:
+            self.crypt_flags = getCryptFlags(self._crypt_point)
+        if crypt_flags and self.crypt_flags is not None and not self.crypt_flags.issuperset(crypt_flags):
+            logger.warning('LUKS mapping "%s" is already open without the flags %s',
+                           self._crypt_point, ', '.join(sorted(frozenset(crypt_flags) - self.crypt_flags)))
+        if self._state == DeviceState.DECRYPTED:
+            await self.mountAsync(mount_point, options)
         elif self._state == DeviceState.MOUNTED:
             return
         else:
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Run multiple backup entries through a bounded pool of worker threads"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from uuid import UUID
+
+from . import backup, globalstuff, mounts, verify
+from .drivesession import DriveSession
+
+logger = logging.getLogger(__name__)
+
+
+def device_key(entry) -> str:
+    """Return a string that identifies the backup device of entry.
+    Entries with the same key share a backup device."""
+    if verify.uuid(entry.backup_volume):
+        dev = mounts.getBlockDeviceFromUUID(UUID(str(entry.backup_volume)))
+        if dev is not None:
+            return str(dev)
+        return str(entry.backup_volume).lower()
+    return str(Path(entry.backup_volume).resolve())
+
+
+def group_by_device(entries) -> dict:
+    """Sort entries into lists of entries that share a backup device, keyed by device_key.
+    The order of the entries is preserved inside each list."""
+    groups = dict()
+    for e in entries:
+        groups.setdefault(device_key(e), list()).append(e)
+    return groups
+
+
+def batch_by_snapshot_dir(groups) -> list:
+    """Merge the device groups of group_by_device into batches, so all groups whose entries share a snapshot directory
+    end up in the same batch. Every catalog of a snapshot directory lives in one job, parallel jobs could otherwise
+    pick the same name for a new snapshot or purge the parent of another job.
+    Returns a list of batches, each of them is a list of device groups in their original order."""
+    batches = list()  # lists of device groups
+    owners = dict()  # maps snapshot directories to the index of their batch in batches
+    for g in groups:
+        dirs = {str(Path(e.snapshot_dir).resolve()) for e in g}
+        merged = sorted({owners[d] for d in dirs if d in owners})
+        if len(merged) == 0:
+            batches.append([g])
+            index = len(batches) - 1
+        else:
+            index = merged[0]
+            for i in merged[1:]:
+                batches[index].extend(batches[i])
+                batches[i] = None
+                for d, o in owners.items():
+                    if o == i:
+                        owners[d] = index
+            batches[index].append(g)
+        for d in dirs:
+            owners[d] = index
+    return [b for b in batches if b is not None]
+
+
+def _run_batch(batch, failed: dict):
+    """Run the device groups of batch one after another, see _run_serial()"""
+    for g in batch:
+        _run_serial(g, failed)
+
+
+def _run_serial(entries, failed: dict):
+    """Run entries that share a backup device one after another in a single drive session,
+    so the drive is armed, synced and disarmed only once. A failed entry does not stop the following ones."""
+    drive = DriveSession(entries[0].backup_volume)
+    try:
+        with drive:
+            for e in entries:
+                try:
+                    backup.run(e, drive)
+                except Exception as ex:
+                    logger.critical('Backup "%s" failed: %s', e.name, ex,
+                                    exc_info=globalstuff.debug_mode)
+                    failed[e.name] = ex
+    except Exception as ex:
+        logger.critical('Could not release backup drive "%s": %s', drive.volume, ex,
+                        exc_info=globalstuff.debug_mode)
+        for e in entries:
+            failed.setdefault(e.name, ex)
+
+
+def run_entries(entries, jobs: int) -> dict:
+    """Run all backup entries with at most jobs entries running at the same time.
+    Entries that share a backup device or a snapshot directory are run serially by the same worker.
+    Returns a dictionary that maps the names of all failed entries to their exceptions."""
+    verify.requireRightAmountOfJobs(jobs)
+    failed = dict()
+    groups = group_by_device(entries)
+    batches = batch_by_snapshot_dir(groups.values())
+    workers = min(jobs, len(batches))
+    if workers < 2:
+        for b in batches:
+            _run_batch(b, failed)
+        return failed
+    logger.debug('Running %d backup entries on %d devices with %d workers',
+                 len(entries), len(groups), workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lazysnapshotter') as executor:
+        futures = [executor.submit(_run_batch, b, failed)
+                   for b in batches]
+        for f in futures:
+            f.result()
+    return failed
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Inspect block devices through sysfs, procfs and their on-disk headers instead of external tools"""
+
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from uuid import UUID
+
+logger = logging.getLogger(__name__)
+
+LUKS_MAGIC = b'LUKS\xba\xbe'  # LUKS1 and LUKS2 headers start with this magic
+LUKS_UUID_OFFSET = 168  # offset of the UUID in LUKS1 and LUKS2 headers
+LUKS_UUID_LENGTH = 40
+BTRFS_MAGIC = b'_BHRfS_M'  # magic of the btrfs super block
+BTRFS_MAGIC_OFFSET = 0x10040
+DM_CRYPT_PREFIX = 'CRYPT-'  # prefix of the device-mapper UUID of dm-crypt mappings
+_escape = re.compile(r'\\([0-7]{3})')
+
+_lock = threading.Lock()
+_cache = dict()  # results of _mount_table() and _crypt_table(), valid until invalidate() is called
+
+
+def invalidate():
+    """Forget all cached mappings and mounts, must be called after a device was opened, closed, mounted or unmounted"""
+    with _lock:
+        _cache.clear()
+
+
+def _cached(key: str, func):
+    with _lock:
+        if key not in _cache:
+            _cache[key] = func()
+        return _cache[key]
+
+
+def device_by_uuid(block_uuid: UUID) -> Path:
+    """Return the path to a block device by its file system UUID or None if no such device exists"""
+    link = os.path.join('/dev/disk/by-uuid', str(block_uuid))
+    if not os.path.lexists(link):
+        return None
+    return Path(os.path.realpath(link))
+
+
+def is_luks(dev: Path) -> bool:
+    """Return True if block device dev starts with a LUKS header"""
+    with open(dev, 'rb') as f:
+        return f.read(len(LUKS_MAGIC)) == LUKS_MAGIC
+
+
+def luks_uuid(dev: Path) -> str:
+    """Return the UUID of the LUKS header of block device dev or None if dev is not a LUKS device"""
+    with open(dev, 'rb') as f:
+        header = f.read(LUKS_UUID_OFFSET + LUKS_UUID_LENGTH)
+    if not header.startswith(LUKS_MAGIC) or len(header) < LUKS_UUID_OFFSET + LUKS_UUID_LENGTH:
+        return None
+    uuid = header[LUKS_UUID_OFFSET:].split(b'\0', 1)[0].decode('ascii', 'replace')
+    return uuid if uuid else None
+
+
+def is_btrfs(dev: Path) -> bool:
+    """Return True if block device dev holds a btrfs file system"""
+    with open(dev, 'rb') as f:
+        f.seek(BTRFS_MAGIC_OFFSET)
+        return f.read(len(BTRFS_MAGIC)) == BTRFS_MAGIC
+
+
+def _read(path: Path) -> str:
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+
+def crypt_mappings(sysfs: Path = Path('/sys')) -> dict:
+    """Return a dictionary that maps the kernel names of block devices (like sda1) to the device-mapper devices
+    (like /dev/mapper/backup) of the dm-crypt mappings they are part of, read from sysfs."""
+    ret = dict()
+    base = sysfs.joinpath('block')
+    try:
+        entries = [e for e in os.listdir(base) if e.startswith('dm-')]
+    except FileNotFoundError:
+        return ret
+    for e in entries:
+        dm = base.joinpath(e)
+        try:
+            if not _read(dm.joinpath('dm', 'uuid')).startswith(DM_CRYPT_PREFIX):
+                continue
+            name = _read(dm.joinpath('dm', 'name'))
+            slaves = os.listdir(dm.joinpath('slaves'))
+        except (FileNotFoundError, NotADirectoryError):
+            continue  # the mapping vanished while it was read
+        for s in slaves:
+            ret[s] = Path('/dev/mapper').joinpath(name)
+    return ret
+
+
+def _unescape(field: str) -> str:
+    return _escape.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+
+def parse_mountinfo(text: str) -> dict:
+    """Parse the content of a mountinfo file, see proc(5). Returns a dictionary that maps the real paths of mount
+    sources to lists of tuples (mount point, root of the mount inside the file system) in mount order."""
+    ret = dict()
+    for line in text.splitlines():
+        left, sep, right = line.partition(' - ')
+        if sep == '':
+            continue
+        fields = left.split(' ')
+        other = right.split(' ')
+        if len(fields) < 6 or len(other) < 2:
+            continue
+        source = _unescape(other[1])
+        if not source.startswith('/'):
+            continue  # not a block device
+        ret.setdefault(os.path.realpath(source), list()).append(
+            (Path(_unescape(fields[4])), _unescape(fields[3])))
+    return ret
+
+
+def _mount_table() -> dict:
+    with open('/proc/self/mountinfo', 'r') as f:
+        return parse_mountinfo(f.read())
+
+
+def crypt_mapping(dev: Path) -> Path:
+    """Return the dm-crypt mapping of block device dev or None if dev is not opened"""
+    name = os.path.basename(os.path.realpath(dev))
+    return _cached('crypt', crypt_mappings).get(name)
+
+
+def mount_point(dev: Path) -> Path:
+    """Return a mount point of block device dev or None if dev is not mounted.
+    A mount of the file system's top level is preferred over mounts of its subvolumes or directories."""
+    mounts = _cached('mounts', _mount_table).get(os.path.realpath(dev))
+    if mounts is None:
+        return None
+    for target, root in mounts:
+        if root == '/':
+            return target
+    return mounts[0][0]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Report the progress of a running btrfs-send stream"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MIB = 1048576
+
+
+def proc_io_counter(pid: int, field: str = 'rchar'):
+    """Return a counter function that reads the I/O statistic field of process pid from /proc.
+    The default field counts the bytes the process has read.
+    The counter keeps returning its last value after the process has been reaped."""
+    path = '/proc/{}/io'.format(pid)
+    last = 0
+
+    def _counter() -> int:
+        nonlocal last
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.startswith(field + ':'):
+                        last = int(line.split()[1])
+                        break
+        except OSError:
+            pass
+        return last
+    return _counter
+
+
+class Progress(threading.Thread):
+    """Thread that samples a byte counter every interval seconds, logs the transfer rate
+    and the estimated time of arrival and optionally writes them to a JSON file.
+    The counter is polled, so the transfer itself pays nothing for the reports."""
+
+    def __init__(self, name: str, expected: int = None, interval: int = 60, path: Path = None):
+        super().__init__(name='progress', daemon=True)
+        self.job_name = name
+        self.expected = expected  # estimated stream size in bytes, None if unknown
+        self.interval = interval
+        self.path = path
+        self._counter = None
+        self._stop_event = threading.Event()
+        self._start_time = None
+        self._last_time = None
+        self._last_bytes = 0
+
+    def attach(self, counter):
+        """Start reporting, counter is a function that returns the amount of transferred bytes."""
+        self._counter = counter
+        self._start_time = time.monotonic()
+        self._last_time = self._start_time
+        if self.interval > 0:
+            self.start()
+
+    def finish(self, success: bool):
+        """Stop reporting and write the final report."""
+        if self._counter is None:
+            return
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.report(done=True, success=success)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+    def sample(self) -> dict:
+        now = time.monotonic()
+        transferred = self._counter()
+        elapsed = now - self._start_time
+        current = 0.0
+        if now > self._last_time:
+            current = (transferred - self._last_bytes) / \
+                (now - self._last_time)
+        average = 0.0
+        if elapsed > 0:
+            average = transferred / elapsed
+        eta = None
+        if self.expected is not None and average > 0 and transferred <= self.expected:
+            eta = (self.expected - transferred) / average
+        self._last_time = now
+        self._last_bytes = transferred
+        return {'name': self.job_name, 'transferred': transferred, 'expected': self.expected,
+                'elapsed': elapsed, 'rate_current': current, 'rate_average': average, 'eta': eta}
+
+    def report(self, done: bool = False, success: bool = True):
+        data = self.sample()
+        eta = 'unknown'
+        if data['eta'] is not None:
+            eta = str(timedelta(seconds=int(data['eta'])))
+        percent = ''
+        if self.expected:
+            percent = ' ({:.0f}%)'.format(
+                min(100.0, 100.0 * data['transferred'] / self.expected))
+        if done:
+            logger.info('Transferred %.1f MiB in %s, %.1f MiB/s average',
+                        data['transferred'] / MIB, timedelta(seconds=int(data['elapsed'])),
+                        data['rate_average'] / MIB)
+        else:
+            logger.info('Transferred %.1f MiB%s, %.1f MiB/s current, %.1f MiB/s average, ETA %s',
+                        data['transferred'] / MIB, percent, data['rate_current'] / MIB,
+                        data['rate_average'] / MIB, eta)
+        if self.path is not None:
+            data['done'] = done
+            data['success'] = success
+            data['timestamp'] = time.time()
+            self._write(data)
+
+    def _write(self, data: dict):
+        """Replace the progress file atomically, so readers never see a partial report."""
+        tmp = self.path.with_name('.{}.tmp'.format(self.path.name))
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning('Could not write progress file "%s": %s',
+                           self.path, e)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Move data between pipes inside the kernel with splice(2)"""
+
+import fcntl
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+F_GETPIPE_SZ = getattr(fcntl, 'F_GETPIPE_SZ', 1032)
+DEFAULT_CHUNK = 65536
+
+
+def available() -> bool:
+    """Return True if this python version supports splice(2)"""
+    return hasattr(os, 'splice')
+
+
+def make_pipe(size: int = None) -> tuple:
+    """Return a pipe as a tuple (read end, write end) with a buffer of size bytes.
+    If the buffer cannot be resized, the pipe keeps its default buffer size."""
+    pread, pwrite = os.pipe()
+    if size is not None:
+        try:
+            fcntl.fcntl(pwrite, F_SETPIPE_SZ, size)
+        except OSError as e:
+            logger.warning(
+                'Could not resize pipe buffer to %d bytes: %s', size, e)
+    logger.debug('Created pipe with a buffer of %d bytes',
+                 fcntl.fcntl(pwrite, F_GETPIPE_SZ))
+    return (pread, pwrite)
+
+
+class Relay(threading.Thread):
+    """Thread that splices everything from fd_in to fd_out until fd_in reaches EOF.
+    The relay takes ownership of both file descriptors and closes them when it is done,
+    so the reader of fd_out sees EOF. The data never passes through user space,
+    but every chunk is counted in the attribute transferred."""
+
+    def __init__(self, fd_in: int, fd_out: int, chunk: int = DEFAULT_CHUNK):
+        if not available():
+            raise RelayError('splice() is not supported by this python version')
+        super().__init__(name='relay', daemon=True)
+        self.fd_in = fd_in
+        self.fd_out = fd_out
+        self.chunk = chunk
+        self.transferred = 0
+        self.error = None
+
+    def run(self):
+        flags = os.SPLICE_F_MOVE | os.SPLICE_F_MORE
+        try:
+            while True:
+                n = os.splice(self.fd_in, self.fd_out, self.chunk, flags=flags)
+                if n == 0:
+                    break
+                self.transferred += n
+        except Exception as e:
+            self.error = e
+        finally:
+            os.close(self.fd_in)
+            os.close(self.fd_out)
+
+    def check(self):
+        """Raise a RelayError if the relay failed"""
+        if self.error is not None:
+            raise RelayError('Relay failed after {} bytes: {}'.format(
+                self.transferred, self.error))
+
+
+class RelayError(Exception):
+    pass
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Decide which snapshots are kept by a grandfather-father-son retention policy"""
+
+import logging
+from dataclasses import dataclass
+from datetime import date
+
+from . import bnames
+
+logger = logging.getLogger(__name__)
+
+_DATE_SHIFT = bnames.INDEX_BITS + bnames.TIME_BITS
+
+
+@dataclass
+class Policy:
+    """Amount of snapshots to keep. last keeps the newest snapshots regardless of their age,
+    every other field keeps the newest snapshot of that many of the most recent hours, days, weeks, months or years.
+    A snapshot that is chosen by several rules is only kept once."""
+    last: int = 1
+    hourly: int = 0
+    daily: int = 0
+    weekly: int = 0
+    monthly: int = 0
+    yearly: int = 0
+
+
+def _hour(n: bnames.BName) -> int:
+    """Hour bucket of n, names without a time belong to the first hour of their day"""
+    seconds = n.seconds
+    if seconds is None:
+        seconds = 0
+    return (n.ordinal >> _DATE_SHIFT) * 24 + seconds // 3600
+
+
+def _day(n: bnames.BName) -> int:
+    return n.ordinal >> _DATE_SHIFT
+
+
+def _week(n: bnames.BName) -> tuple:
+    """Raises ValueError for names that are no calendar dates, e.g. February 31st"""
+    return date(n.year, n.month, n.day).isocalendar()[:2]
+
+
+def _month(n: bnames.BName) -> int:
+    return (n.ordinal >> _DATE_SHIFT) // 100
+
+
+def _year(n: bnames.BName) -> int:
+    return (n.ordinal >> _DATE_SHIFT) // 10000
+
+
+def over_budget(sizes: dict, budget: int, protect=()) -> list:
+    """Return the oldest names that have to go so the summed sizes of the remaining names fit into budget bytes.
+    sizes maps BNames to their sizes in bytes, names in protect are never chosen.
+    If the budget cannot be met without the protected names, all other names are returned."""
+    total = sum(sizes.values())
+    res = list()
+    protect = set(protect)
+    for n in sorted(sizes):
+        if total <= budget:
+            break
+        if n not in protect:
+            res.append(n)
+            total -= sizes[n]
+    return res
+
+
+def select(names, policy: Policy, protect=()) -> set:
+    """Return the set of names that policy keeps, names is an iterable of BNames.
+    Every name in protect is kept in addition to the names chosen by policy.
+    All buckets are filled in a single pass over names, the newest buckets of every rule are picked by a heap afterwards.
+    Names that are no calendar dates are left out of the rules that need one."""
+    names = list(names)
+    keep = set(bnames.top(names, policy.last))
+    rules = [(count, func, dict()) for count, func in ((policy.hourly, _hour), (policy.daily, _day),
+                                                       (policy.weekly, _week), (policy.monthly, _month),
+                                                       (policy.yearly, _year)) if count > 0]
+    if len(rules) > 0:
+        invalid = set()
+        for n in names:
+            for count, func, buckets in rules:
+                try:
+                    key = func(n)
+                except ValueError:
+                    invalid.add(n)
+                    continue
+                newest = buckets.get(key)
+                if newest is None or newest.ordinal < n.ordinal:
+                    buckets[key] = n
+        for n in sorted(invalid):
+            logger.warning('Snapshot "%s" is not named by a valid date, skipping it for weekly retention', n)
+        for count, func, buckets in rules:
+            keep.update(bnames.top(buckets.values(), count))
+    keep.update(protect)
+    return keep
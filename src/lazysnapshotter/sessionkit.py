@@ -15,11 +15,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see https://www.gnu.org/licenses.
 
-import csv
-import fcntl
 import logging
 import os
 import os.path
+import sqlite3
+import threading
 import uuid
 from pathlib import Path
 
@@ -34,100 +34,116 @@ class DuplicateJobException(Exception):
     pass
 
 
-class MalformedCsvEntryException(Exception):
-    pass
-
+def _process_start(pid: int):
+    """Return the start time of process pid in clock ticks since boot or None if there is no such process"""
+    try:
+        with open('/proc/{}/stat'.format(pid), 'r') as f:
+            stat = f.read()
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    # the process name may contain spaces, so the fields are counted from its closing parenthesis
+    return int(stat[stat.rindex(')') + 2:].split()[19])
 
-class JobDialect(csv.Dialect):
-    delimiter = ':'
-    escapechar = '\\'
-    quoting = csv.QUOTE_NONE
-    lineterminator = '\n'
 
-
-class JobFile:
+class JobRegistry:
+    """Records running backup jobs in a SQLite database shared by all program instances.
+    A job is identified by its name and its configuration file, every job can only be registered once at a time.
+    Rows of processes that no longer exist are considered stale and removed automatically."""
 
     columns = ('name', 'configfile', 'pid', 'jobid')
 
-    def __init__(self, jobfile: Path):
-        self.jobfile = jobfile
+    def __init__(self, dbfile: Path):
+        self.dbfile = dbfile
+        self._db = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Open the database, create it if it does not exist and remove all stale rows"""
+        self._db = sqlite3.connect(self.dbfile, timeout=60, isolation_level=None,
+                                   check_same_thread=False)
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS jobs (jobid TEXT PRIMARY KEY, name TEXT NOT NULL, '
+                             'configfile TEXT NOT NULL, pid INTEGER NOT NULL, started INTEGER)')
+            self._db.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS jobs_by_name ON jobs (name, configfile)')
+        self.cleanup()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _stale(self, pid: int, started: int) -> bool:
+        """Return True if the process that registered a job is gone, a reused PID counts as gone"""
+        start = _process_start(pid)
+        return start is None or (started is not None and start != started)
+
+    def cleanup(self) -> int:
+        """Remove the rows of all jobs whose processes are gone, return the amount of removed rows"""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                stale = [(r[0],) for r in self._db.execute('SELECT jobid, pid, started FROM jobs')
+                         if self._stale(r[1], r[2])]
+                self._db.executemany('DELETE FROM jobs WHERE jobid = ?', stale)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        for r in stale:
+            logger.debug('Removed stale job "%s" from the job registry', r[0])
+        return len(stale)
 
     def read(self) -> list:
-        ret = list()
-        with open(self.jobfile, 'r') as f:
-            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
-            reader = csv.reader(f, dialect=JobDialect)
-            for l in reader:
-                ret.append(l)
-        return ret
-
-    def createFile(self):
-        if not self.jobfile.exists():
-            with open(self.jobfile, 'w'):
-                pass
+        with self._lock:
+            return [list(r) for r in self._db.execute('SELECT name, configfile, pid, jobid FROM jobs')]
 
     def query(self, query: dict) -> list:
-        ret = list()
-        with open(self.jobfile, 'r') as f:
-            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
-            reader = csv.reader(f, dialect=JobDialect)
-            for l in reader:
-                match = True
-                for k, v in query.items():
-                    try:
-                        index = JobFile.columns.index(k)
-                    except ValueError:
-                        raise globalstuff.Bug('Malformed query: Key \'{}\' is not part of the allowed query keys {}!'.format(
-                            k, str(JobFile.columns)))
-                    if index >= len(l):
-                        match = False
-                        break
-                    if l[index] != v:
-                        match = False
-                        break
-                if match:
-                    ret.append(l)
-        return ret
+        """Return the rows of all jobs that match every column of query"""
+        for k in query:
+            if k not in JobRegistry.columns:
+                raise globalstuff.Bug('Malformed query: Key \'{}\' is not part of the allowed query keys {}!'.format(
+                    k, str(JobRegistry.columns)))
+        sql = 'SELECT name, configfile, pid, jobid FROM jobs'
+        if len(query) > 0:
+            sql += ' WHERE ' + ' AND '.join('{} = ?'.format(k) for k in query)
+        with self._lock:
+            return [list(r) for r in self._db.execute(sql, tuple(str(v) for v in query.values()))]
 
     def register(self, job_name, configfile, job_id):
         verify.requireAbsolutePath(configfile)
-        l = self.query(
-            {JobFile.columns[0]: job_name, JobFile.columns[1]: str(configfile)})
-        if len(l) == 0:
-            with open(self.jobfile, 'r') as filelock:
-                fcntl.flock(filelock.fileno(), fcntl.LOCK_EX)
-                with open(self.jobfile, 'a') as f:
-                    writer = csv.writer(f, dialect=JobDialect)
-                    writer.writerow(
-                        [job_name, str(configfile), str(os.getpid()), str(job_id)])
-                    logger.debug('Backup job recorded in JobFile.')
-        else:
-            raise DuplicateJobException(
-                'The same backup job is already running!')
+        pid = os.getpid()
+        with self._lock:
+            # the write lock is taken before the lookup, so checking and inserting are atomic
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute('SELECT jobid, pid, started FROM jobs WHERE name = ? AND configfile = ?',
+                                       (job_name, str(configfile))).fetchone()
+                if row is not None:
+                    if not self._stale(row[1], row[2]):
+                        raise DuplicateJobException(
+                            'The same backup job is already running!')
+                    logger.debug('Replacing stale job "%s" in the job registry', row[0])
+                    self._db.execute('DELETE FROM jobs WHERE jobid = ?', (row[0],))
+                self._db.execute('INSERT INTO jobs (jobid, name, configfile, pid, started) VALUES (?, ?, ?, ?, ?)',
+                                 (str(job_id), job_name, str(configfile), pid, _process_start(pid)))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        logger.debug('Backup job recorded in the job registry.')
 
     def release(self, job_id):
-        filebuffer = list()
-        with open(self.jobfile, 'r') as f_read:
-            fcntl.flock(f_read.fileno(), fcntl.LOCK_EX)
-            reader = csv.reader(f_read, dialect=JobDialect)
-            for l in reader:
-                if len(l) != 4:
-                    raise MalformedCsvEntryException(
-                        'JobFile records must have 4 columns.')
-                if l[3] == str(job_id):
-                    logger.debug('Found backup job in JobFile for release!')
-                else:
-                    filebuffer.append(l)
-            with open(self.jobfile, 'w') as f_write:
-                writer = csv.writer(f_write, dialect=JobDialect)
-                for wl in filebuffer:
-                    writer.writerow(wl)
+        with self._lock:
+            self._db.execute('DELETE FROM jobs WHERE jobid = ?', (str(job_id),))
 
 
 class RuntimePathManager:
 
-    dir_keys = ('mounts', 'pid')
-    file_keys = ('jobs', 'pidfile')
+    dir_keys = ('mounts', 'pid', 'warm')
+    file_keys = ('jobs', 'pidfile', 'socket')
 
     def __init__(self, rundir: Path):
         verify.requireAbsolutePath(rundir)
@@ -139,6 +155,8 @@ class RuntimePathManager:
             directory = self.rootdir / Path('mounts')
         elif key == 'pid':
             directory = self.rootdir / Path('pid')
+        elif key == 'warm':
+            directory = self.rootdir / Path('warm')
         else:
             raise globalstuff.Bug('"{}" is an invalid key.'.format(key))
         if create == True and not directory.exists():
@@ -148,7 +166,9 @@ class RuntimePathManager:
     def getFile(self, key, create_dir=False) -> Path:
         fp = None
         if key == 'jobs':
-            fp = self.rootdir / Path('jobs')
+            fp = self.rootdir / Path('jobs.db')
+        elif key == 'socket':
+            fp = self.rootdir / Path('daemon.sock')
         elif key == 'pidfile':
             d = self.getDirectory('pid', create_dir)
             fp = d / Path('{}.pid'.format(str(os.getpid())))
@@ -170,34 +190,42 @@ class Session:
         logger.debug('Creating pidfile "%s"', str(self.pidfile))
         fp = open(self.pidfile, 'w')
         fp.close()
-        jobfile = self.rpm.getFile('jobs', create_dir=True)
-        self.jobs = JobFile(jobfile)
-        self.jobs.createFile()
+        self.jobs = JobRegistry(self.rpm.getFile('jobs', create_dir=True))
+        self.jobs.open()
 
     def cleanup(self):
+        if self.jobs is not None:
+            self.jobs.close()
         if hasattr(self, 'pidfile'):
             logger.debug('Deleting pidfile "%s"', str(self.pidfile))
             if self.pidfile.exists():
                 self.pidfile.unlink()
 
-    def registerBackup(self, job_name, configfile):
-        self.jobs.register(job_name, configfile, self.session_id)
+    def registerBackup(self, job_name, configfile, job_id=None):
+        if job_id is None:
+            job_id = self.session_id
+        self.jobs.register(job_name, configfile, job_id)
 
-    def releaseBackup(self):
-        self.jobs.release(self.session_id)
+    def releaseBackup(self, job_id=None):
+        if job_id is None:
+            job_id = self.session_id
+        self.jobs.release(job_id)
 
     def customizeMountDir(self, mountdir: Path):
         verify.requireAbsolutePath(mountdir)
         verify.requireExistingPath(mountdir)
         self.custom_mountdir = mountdir
 
-    def getMountDir(self, create_parent=False, mkdir=False):
+    def getMountDir(self, create_parent=False, mkdir=False, name=None):
+        """Return the path of a mount point named after name or, if name is None, after the session ID."""
         mountdir = None
+        if name is None:
+            name = str(self.session_id)
         if self.custom_mountdir is None:
             mounts = self.rpm.getDirectory('mounts', create_parent)
-            mountdir = mounts / Path(str(self.session_id))
+            mountdir = mounts / Path(name)
         else:
-            mountdir = self.custom_mountdir / Path(str(self.session_id))
+            mountdir = self.custom_mountdir / Path(name)
         if mkdir:
             os.mkdir(mountdir, mode=0o755)
         return mountdir
@@ -17,9 +17,21 @@
 
 """Manage btrfs snapshots"""
 
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
 from pathlib import Path
 import btrfsutil
 
+from . import aioexec
+
+logger = logging.getLogger(__name__)
+
+NULL_UUID = bytes(16)  # UUID of subvolumes that have not been received
+BTRFS_FIRST_FREE_OBJECTID = 256  # inode number of every subvolume's root directory
+
 
 def scan_dir(p: Path, filter_func=None):
     """Scans Path p for btrfs snapshots, returns the paths of all found snapshots as a list or None if no snapshots were found.
@@ -38,6 +50,80 @@ def scan_dir(p: Path, filter_func=None):
     return snapshots
 
 
+def _on_btrfs(p: Path) -> bool:
+    """Returns True if directory p is on a btrfs file system"""
+    try:
+        btrfsutil.subvolume_id(p)
+    except btrfsutil.BtrfsUtilError:
+        return False
+    return True
+
+
+def scan_snapshots(p: Path, key_func) -> dict:
+    """Scans Path p for btrfs snapshots and returns them as a dictionary like snapshot_dict() or None if no snapshots were found.
+    The function key_func takes a file name and returns its dictionary key or None if the file should be skipped.
+    Names are checked before anything else, subvolumes are recognized by the inode number of the
+    directory entry's stat result. Only if p is not known to be on btrfs, every candidate is checked by an ioctl."""
+    btrfs = _on_btrfs(p)
+    d = dict()
+    with os.scandir(p) as it:
+        for e in it:
+            key = key_func(e.name)
+            if key is None:
+                continue
+            if not e.is_dir(follow_symlinks=False):
+                continue
+            if btrfs:
+                # readdir reports the subvolume ID as inode number, only stat() shows the root directory's inode
+                if e.stat(follow_symlinks=False).st_ino != BTRFS_FIRST_FREE_OBJECTID:
+                    continue
+            elif not btrfsutil.is_subvolume(e.path):
+                continue
+            d[key] = p.joinpath(e.name)
+    if len(d) < 1:
+        return None
+    return d
+
+
+async def _delete_batch(paths: list) -> list:
+    """Delete all subvolumes in paths by a single btrfs-subvolume-delete process, return the paths that still exist"""
+    command = [shutil.which('btrfs'), 'subvolume', 'delete'] + [str(p) for p in paths]
+    res = await aioexec.run(command, stdout=aioexec.DEVNULL, stderr=aioexec.PIPE)
+    if res.returncode == 0:
+        return []
+    logger.error('btrfs subvolume delete failed: %s',
+                 bytes.decode(res.stderr).strip())
+    return [p for p in paths if os.path.lexists(p)]
+
+
+async def delete_snapshots_async(paths: list, workers: int = 1) -> list:
+    """Delete all subvolumes in paths, return the paths that could not be deleted.
+    The paths are split into up to workers batches that are deleted concurrently,
+    every batch is handled by a single btrfs-subvolume-delete process."""
+    if len(paths) == 0:
+        return []
+    workers = max(1, min(workers, len(paths)))
+    results = await aioexec.gather(*(_delete_batch(paths[i::workers]) for i in range(workers)))
+    return [p for failed in results for p in failed]
+
+
+def delete_snapshots(paths: list, workers: int = 1) -> list:
+    """Synchronous version of delete_snapshots_async()"""
+    return asyncio.run(delete_snapshots_async(paths, workers))
+
+
+def wait_for_cleaner(path: Path, subvolume_ids: list):
+    """Block until the btrfs cleaner has removed the deleted subvolumes subvolume_ids from the file system containing path"""
+    if len(subvolume_ids) == 0:
+        return
+    command = [shutil.which('btrfs'), 'subvolume', 'sync', str(path)] + [str(i) for i in subvolume_ids]
+    res = subprocess.run(command, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE)
+    if res.returncode != 0:
+        logger.warning('Could not wait for the cleaner of "%s": %s',
+                       path, bytes.decode(res.stderr).strip())
+
+
 def snapshot_dict(snapshots, key_func):
     """Takes a list of snapshots (likely generated by scan_dir) and puts every element into a dictionary.
     The function key_func takes the snapshot as a parameter and returns its dictionary key."""
@@ -49,15 +135,51 @@ def snapshot_dict(snapshots, key_func):
     return d
 
 
-def biggest_common_snapshot(a, b):
-    """Returns the biggest common snapshot of snapshot dicts a and b. It is determined by reverse sorting the dictionary keys.
-    If such a snapshot is found, a tuple with 2 elements (snapshot a and snapshot b) will be returned.
-    If no common snapshot is found, None will be returned."""
+def unchanged_since(source: Path, snapshot: Path) -> bool:
+    """Returns True if snapshot is a snapshot of subvolume source and source has not been modified since the snapshot was taken.
+    A snapshot's generation is the transaction it was created in, every later modification of source raises source's generation beyond it."""
+    src_info = btrfsutil.subvolume_info(source)
+    snap_info = btrfsutil.subvolume_info(snapshot)
+    if snap_info.parent_uuid != src_info.uuid:
+        return False
+    return src_info.generation <= snap_info.generation
+
+
+def common_snapshots(a, b, a_info=btrfsutil.subvolume_info, b_info=btrfsutil.subvolume_info, by_name=True):
+    """Generator that yields all common snapshots of snapshot dicts a and b, where a holds the source snapshots
+    and b the received snapshots. Every common snapshot is yielded as a tuple (snapshot a, snapshot b),
+    ordered by the reverse sorted keys of a.
+    A snapshot of b is a copy of a snapshot of a if its received UUID equals the UUID of the snapshot in a,
+    no matter what both are named. Only if a snapshot in b with the same key carries no received UUID,
+    both are considered common by their names alone, unless by_name is False.
+    The received UUIDs of all snapshots in b are read before the first common snapshot is yielded.
+    a_info and b_info return the metadata of a snapshot of a or b, they default to btrfsutil.subvolume_info."""
     if a is None or b is None:
-        return None
+        return
+    received = dict()  # maps received UUIDs to snapshots of b
+    unproven = set()  # keys of b whose snapshots carry no received UUID
+    for k, p in b.items():
+        received_uuid = b_info(p).received_uuid
+        if received_uuid == NULL_UUID:
+            unproven.add(k)
+        else:
+            received[received_uuid] = p
     keys = list(a.keys())
     keys.sort(reverse=True)
     for key in keys:
-        if key in b:
-            return (a[key], b[key])
-    return None
+        if len(received) > 0:
+            match = received.get(a_info(a[key]).uuid)
+            if match is not None:
+                yield (a[key], match)
+                continue
+        if by_name and key in unproven:
+            logger.debug('Snapshot "%s" has no received UUID, matching "%s" by name',
+                         b[key], a[key])
+            yield (a[key], b[key])
+
+
+def biggest_common_snapshot(a, b):
+    """Returns the biggest common snapshot of snapshot dicts a and b, see common_snapshots().
+    If such a snapshot is found, a tuple with 2 elements (snapshot a and snapshot b) will be returned.
+    If no common snapshot is found, None will be returned."""
+    return next(common_snapshots(a, b), None)
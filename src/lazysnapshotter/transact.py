@@ -55,7 +55,10 @@ class Transact:
     backup_dir: Path
     source: Path
     _state = State.UNPREPARED
-    _snapshots = dict()  # track created snapshots for rollback
+    _snapshots = None  # track created snapshots for rollback
+
+    def __post_init__(self):
+        self._snapshots = dict()
 
     def _src_prelim_snapshot(self):
         return self.snapshot_dir.joinpath(str(self.id))
@@ -96,9 +99,10 @@ class Transact:
         self._state = State.PRELIM_SNAPSHOT
 
     def send(self, parent: Path, send_func):
+        """Transfer the preliminary snapshot by send_func and return send_func's result"""
         self._must_state(State.PRELIM_SNAPSHOT)
         try:
-            send_func(self._src_prelim_snapshot(), self.backup_dir, parent)
+            res = send_func(self._src_prelim_snapshot(), self.backup_dir, parent)
         except Exception as e:
             raise e
         finally:
@@ -110,6 +114,7 @@ class Transact:
                 raise TransactionError(
                     'Preliminary snapshot wasn\'t created on the backup drive')
         self._state = State.SENT
+        return res
 
     def rename(self, name: str):
         def rename_snapshot(key: str, src, dst):
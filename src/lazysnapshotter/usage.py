@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Query disk usage of btrfs subvolumes"""
+
+import logging
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+import btrfsutil
+
+logger = logging.getLogger(__name__)
+
+_qgroup_line = re.compile(r'^0/(\d+)\s+(\d+)\s+(\d+)')
+_size_units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(value: str) -> int:
+    """Convert a size like "500G" to bytes, see verify.size() for valid values"""
+    unit = _size_units.get(value[-1:].upper())
+    if unit is None:
+        return int(value)
+    return int(value[:-1]) * unit
+
+
+def qgroup_usage(path: Path) -> dict:
+    """Return the usage of all subvolumes of the file system containing path as a dictionary
+    that maps subvolume IDs to tuples (referenced bytes, exclusive bytes).
+    Returns None if quotas are not enabled on the file system."""
+    command = [shutil.which('btrfs'), 'qgroup', 'show', '--raw', str(path)]
+    res = subprocess.run(command, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    if res.returncode != 0:
+        logger.debug('Could not read qgroups of "%s": %s',
+                     path, bytes.decode(res.stderr).strip())
+        return None
+    ret = dict()
+    for line in bytes.decode(res.stdout).splitlines():
+        m = _qgroup_line.match(line)
+        if m is not None:
+            ret[int(m.group(1))] = (int(m.group(2)), int(m.group(3)))
+    return ret
+
+
+def referenced(path: Path, usage: dict = None) -> int:
+    """Return the referenced bytes of subvolume path or None if they are unknown.
+    usage can be passed to avoid another qgroup query, see qgroup_usage()."""
+    if usage is None:
+        usage = qgroup_usage(path)
+        if usage is None:
+            return None
+    entry = usage.get(btrfsutil.subvolume_id(path))
+    if entry is None:
+        return None
+    return entry[0]
+
+
+def estimate_stream_size(src: Path, parent: Path = None) -> int:
+    """Estimate the size of the send stream of subvolume src in bytes or return None if no estimate is possible.
+    A full stream is estimated by the referenced bytes of src, an incremental stream by the
+    growth of the referenced bytes since parent, which underestimates data that was rewritten in place."""
+    usage = qgroup_usage(src)
+    if usage is None:
+        return None
+    size = referenced(src, usage)
+    if size is None or parent is None:
+        return size
+    parent_size = referenced(parent, usage)
+    if parent_size is None:
+        return None
+    return max(size - parent_size, 0)
@@ -17,10 +17,12 @@
 
 
 import re
+from datetime import datetime
 from pathlib import Path
 from uuid import UUID
 
-from .globalstuff import max_snapshots
+from . import cron
+from .globalstuff import max_jobs, max_snapshots
 
 _regexes = dict()
 _regexes['backup_id'] = re.compile('^(\w|\d)(\w|\d|-)*$')
@@ -29,8 +31,14 @@ _regexes['uuid'] = re.compile(
 _regexes['isodate'] = re.compile(
     '^(000[1-9]|00[1-9][0-9]|0[1-9][0-9]{2}|[1-9][0-9]{3})-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])$')
 _regexes['snapshot_revision'] = re.compile('^[1-9][0-9]*$')
+_regexes['mount_options'] = re.compile('^[^\\s,]+(,[^\\s,]+)*$')
+_regexes['size'] = re.compile('^[1-9][0-9]*[KMGT]?$', re.IGNORECASE)
 
 LOGLEVELS = ('CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG')
+YES_NO = ('yes', 'no')
+SEND_PROTOCOLS = (1, 2)
+NAME_FORMATS = ('date', 'time')
+CRYPT_FLAGS = ('allow_discards', 'no_read_workqueue', 'no_write_workqueue', 'submit_from_crypt_cpus')
 
 
 def backup_id(backup_id: str):
@@ -60,6 +68,92 @@ def snapshot_count(c: int):
     return 0 < c <= max_snapshots
 
 
+def job_count(c: int):
+    if not isinstance(c, int):
+        raise TypeError('{}: arg 1 must be of int'.format(
+            job_count.__name__))
+    return 0 < c <= max_jobs
+
+
+def pipe_size(size: int):
+    if not isinstance(size, int):
+        raise TypeError('{}: arg 1 must be of int'.format(
+            pipe_size.__name__))
+    return 4096 <= size <= 2**31 - 1
+
+
+def progress_interval(seconds: int):
+    if not isinstance(seconds, int):
+        raise TypeError('{}: arg 1 must be of int'.format(
+            progress_interval.__name__))
+    return 0 <= seconds <= 86400
+
+
+def keep_warm(seconds: int):
+    if not isinstance(seconds, int):
+        raise TypeError('{}: arg 1 must be of int'.format(
+            keep_warm.__name__))
+    return 0 <= seconds <= 86400
+
+
+def volume_key_ttl(seconds: int):
+    if not isinstance(seconds, int):
+        raise TypeError('{}: arg 1 must be of int'.format(
+            volume_key_ttl.__name__))
+    return 0 <= seconds <= 86400
+
+
+def clone_source_count(c: int):
+    if not isinstance(c, int):
+        raise TypeError('{}: arg 1 must be of int'.format(
+            clone_source_count.__name__))
+    return 0 <= c <= max_snapshots
+
+
+def keep_count(c: int):
+    if not isinstance(c, int):
+        raise TypeError('{}: arg 1 must be of int'.format(
+            keep_count.__name__))
+    return 0 <= c <= max_snapshots
+
+
+def send_protocol(version: int):
+    if not isinstance(version, int):
+        raise TypeError('{}: arg 1 must be of int'.format(
+            send_protocol.__name__))
+    return version in SEND_PROTOCOLS
+
+
+def yes_no(value: str):
+    return value.lower() in YES_NO
+
+
+def mount_options(value: str):
+    return _regexes['mount_options'].fullmatch(value) is not None
+
+
+def crypt_flags(value: str):
+    flags = value.split(',')
+    return len(set(flags)) == len(flags) and all(f in CRYPT_FLAGS for f in flags)
+
+
+def schedule(value: str):
+    """Schedules that never match, e.g. on February 30th, are invalid as well"""
+    try:
+        cron.Schedule(value).next(datetime.now())
+    except cron.ScheduleError:
+        return False
+    return True
+
+
+def size(value: str):
+    return _regexes['size'].fullmatch(value) is not None
+
+
+def name_format(value: str):
+    return value.lower() in NAME_FORMATS
+
+
 def requireAbsolutePath(path, errmsg=None):
     if not isinstance(path, Path):
         raise TypeError('arg 1 must be of pathlib.Path')
@@ -101,6 +195,14 @@ def requireRightAmountOfSnapshots(snapshots: int):
             '{} is an invalid amount of snapshots!'.format(snapshots))
 
 
+def requireRightAmountOfJobs(jobs: int):
+    if not isinstance(jobs, int):
+        raise TypeError('arg 1 must be of int')
+    if not job_count(jobs):
+        raise VerificationError(
+            '{} is an invalid amount of parallel jobs!'.format(jobs))
+
+
 class VerificationError(Exception):
     """Thrown if a require* function cannot verify its condition."""
     pass
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Measure loading and selecting snapshot names.
+Run via 'python -m tests.bench_bnames [NAMES]' in the project's root folder."""
+
+import random
+import sys
+import time
+
+from lazysnapshotter import bnames
+
+
+def names(count: int) -> list:
+    """Return count distinct snapshot names in directory order"""
+    res = list()
+    for i in range(count):
+        n = i // 3
+        res.append(str(bnames.BName(2000 + n // 336, 1 + n // 28 % 12, 1 + n % 28, 1 + i % 3)))
+        if i % 10 == 0:
+            res.append(f'notasnapshot{i}')
+    return res
+
+
+def measure(name: str, func, rounds: int = 5):
+    best = None
+    for r in range(rounds):
+        start = time.perf_counter()
+        func()
+        t = (time.perf_counter() - start) * 1000
+        if best is None or t < best:
+            best = t
+    print('{:30s} {:10.2f} ms'.format(name, best))
+
+
+def main():
+    count = 100000
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    listing = names(count)
+    keys = list(bnames.match_all(listing).values())
+    random.shuffle(keys)
+    print(f'{count} snapshot names')
+    measure('filter + parse per name', lambda: [bnames.parse(n) for n in listing if bnames.filter(n)])
+    measure('match per name', lambda: [k for k in map(bnames.match, listing) if k is not None])
+    measure('match_all', lambda: bnames.match_all(listing))
+    measure('sort', lambda: sorted(keys, reverse=True))
+    measure('newest', lambda: bnames.newest(keys))
+    measure('top 10', lambda: bnames.top(keys, 10))
+
+
+if __name__ == '__main__':
+    main()
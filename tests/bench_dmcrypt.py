@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Compare the receive throughput of an encrypted backup drive with and without dm-crypt flags.
+Run via 'python -m tests.bench_dmcrypt SNAPSHOT [DIR]' as root in the project's root folder.
+SNAPSHOT is a read-only btrfs snapshot whose send stream is received, DIR holds the stream
+and the image of the backup drive and defaults to the temporary directory. Use a directory
+on the kind of drive you want to measure, a loop device on tmpfs only shows the CPU overhead."""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from lazysnapshotter import mounts
+
+CONFIGURATIONS = (('no flags', ()),
+                  ('no workqueues', ('no_read_workqueue', 'no_write_workqueue')),
+                  ('no workqueues, discards', ('allow_discards', 'no_read_workqueue', 'no_write_workqueue')),
+                  ('submit from crypt cpus', ('submit_from_crypt_cpus',)))
+
+
+def run(*cmd):
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+
+def setup(d: Path, size: int) -> tuple:
+    """Create a LUKS2 formatted loop device of size bytes inside d, return the loop device and the key file"""
+    image = d.joinpath('image')
+    with open(image, 'wb') as f:
+        f.truncate(size)
+    keyfile = d.joinpath('key')
+    keyfile.write_bytes(os.urandom(64))
+    loop = subprocess.run(['losetup', '--find', '--show', str(image)], check=True,
+                          stdout=subprocess.PIPE, text=True).stdout.strip()
+    # a cheap key derivation, only the throughput of the opened device is of interest
+    run('cryptsetup', 'luksFormat', '--batch-mode', '--type', 'luks2', '--pbkdf', 'pbkdf2',
+        '--pbkdf-force-iterations', '1000', '--key-file', str(keyfile), loop)
+    return Path(loop), keyfile
+
+
+def measure(loop: Path, keyfile: Path, stream: Path, mnt: Path, flags: tuple) -> float:
+    """Receive stream on a fresh file system and return the elapsed seconds including the final sync"""
+    dev = mounts.Device(loop)
+    dev.luksOpen('bench_dmcrypt', keyfile, flags)
+    try:
+        run('mkfs.btrfs', '--force', str(dev._crypt_point))
+        dev.mount(mnt)
+        start = time.perf_counter()
+        run('btrfs', 'receive', '-f', str(stream), str(mnt))
+        run('btrfs', 'filesystem', 'sync', str(mnt))
+        return time.perf_counter() - start
+    finally:
+        dev.disarm()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('usage: python -m tests.bench_dmcrypt SNAPSHOT [DIR]')
+        sys.exit(1)
+    snapshot = Path(sys.argv[1])
+    p = Path(tempfile.gettempdir())
+    if len(sys.argv) > 2:
+        p = Path(sys.argv[2])
+    d = Path(tempfile.mkdtemp(prefix='bench_dmcrypt.', dir=p))
+    loop = None
+    try:
+        stream = d.joinpath('stream')
+        run('btrfs', 'send', '-f', str(stream), str(snapshot))
+        size = stream.stat().st_size
+        loop, keyfile = setup(d, max(2 * size, 1 << 30))
+        mnt = d.joinpath('mnt')
+        mnt.mkdir()
+        for name, flags in CONFIGURATIONS:
+            t = measure(loop, keyfile, stream, mnt, flags)
+            print('{:30s} {:10.2f} s {:10.1f} MiB/s'.format(name, t, size / t / 2**20))
+    finally:
+        if loop is not None:
+            run('losetup', '--detach', str(loop))
+        shutil.rmtree(d)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Compare the throughput of a direct pipe with the splice relay.
+Run via 'python -m tests.bench_relay [MiB]' in the project's root folder."""
+
+import sys
+import time
+
+from lazysnapshotter import diff, relay
+
+
+def producer(mib: int) -> list:
+    return ['dd', 'if=/dev/zero', 'bs=1M', f'count={mib}', 'status=none']
+
+
+def consumer() -> list:
+    return ['dd', 'of=/dev/null', 'bs=1M', 'status=none']
+
+
+def measure(mib: int, use_relay: bool, pipe_size: int) -> float:
+    """Return the throughput of a pipeline in MiB/s"""
+    start = time.monotonic()
+    diff.pipeline(producer(mib), consumer(), use_relay, pipe_size)
+    return mib / (time.monotonic() - start)
+
+
+def main():
+    mib = 4096
+    if len(sys.argv) > 1:
+        mib = int(sys.argv[1])
+    setups = [('direct pipe, default buffer', False, None),
+              ('direct pipe, 1 MiB buffer', False, 1048576)]
+    if relay.available():
+        setups.append(('splice relay, default buffer', True, None))
+        setups.append(('splice relay, 1 MiB buffer', True, 1048576))
+    else:
+        print('splice() is not available, skipping relay benchmarks')
+    for name, use_relay, pipe_size in setups:
+        print('{:30s} {:10.1f} MiB/s'.format(
+            name, measure(mib, use_relay, pipe_size)))
+
+
+if __name__ == '__main__':
+    main()
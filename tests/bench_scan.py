@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+"""Compare the legacy snapshot scan with snapshotkit2.scan_snapshots().
+Run via 'python -m tests.bench_scan [DIR] [ENTRIES]' in the project's root folder.
+DIR defaults to a temporary directory, if it is on btrfs, a tenth of the entries are created as snapshots."""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import btrfsutil
+from lazysnapshotter import bnames, snapshotkit2
+
+
+def populate(p: Path, entries: int) -> Path:
+    """Fill a new directory inside p with entries directory entries and return it"""
+    d = Path(tempfile.mkdtemp(prefix='bench_scan.', dir=p))
+    btrfs = snapshotkit2._on_btrfs(d)
+    for i in range(entries):
+        if i % 10 == 0:
+            n = i // 10
+            name = str(bnames.BName(2000 + n // 336, 1 + n // 28 % 12, 1 + n % 28, 1))
+            if btrfs:
+                btrfsutil.create_subvolume(d.joinpath(name))
+            else:
+                os.mkdir(d.joinpath(name))
+        elif i % 2 == 0:
+            os.mkdir(d.joinpath(f'dir{i}'))
+        else:
+            d.joinpath(f'file{i}').touch()
+    return d
+
+
+def remove(d: Path):
+    for e in d.iterdir():
+        if e.is_dir() and btrfsutil.is_subvolume(e):
+            btrfsutil.delete_subvolume(e)
+    shutil.rmtree(d)
+
+
+def legacy(d: Path) -> dict:
+    return snapshotkit2.snapshot_dict(snapshotkit2.scan_dir(d, bnames.filter), bnames.parse_path)
+
+
+def fast(d: Path) -> dict:
+    return snapshotkit2.scan_snapshots(d, bnames.match)
+
+
+def measure(func, d: Path, rounds: int = 5) -> float:
+    """Return the best time of rounds scans in milliseconds"""
+    best = None
+    for r in range(rounds):
+        start = time.perf_counter()
+        func(d)
+        t = (time.perf_counter() - start) * 1000
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main():
+    p = Path(tempfile.gettempdir())
+    entries = 10000
+    if len(sys.argv) > 1:
+        p = Path(sys.argv[1])
+    if len(sys.argv) > 2:
+        entries = int(sys.argv[2])
+    d = populate(p, entries)
+    try:
+        if not snapshotkit2._on_btrfs(d):
+            print(f'"{p}" is not on btrfs, no snapshots will be found')
+        for name, func in (('scan_dir + snapshot_dict', legacy), ('scan_snapshots', fast)):
+            res = func(d)
+            found = 0 if res is None else len(res)
+            print('{:30s} {:10.2f} ms {:8d} snapshots'.format(
+                name, measure(func, d), found))
+    finally:
+        remove(d)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import asyncio
+import time
+import unittest
+
+from lazysnapshotter import aioexec
+
+
+class TestAioexec(unittest.TestCase):
+    def test_run(self):
+        res = asyncio.run(aioexec.run(['sh', '-c', 'echo out; echo err >&2; exit 3'],
+                                      stdout=aioexec.PIPE, stderr=aioexec.PIPE, text=True))
+        self.assertEqual((res.returncode, res.stdout, res.stderr), (3, 'out\n', 'err\n'))
+        self.assertIsNone(asyncio.run(aioexec.run(['true'], stdout=aioexec.DEVNULL)).stdout)
+
+    def test_gather(self):
+        start = time.monotonic()
+        res = asyncio.run(aioexec.gather(*(aioexec.run(['sleep', '0.3']) for i in range(4))))
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual([r.returncode for r in res], [0, 0, 0, 0])
+
+    def test_cancel(self):
+        async def failing():
+            await asyncio.sleep(0.1)
+            raise ValueError
+
+        async def main():
+            sleeper = aioexec.run(['sleep', '10'])
+            await aioexec.gather(sleeper, failing())
+
+        start = time.monotonic()
+        with self.assertRaises(ValueError):
+            asyncio.run(main())
+        self.assertLess(time.monotonic() - start, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from lazysnapshotter import backup, bnames, diff
+from lazysnapshotter.catalog import Catalog
+
+GIB = 1024 * 1024 * 1024
+
+
+class TestCheckFreeSpace(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = Catalog(Path(self.tmp.name).joinpath('src'))
+        self.dst = Catalog(Path(self.tmp.name).joinpath('dst'))
+        self.newest = bnames.parse('2020-06-13.2')
+        for n in ('2020-06-13.1', '2020-06-13.2'):
+            self.src.snapshots[bnames.parse(n)] = self.src.directory.joinpath(n)
+            self.dst.snapshots[bnames.parse(n)] = self.dst.directory.joinpath(n)
+        self.dst.sizes[bnames.parse('2020-06-13.1')] = 10 * GIB
+        self.dst.sizes[self.newest] = GIB
+        self.entry = backup.Entry('test')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check(self, parent, free: int) -> list:
+        common = None
+        if parent is not None:
+            common = (self.src.directory.joinpath(parent), self.dst.directory.joinpath(parent))
+        with patch.object(backup, '_newest_common', return_value=((), (), common)), \
+                patch.object(backup.usage, 'estimate_stream_size', return_value=None), \
+                patch.object(backup, 'free_space', return_value=free), \
+                patch.object(backup, 'purge_old_snapshots', return_value=list()):
+            return backup.check_free_space(self.entry, self.src, self.dst)
+
+    def test_incremental_estimate(self):
+        self.dst.incremental.add(self.newest)
+        self.assertEqual(self.check('2020-06-13.2', 2 * GIB), [])
+        with self.assertRaises(backup.NoSpace):
+            self.check('2020-06-13.2', GIB // 2)
+
+    def test_direct_pipe_estimate(self):
+        # the relay is off by default, the stream size must be recorded from the direct pipe
+        size = 4 * 1048576
+        transferred = diff.pipeline(['dd', 'if=/dev/zero', 'bs=1M', 'count=4', 'status=none'],
+                                    ['dd', 'of=/dev/null', 'bs=1M', 'status=none'], use_relay=False)
+        backup.record_stream(self.dst, self.newest, transferred, True)
+        self.assertEqual(self.check('2020-06-13.2', 2 * size), [])
+        with self.assertRaises(backup.NoSpace):
+            self.check('2020-06-13.2', size // 2)
+
+    def test_full_stream_is_no_estimate(self):
+        self.dst.sizes[self.newest] = 10 * GIB
+        self.assertEqual(self.check('2020-06-13.2', GIB), [])
+
+    def test_no_parent(self):
+        self.dst.incremental.add(self.newest)
+        self.assertEqual(self.check(None, 0), [])
+
+
+class TestCreateName(unittest.TestCase):
+    def create(self, existing, timed: bool) -> str:
+        src = Catalog(Path('/nonexistent/src'))
+        dst = Catalog(Path('/nonexistent/dst'))
+        for n in existing:
+            src.snapshots[bnames.parse(n)] = src.directory.joinpath(n)
+            dst.snapshots[bnames.parse(n)] = dst.directory.joinpath(n)
+        with patch.object(backup, 'datetime') as dt:
+            dt.today.return_value = datetime(2020, 6, 13, 14, 30, 0)
+            return backup._create_name(src, dst, timed)
+
+    def test_date(self):
+        self.assertEqual(self.create([], False), '2020-06-13.1')
+        self.assertEqual(self.create(['2020-06-13.1'], False), '2020-06-13.2')
+
+    def test_timed(self):
+        self.assertEqual(self.create(['2020-06-13.2'], True), '2020-06-13T143000.1')
+        self.assertEqual(self.create(['2020-06-13T143000.1'], True), '2020-06-13T143000.2')
+
+    def test_back_to_date(self):
+        # after switching the name format back to dates, the new snapshot must still be the newest
+        name = self.create(['2020-06-13T120000.1'], False)
+        self.assertGreater(bnames.parse(name), bnames.parse('2020-06-13T120000.1'))
@@ -16,6 +16,7 @@
 # along with this program.  If not, see https://www.gnu.org/licenses.
 
 import unittest
+from datetime import datetime
 from lazysnapshotter import bnames
 
 
@@ -57,3 +58,59 @@ class TestBName(unittest.TestCase):
                             y, m, d, i)
                         n = bnames.parse(str_repr)
                         self.assertEqual(str(n), str_repr)
+
+    def test_match(self):
+        malformed = ['10000-01-01.1', '1956-02-13.0', '42', '666-04-23.1', '2001-01-96.23',
+                     '0000-00-00.1', '1999-13-01.2', '1999-12-32.2', '2020-06-13.1 ', '2020-06-13.01']
+        for x in malformed:
+            self.assertIsNone(bnames.match(x))
+        for x in ('0001-01-01.1', '2020-06-13.6', '9999-12-31.1000'):
+            self.assertEqual(bnames.match(x), bnames.parse(x))
+
+    def test_match_all(self):
+        names = ['2020-06-13.6', 'test', '2020-06-13.06', '1999-12-31.1', '2020-06-13.6x',
+                 'x2020-06-13.6', '', '2021-01-01.10', '2021-01-01.99999999999', '2021-01-01.99999999999999999999']
+        with self.assertLogs(bnames.logger, 'WARNING'):
+            d = bnames.match_all(names)
+        self.assertEqual(list(d), ['2020-06-13.6', '1999-12-31.1', '2021-01-01.10', '2021-01-01.99999999999'])
+        for k, v in d.items():
+            self.assertEqual(v, bnames.parse(k))
+
+    def test_top(self):
+        names = [bnames.parse(x) for x in ('2020-06-13.6', '2020-06-13.10', '2019-12-31.99',
+                                           '2020-06-14.1', '2020-01-01.1')]
+        self.assertEqual([str(x) for x in bnames.top(names, 3)],
+                         ['2020-06-14.1', '2020-06-13.10', '2020-06-13.6'])
+        self.assertEqual(bnames.newest(names), bnames.parse('2020-06-14.1'))
+        self.assertIsNone(bnames.newest([]))
+
+    def test_index(self):
+        n = bnames.BName(2020, 6, 13, 6)
+        n.index += 1
+        self.assertEqual(n, bnames.parse('2020-06-13.7'))
+        self.assertEqual((n.year, n.month, n.day, n.index), (2020, 6, 13, 7))
+        with self.assertRaises(TypeError):
+            n == '2020-06-13.7'
+
+    def test_timed(self):
+        for x in ('2020-06-13T000000.1', '2020-06-13T235959.12', '2020-06-13T081502.1'):
+            n = bnames.parse(x)
+            self.assertEqual(str(n), x)
+            self.assertEqual(n, bnames.match(x))
+            self.assertEqual(n, bnames.match_all([x])[x])
+        for x in ('2020-06-13T240000.1', '2020-06-13T086000.1', '2020-06-13T0815.1', '2020-06-13T.1'):
+            self.assertIsNone(bnames.match(x))
+            with self.assertRaises(bnames.ParseError):
+                bnames.parse(x)
+        # names without a time are older than timed names of the same day
+        ordered = ['2020-06-12T235959.1', '2020-06-13.1', '2020-06-13.2', '2020-06-13T000000.1',
+                   '2020-06-13T000000.2', '2020-06-13T000001.1', '2020-06-14.1']
+        names = [bnames.parse(x) for x in ordered]
+        self.assertEqual(sorted(reversed(names)), names)
+
+    def test_first(self):
+        ts = datetime(2020, 6, 13, 8, 15, 2)
+        self.assertEqual(str(bnames.first(ts)), '2020-06-13.1')
+        self.assertEqual(str(bnames.first(ts, True)), '2020-06-13T081502.1')
+        self.assertEqual(bnames.first(ts, True).slot, bnames.parse('2020-06-13T081502.7').slot)
+        self.assertNotEqual(bnames.first(ts).slot, bnames.first(ts, True).slot)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import unittest
+from datetime import datetime
+
+from lazysnapshotter import cron, verify
+
+
+class TestCron(unittest.TestCase):
+    def test_parse(self):
+        s = cron.Schedule('*/15 8-18/2 1,15 * 1-5')
+        self.assertEqual(s.minutes, {0, 15, 30, 45})
+        self.assertEqual(s.hours, {8, 10, 12, 14, 16, 18})
+        self.assertEqual(s.days, {1, 15})
+        self.assertEqual(s.weekdays, {1, 2, 3, 4, 5})
+        self.assertEqual(cron.Schedule('0 0 * * 7').weekdays, {0})
+        self.assertEqual(cron.Schedule('5/20 * * * *').minutes, {5, 25, 45})
+        for expr in ('* * * *', '60 * * * *', '* * 0 * *', '5-1 * * * *', '*/0 * * * *', 'a * * * *', '@never'):
+            with self.assertRaises(cron.ScheduleError, msg=expr):
+                cron.Schedule(expr)
+
+    def test_next(self):
+        t = datetime(2022, 3, 14, 10, 7, 30)
+        self.assertEqual(cron.Schedule('* * * * *').next(t), datetime(2022, 3, 14, 10, 8))
+        self.assertEqual(cron.Schedule('@hourly').next(t), datetime(2022, 3, 14, 11, 0))
+        self.assertEqual(cron.Schedule('@daily').next(t), datetime(2022, 3, 15, 0, 0))
+        self.assertEqual(cron.Schedule('@weekly').next(t), datetime(2022, 3, 20, 0, 0))
+        self.assertEqual(cron.Schedule('@yearly').next(t), datetime(2023, 1, 1, 0, 0))
+        self.assertEqual(cron.Schedule('30 2 31 * *').next(t), datetime(2022, 3, 31, 2, 30))
+        self.assertEqual(cron.Schedule('0 0 29 2 *').next(t), datetime(2024, 2, 29, 0, 0))
+        # day of month or day of week
+        self.assertEqual(cron.Schedule('0 12 20 * 3').next(t), datetime(2022, 3, 16, 12, 0))
+        self.assertEqual(cron.Schedule('0 12 15 * 0').next(t), datetime(2022, 3, 15, 12, 0))
+        self.assertEqual(cron.Schedule('7 10 * * *').next(datetime(2022, 3, 14, 10, 7)), datetime(2022, 3, 15, 10, 7))
+        with self.assertRaises(cron.ScheduleError):
+            cron.Schedule('0 0 30 2 *').next(t)
+
+    def test_verify(self):
+        self.assertTrue(verify.schedule('0 0 29 2 *'))
+        self.assertFalse(verify.schedule('0 0 30 2 *'))
+        self.assertFalse(verify.schedule('0 0 * 13 *'))
+
+    def test_matches(self):
+        s = cron.Schedule('0 3 * * 0')
+        self.assertTrue(s.matches(datetime(2022, 3, 20, 3, 0)))
+        self.assertFalse(s.matches(datetime(2022, 3, 21, 3, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from lazysnapshotter import daemon
+
+CONFIG = '''[good]
+schedule = 0 3 * * *
+
+[never]
+schedule = 0 0 30 2 *
+'''
+
+
+class TestDaemon(unittest.TestCase):
+    def test_reload_skips_bad_schedule(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp).joinpath('lazysnapshotter.conf')
+            path.write_text(CONFIG)
+            d = daemon.Daemon(path, Path(tmp).joinpath('daemon.sock'))
+            with self.assertLogs(daemon.logger, 'ERROR'):
+                self.assertTrue(d.reload())
+            self.assertEqual(list(d._schedules), ['good'])
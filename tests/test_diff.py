@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import asyncio
+import time
+import unittest
+
+from lazysnapshotter import diff, relay
+
+SIZE = 10 * 1048576
+
+
+def producer() -> list:
+    return ['dd', 'if=/dev/zero', 'bs=1M', 'count={}'.format(SIZE // 1048576), 'status=none']
+
+
+def consumer() -> list:
+    return ['dd', 'of=/dev/null', 'bs=1M', 'status=none']
+
+
+class TestPipeline(unittest.TestCase):
+    def test_direct_pipe(self):
+        transferred = diff.pipeline(producer(), consumer(), use_relay=False)
+        # the consumer's read counter also holds the few bytes it reads on startup
+        self.assertGreaterEqual(transferred, SIZE)
+        self.assertLess(transferred, SIZE + 65536)
+
+    @unittest.skipUnless(relay.available(), 'splice() is not available')
+    def test_relay(self):
+        self.assertEqual(diff.pipeline(producer(), consumer(), use_relay=True), SIZE)
+
+    def test_async(self):
+        transferred = asyncio.run(diff.pipeline_async(producer(), consumer()))
+        self.assertGreaterEqual(transferred, SIZE)
+
+    def test_cancel(self):
+        async def main():
+            await asyncio.wait_for(diff.pipeline_async(['sleep', '10'], consumer()), 0.2)
+
+        start = time.monotonic()
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(main())
+        self.assertLess(time.monotonic() - start, 5)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from lazysnapshotter import hotplug, inotify
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.watcher = hotplug.Watcher(Path(self.tmpdir.name), directory=Path(self.tmpdir.name))
+
+    def tearDown(self):
+        self.watcher._runner.shutdown(wait=True)
+        self.tmpdir.cleanup()
+
+    def test_handle(self):
+        self.assertEqual(self.watcher.handle([(1, inotify.IN_CREATE, 'ABC')]), ['abc'])
+        # udev replaces links of present drives
+        self.assertEqual(self.watcher.handle([(1, inotify.IN_MOVED_TO, 'abc')]), [])
+        self.assertEqual(self.watcher.handle([(1, inotify.IN_DELETE, 'abc')]), [])
+        self.assertEqual(self.watcher.handle([(1, inotify.IN_CREATE, 'abc')]), ['abc'])
+
+    def test_overflow(self):
+        # drives that appeared while events were lost are run after the rescan
+        self.watcher._present = {'gone', 'old'}
+        for name in ('old', 'new'):
+            Path(self.tmpdir.name).joinpath(name).touch()
+        self.assertEqual(self.watcher.handle([(-1, inotify.IN_Q_OVERFLOW, '')]), ['new'])
+        self.assertEqual(self.watcher._present, {'old', 'new'})
+
+    def test_submit(self):
+        release = threading.Event()
+        runs = list()
+
+        def appeared(uuid):
+            runs.append(uuid)
+            release.wait()
+            with self.watcher._lock:
+                self.watcher._running.discard(uuid)
+
+        self.watcher.appeared = appeared
+        self.assertTrue(self.watcher.submit('a'))
+        self.assertTrue(self.watcher.submit('b'))
+        self.assertFalse(self.watcher.submit('a'))
+        release.set()
+        self.watcher._runner.shutdown(wait=True)
+        self.assertEqual(runs, ['a', 'b'])
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import os
+import select
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+from lazysnapshotter import inotify
+
+
+class TestInotify(unittest.TestCase):
+    def test_parse_events(self):
+        buf = struct.pack('iIII', 1, inotify.IN_CREATE, 0, 16) + b'sdb1'.ljust(16, b'\0')
+        buf += struct.pack('iIII', 1, inotify.IN_IGNORED, 0, 0)
+        self.assertEqual(inotify.parse_events(buf),
+                         [(1, inotify.IN_CREATE, 'sdb1'), (1, inotify.IN_IGNORED, '')])
+
+    def test_watch(self):
+        with tempfile.TemporaryDirectory() as tmp, inotify.Inotify() as ino:
+            wd = ino.add_watch(tmp, inotify.IN_CREATE | inotify.IN_MOVED_TO | inotify.IN_DELETE)
+            self.assertEqual(ino.read(), [])
+            os.symlink('/dev/null', Path(tmp, 'a'))
+            os.symlink('/dev/null', Path(tmp, 'b.tmp'))
+            os.rename(Path(tmp, 'b.tmp'), Path(tmp, 'b'))
+            os.unlink(Path(tmp, 'a'))
+            select.select([ino], [], [], 1)
+            self.assertEqual(ino.read(), [(wd, inotify.IN_CREATE, 'a'), (wd, inotify.IN_CREATE, 'b.tmp'),
+                                          (wd, inotify.IN_MOVED_TO, 'b'), (wd, inotify.IN_DELETE, 'a')])
+            with self.assertRaises(inotify.InotifyError):
+                ino.add_watch(Path(tmp, 'nonexistent'), inotify.IN_CREATE)
+
+
+if __name__ == '__main__':
+    unittest.main()
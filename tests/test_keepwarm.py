@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from lazysnapshotter import keepwarm
+
+
+class TestKeepWarm(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.lease = keepwarm.Lease(Path(self.tmpdir.name), 'warm-test')
+
+    def tearDown(self):
+        self.lease.unlock()
+        self.tmpdir.cleanup()
+
+    def test_lease_name(self):
+        uuid = '0B6BD1C5-9B8E-4B7A-A3E4-5A9C1D2F3E4D'
+        self.assertEqual(keepwarm.lease_name(uuid.lower()), 'warm-' + uuid.lower())
+        self.assertEqual(keepwarm.lease_name(Path('/dev/sdb1')), keepwarm.lease_name('/dev/../dev/sdb1'))
+        self.assertNotEqual(keepwarm.lease_name(Path('/dev/sdb1')), keepwarm.lease_name(Path('/dev/sdc1')))
+
+    def test_extend(self):
+        self.assertIsNone(self.lease.read())
+        with self.lease.exclusive():
+            self.lease.extend(Path('/dev/sdb1'), Path('/run/mnt'), True, 60)
+        state = self.lease.read()
+        self.assertEqual(state['volume'], '/dev/sdb1')
+        self.assertEqual(state['mount_point'], '/run/mnt')
+        self.assertTrue(state['armed'])
+        self.lease.remove()
+        self.assertIsNone(self.lease.read())
+
+    def test_watchdog(self):
+        # a lease of a drive that was not armed by lazysnapshotter is removed without touching the drive
+        self.lease.extend('/dev/nonexistent', Path('/run/mnt'), False, 0)
+        keepwarm.watchdog(self.lease)
+        self.assertIsNone(self.lease.read())
+        keepwarm.watchdog(self.lease)
+
+    def test_watchdog_renewed(self):
+        # a lease renewed while the watchdog still holds its lock is watched again
+        expire = keepwarm._expire
+        calls = list()
+
+        def renew(lease):
+            calls.append(lease)
+            if len(calls) == 1:
+                lease.remove()
+                lease.extend('/dev/nonexistent', Path('/run/mnt'), False, 0)
+                return True
+            return expire(lease)
+
+        self.lease.extend('/dev/nonexistent', Path('/run/mnt'), False, 0)
+        with patch.object(keepwarm, '_expire', renew):
+            keepwarm.watchdog(self.lease)
+        self.assertEqual(len(calls), 2)
+        self.assertIsNone(self.lease.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
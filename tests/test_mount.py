@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import unittest
+
+from lazysnapshotter import mount
+
+
+class TestMount(unittest.TestCase):
+
+    def test_parse_options(self):
+        self.assertEqual(mount.parse_options(None), (0, None))
+        self.assertEqual(mount.parse_options('defaults'), (0, None))
+        self.assertEqual(mount.parse_options('noatime,compress=zstd:3,commit=120,discard=async'),
+                         (mount.MS_NOATIME, 'compress=zstd:3,commit=120,discard=async'))
+        self.assertEqual(mount.parse_options('ro,nodev,rw'), (mount.MS_NODEV, None))
+        self.assertEqual(mount.parse_options('relatime,noatime'), (mount.MS_NOATIME, None))
+        self.assertEqual(mount.parse_options('nosuid,,ssd'), (mount.MS_NOSUID, 'ssd'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,7 @@
 import os.path
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 import libmount
 
@@ -44,3 +45,25 @@ class TestMounts(unittest.TestCase):
         mtab = libmount.Table().parse_mtab()
         rootfs = mtab.find_target('/')
         self.assertEqual(str(mounts.getMountpoint(rootfs.source)), '/')
+
+    def test_parseCryptStatus(self):
+        status = '''/dev/mapper/backup is active and is in use.
+  type:    LUKS2
+  cipher:  aes-xts-plain64
+  keysize: 512 bits
+  key location: keyring
+  device:  /dev/sdb1
+  sector size:  4096
+  offset:  32768 sectors
+  size:    1953492992 sectors
+  mode:    read/write
+  flags:   discards no_read_workqueue no_write_workqueue
+'''
+        self.assertEqual(mounts.parseCryptStatus(status),
+                         {'allow_discards', 'no_read_workqueue', 'no_write_workqueue'})
+        self.assertEqual(mounts.parseCryptStatus('/dev/mapper/backup is inactive.\n'), frozenset())
+
+    def test_missing_cryptsetup(self):
+        with patch.object(mounts.shutil, 'which', return_value=None):
+            with self.assertRaises(mounts.CryptsetupNotFound):
+                mounts.getCryptFlags('/dev/mapper/backup')
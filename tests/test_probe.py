@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from lazysnapshotter import probe
+
+MOUNTINFO = '''22 1 8:2 / / rw,relatime shared:1 - ext4 /dev/sda2 rw
+23 22 0:22 / /proc rw,relatime shared:5 - proc proc rw
+40 22 0:35 /data /mnt/data rw,relatime shared:20 - btrfs /dev/sdb1 rw,space_cache=v2,subvolid=256,subvol=/data
+41 22 0:35 / /mnt/backup\\040drive rw,relatime - btrfs /dev/sdb1 rw,space_cache=v2,subvolid=5,subvol=/
+'''
+
+
+class TestProbe(unittest.TestCase):
+    def test_parse_mountinfo(self):
+        mounts = probe.parse_mountinfo(MOUNTINFO)
+        self.assertNotIn('proc', mounts)
+        self.assertEqual(mounts[os.path.realpath('/dev/sda2')], [(Path('/'), '/')])
+        self.assertEqual(mounts[os.path.realpath('/dev/sdb1')],
+                         [(Path('/mnt/data'), '/data'), (Path('/mnt/backup drive'), '/')])
+
+    def test_is_luks(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(probe.LUKS_MAGIC + bytes(512))
+            f.flush()
+            self.assertTrue(probe.is_luks(Path(f.name)))
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(bytes(512))
+            f.flush()
+            self.assertFalse(probe.is_luks(Path(f.name)))
+
+    def test_luks_uuid(self):
+        uuid = '0b6bd1c5-9b8e-4b7a-a3e4-5a9c1d2f3e4d'
+        with tempfile.NamedTemporaryFile() as f:
+            header = bytearray(probe.LUKS_MAGIC + bytes(4096))
+            header[probe.LUKS_UUID_OFFSET:probe.LUKS_UUID_OFFSET + len(uuid)] = uuid.encode()
+            f.write(header)
+            f.flush()
+            self.assertEqual(probe.luks_uuid(Path(f.name)), uuid)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(bytes(4096))
+            f.flush()
+            self.assertIsNone(probe.luks_uuid(Path(f.name)))
+
+    def test_crypt_mappings(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            block = Path(tmp).joinpath('block')
+
+            def make_dm(dev, uuid, name, slaves):
+                dm = block.joinpath(dev)
+                dm.joinpath('dm').mkdir(parents=True)
+                dm.joinpath('slaves').mkdir()
+                dm.joinpath('dm', 'uuid').write_text(uuid + '\n')
+                dm.joinpath('dm', 'name').write_text(name + '\n')
+                for s in slaves:
+                    dm.joinpath('slaves', s).mkdir()
+            make_dm('dm-0', 'CRYPT-LUKS2-0123456789abcdef-backup', 'backup', ['sdb1'])
+            make_dm('dm-1', 'LVM-abcdef', 'vg-root', ['sda2'])
+            block.joinpath('sda').mkdir()
+            self.assertEqual(probe.crypt_mappings(Path(tmp)),
+                             {'sdb1': Path('/dev/mapper/backup')})
+        self.assertEqual(probe.crypt_mappings(Path('/nonexistent')), dict())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import unittest
+from lazysnapshotter import bnames, retention
+
+
+def names(*args) -> list:
+    return [bnames.parse(x) for x in args]
+
+
+class TestRetention(unittest.TestCase):
+    def test_last(self):
+        n = names('2020-01-01.1', '2020-01-02.1', '2020-01-02.2', '2020-01-03.1')
+        keep = retention.select(n, retention.Policy(last=2))
+        self.assertEqual(keep, set(names('2020-01-02.2', '2020-01-03.1')))
+
+    def test_daily(self):
+        n = names('2020-01-01.1', '2020-01-01.2', '2020-01-02.1', '2020-01-02T120000.1',
+                  '2020-01-03.1', '2020-01-05.1')
+        keep = retention.select(n, retention.Policy(last=1, daily=3))
+        self.assertEqual(keep, set(names('2020-01-02T120000.1', '2020-01-03.1', '2020-01-05.1')))
+
+    def test_hourly(self):
+        n = names('2020-01-01T080000.1', '2020-01-01T085959.1', '2020-01-01T090000.1',
+                  '2020-01-01T091500.1', '2020-01-01T101500.1')
+        keep = retention.select(n, retention.Policy(last=1, hourly=2))
+        self.assertEqual(keep, set(names('2020-01-01T091500.1', '2020-01-01T101500.1')))
+
+    def test_weekly_monthly_yearly(self):
+        # 2020-12-28 to 2021-01-03 is ISO week 53 of 2020
+        n = names('2019-06-01.1', '2019-12-31.1', '2020-12-28.1', '2021-01-03.1',
+                  '2021-01-04.1', '2021-02-10.1', '2021-02-11.1')
+        self.assertEqual(retention.select(n, retention.Policy(last=1, weekly=3)),
+                         set(names('2021-01-03.1', '2021-01-04.1', '2021-02-11.1')))
+        self.assertEqual(retention.select(n, retention.Policy(last=1, monthly=3)),
+                         set(names('2020-12-28.1', '2021-01-04.1', '2021-02-11.1')))
+        self.assertEqual(retention.select(n, retention.Policy(last=1, yearly=2)),
+                         set(names('2020-12-28.1', '2021-02-11.1')))
+
+    def test_protect(self):
+        n = names('2020-01-01.1', '2020-01-02.1', '2020-01-03.1')
+        keep = retention.select(n, retention.Policy(last=1), names('2020-01-01.1'))
+        self.assertEqual(keep, set(names('2020-01-01.1', '2020-01-03.1')))
+
+    def test_over_budget(self):
+        sizes = dict(zip(names('2020-01-01.1', '2020-01-02.1', '2020-01-03.1', '2020-01-04.1'), (40, 30, 20, 10)))
+        self.assertEqual(retention.over_budget(sizes, 100), [])
+        self.assertEqual(retention.over_budget(sizes, 60), names('2020-01-01.1'))
+        self.assertEqual(retention.over_budget(sizes, 30), names('2020-01-01.1', '2020-01-02.1'))
+        # the protected name stays even if the budget cannot be met
+        self.assertEqual(retention.over_budget(sizes, 5, names('2020-01-02.1')),
+                         names('2020-01-01.1', '2020-01-03.1', '2020-01-04.1'))
+
+    def test_invalid_date(self):
+        n = names('2020-02-27.1', '2020-02-31.1', '2020-03-02.1')
+        with self.assertLogs(retention.logger, 'WARNING'):
+            keep = retention.select(n, retention.Policy(last=1, weekly=2))
+        self.assertEqual(keep, set(names('2020-02-27.1', '2020-03-02.1')))
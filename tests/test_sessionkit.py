@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# lazysnapshotter - a backup tool using btrfs
+# Copyright (C) 2022 Joerg Walter
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses.
+
+import os
+import subprocess
+import tempfile
+import unittest
+import uuid
+from pathlib import Path
+
+from lazysnapshotter import sessionkit
+
+
+class TestJobRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.registry = sessionkit.JobRegistry(
+            Path(self.tmpdir.name).joinpath('jobs.db'))
+        self.registry.open()
+        self.config = Path('/etc/lazysnapshotter/backups.conf')
+
+    def tearDown(self):
+        self.registry.close()
+        self.tmpdir.cleanup()
+
+    def test_register(self):
+        a, b = uuid.uuid4(), uuid.uuid4()
+        self.registry.register('data', self.config, a)
+        with self.assertRaises(sessionkit.DuplicateJobException):
+            self.registry.register('data', self.config, b)
+        # same name, different config file
+        self.registry.register('data', Path('/tmp/other.conf'), b)
+        rows = self.registry.query({'name': 'data', 'configfile': str(self.config)})
+        self.assertEqual(rows, [['data', str(self.config), os.getpid(), str(a)]])
+        self.registry.release(a)
+        self.assertEqual(self.registry.query({'jobid': str(a)}), [])
+        self.registry.register('data', self.config, a)
+        self.assertEqual(len(self.registry.read()), 2)
+
+    def test_stale(self):
+        p = subprocess.Popen(['true'])
+        p.wait()
+        other = sessionkit.JobRegistry(self.registry.dbfile)
+        other.open()
+        try:
+            other._db.execute('INSERT INTO jobs (jobid, name, configfile, pid, started) VALUES (?, ?, ?, ?, ?)',
+                              (str(uuid.uuid4()), 'data', str(self.config), p.pid, 1))
+            other._db.execute('INSERT INTO jobs (jobid, name, configfile, pid, started) VALUES (?, ?, ?, ?, ?)',
+                              (str(uuid.uuid4()), 'home', str(self.config), p.pid, 1))
+        finally:
+            other.close()
+        # the stale row is replaced on registration
+        job = uuid.uuid4()
+        self.registry.register('data', self.config, job)
+        self.assertEqual(self.registry.query({'name': 'data'})[0][3], str(job))
+        self.assertEqual(self.registry.cleanup(), 1)
+        self.assertEqual(self.registry.query({'name': 'home'}), [])
+        self.assertEqual(self.registry.cleanup(), 0)
@@ -22,7 +22,8 @@ from pathlib import Path
 from os.path import basename
 
 import btrfsutil
-from lazysnapshotter import snapshotkit2
+from lazysnapshotter import bnames, snapshotkit2
+from lazysnapshotter.catalog import SnapshotInfo
 
 from .testlib import dev
 
@@ -92,6 +93,41 @@ class TestSnapshotkit2(unittest.TestCase):
             if dirs is not None:
                 dev.scrap_dirs(dirs)
 
+    def test_scan_snapshots(self):
+        dirs = None
+        mnt_point = None
+        vol = None
+        try:
+            # setup
+            dirs = dev.setup_dirs(Path('/tmp/lazytest/test_scan_snapshots'))
+            mnt_point = dirs[dev.DirKey.MOUNTS].joinpath('test')
+            os.mkdir(mnt_point, mode=0o755)
+            vol = dev.make_volume(dirs, 'test', 125)
+            vol.mount(mnt_point)
+            # tests
+            self.assertIsNone(snapshotkit2.scan_snapshots(
+                mnt_point, bnames.match))  # no subvolumes
+            os.mkdir(mnt_point.joinpath('2020-01-01.1'))
+            mnt_point.joinpath('2020-01-01.2').touch()
+            self.assertIsNone(snapshotkit2.scan_snapshots(
+                mnt_point, bnames.match))  # still no subvolumes
+            make_subvolumes(mnt_point, ['2020-01-02.1', '2020-01-02.2', 'test'])
+            d = snapshotkit2.scan_snapshots(mnt_point, bnames.match)
+            self.assertEqual(len(d), 2)  # two subvolumes with valid names
+            self.assertEqual(d[bnames.BName(2020, 1, 2, 2)],
+                             mnt_point.joinpath('2020-01-02.2'))
+            self.assertEqual(d, snapshotkit2.snapshot_dict(snapshotkit2.scan_dir(
+                mnt_point, bnames.filter), bnames.parse_path))
+        finally:
+            # teardown
+            if vol is not None:
+                time.sleep(2) # mount point might still be busy
+                vol.scrap()
+            if mnt_point is not None:
+                os.rmdir(mnt_point)
+            if dirs is not None:
+                dev.scrap_dirs(dirs)
+
     def test_biggest_common_snapshot(self):
         dirs = None
         m1 = None
@@ -132,3 +168,15 @@ class TestSnapshotkit2(unittest.TestCase):
                 os.rmdir(m1)
             if dirs is not None:
                 dev.scrap_dirs(dirs)
+
+    def test_common_snapshots_by_name(self):
+        a = {1: Path('a/1'), 2: Path('a/2'), 3: Path('a/3')}
+        b = {1: Path('b/1'), 2: Path('b/2'), 3: Path('b/3')}
+        uuids = {p: bytes([k]) * 16 for k, p in a.items()}
+        received = {b[1]: uuids[a[1]], b[2]: snapshotkit2.NULL_UUID, b[3]: uuids[a[3]]}
+        a_info = lambda p: SnapshotInfo(uuids[p], None, None, 0)
+        b_info = lambda p: SnapshotInfo(None, None, received[p], 0)
+        commons = list(snapshotkit2.common_snapshots(a, b, a_info, b_info))
+        self.assertEqual(commons, [(a[3], b[3]), (a[2], b[2]), (a[1], b[1])])
+        commons = list(snapshotkit2.common_snapshots(a, b, a_info, b_info, by_name=False))
+        self.assertEqual(commons, [(a[3], b[3]), (a[1], b[1])])